@@ -14,7 +14,7 @@ __all__ = [
 import logging
 import weakref
 from abc import ABCMeta, abstractmethod
-from copy import deepcopy
+from copy import copy, deepcopy
 from typing import Dict, Type, Optional, Mapping, Any, Iterable, Tuple
 
 from bson import SON
@@ -22,6 +22,7 @@ from pymongo.database import Database, Collection
 import pymongo.errors
 
 import mongoengine_migrate.flags as flags
+from mongoengine_migrate.bulk import BULK_LIMITS
 from mongoengine_migrate.exceptions import ActionError, SchemaError, MigrationError
 from mongoengine_migrate.fields.registry import type_key_registry
 from mongoengine_migrate.graph import MigrationPolicy
@@ -68,17 +69,30 @@ class BaseAction(metaclass=BaseActionMeta):
     #: priority
     priority = 100
 
-    def __init__(self, document_type: str, *, dummy_action: bool = False, **kwargs):
+    def __init__(self,
+                 document_type: str,
+                 *,
+                 dummy_action: bool = False,
+                 bulk_options: Optional[dict] = None,
+                 **kwargs):
         """
         :param document_type: Document type in schema which will
          Action will use to make changes
         :param dummy_action: If True then the action will not
          perform any queries on db during migration, but still used
          for changing the db schema
+        :param bulk_options: Optional bulk write buffer limits which
+         override command line ones during action run: `max_length`,
+         `max_bytes`, `max_delay`. See `BulkWriteBuffer`
         :param kwargs: Action keyword parameters
         """
+        if bulk_options and bulk_options.keys() - BULK_LIMITS.keys():
+            raise ActionError(f'Unknown bulk options: '
+                              f'{", ".join(sorted(bulk_options.keys() - BULK_LIMITS.keys()))}')
+
         self.document_type = document_type
         self.dummy_action = dummy_action
+        self.bulk_options = bulk_options
         self.parameters = kwargs
         self._run_ctx = None  # Run context, filled by `prepare()`
 
@@ -166,6 +180,8 @@ class BaseAction(metaclass=BaseActionMeta):
         args_str = repr(self.document_type)
         if self.dummy_action:
             params_str += f', dummy_action={self.dummy_action}'
+        if self.bulk_options:
+            params_str += f', bulk_options={self.bulk_options!r}'
         return f'{self.__class__.__name__}({args_str}, {params_str})'
 
     def __str__(self):
@@ -262,6 +278,8 @@ class BaseFieldAction(BaseAction):
         }
         if self.dummy_action:
             parameters['dummy_action'] = True
+        if self.bulk_options:
+            parameters['bulk_options'] = repr(self.bulk_options)
 
         kwargs_str = ''.join(f", {name!s}={val!s}" for name, val in sorted(parameters.items()))
         return f'{self.__class__.__name__}({self.document_type!r}, {self.field_name!r}' \
@@ -291,6 +309,8 @@ class BaseFieldAction(BaseAction):
         args_str = f'{self.document_type!r}, {self.field_name!r}'
         if self.dummy_action:
             params_str += f', dummy_action={self.dummy_action}'
+        if self.bulk_options:
+            params_str += f', bulk_options={self.bulk_options!r}'
         return f'{self.__class__.__name__}({args_str}, {params_str})'
 
     def __str__(self):
@@ -343,6 +363,8 @@ class BaseDocumentAction(BaseAction):
         }
         if self.dummy_action:
             parameters['dummy_action'] = True
+        if self.bulk_options:
+            parameters['bulk_options'] = repr(self.bulk_options)
 
         kwargs_str = ''.join(f", {name!s}={val!s}" for name, val in sorted(parameters.items()))
         return f'{self.__class__.__name__}({self.document_type!r}{kwargs_str})'
@@ -471,7 +493,7 @@ class BaseAlterDocument(BaseDocumentAction):
         # diff. Unlike the AlterField there are no schema skel here,
         # so we can't delete a parameter implicitly
         left_item = left_schema[self.document_type]
-        right_item = deepcopy(left_item)
+        right_item = copy(left_item)
         right_item.parameters.clear()
         right_item.parameters.update(self.parameters)
 
@@ -599,6 +621,8 @@ class BaseIndexAction(BaseAction):
         }
         if self.dummy_action:
             parameters['dummy_action'] = True
+        if self.bulk_options:
+            parameters['bulk_options'] = repr(self.bulk_options)
 
         fields_str = ''
         if 'fields' in self.parameters:  # DropIndex has no 'fields'
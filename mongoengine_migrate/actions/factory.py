@@ -9,11 +9,12 @@ import logging
 from copy import copy
 from typing import Iterable, Type
 
-from dictdiffer import patch, diff
+from dictdiffer import diff
 
 import mongoengine_migrate.flags as flags
 from mongoengine_migrate.exceptions import ActionError
 from mongoengine_migrate.schema import Schema
+from mongoengine_migrate.schema_patch import apply_patch
 from .base import (
     actions_registry,
     BaseFieldAction,
@@ -59,7 +60,7 @@ def build_actions_chain(left_schema: Schema, right_schema: Schema) -> Iterable[B
         for action in new_actions:
             log.debug('> %s', action)
             try:
-                left_schema = patch(action.to_schema_patch(left_schema), left_schema)
+                apply_patch(action.to_schema_patch(left_schema), left_schema)
             except (TypeError, ValueError, KeyError) as e:
                 raise ActionError(
                     f"Unable to apply schema patch of {action!r}. More likely that the "
@@ -94,11 +95,12 @@ def build_document_action_chain(action_cls: Type[BaseDocumentAction],
     :param document_types: list of document types to inspect
     :return: iterable of suitable Action objects
     """
+    left_schema = copy(left_schema)
     for document_type in document_types:
         action_obj = action_cls.build_object(document_type, left_schema, right_schema)
         if action_obj is not None:
             try:
-                left_schema = patch(action_obj.to_schema_patch(left_schema), left_schema)
+                apply_patch(action_obj.to_schema_patch(left_schema), left_schema)
             except (TypeError, ValueError, KeyError) as e:
                 raise ActionError(
                     f"Unable to apply schema patch of {action_obj!r}. More likely that the "
@@ -121,6 +123,7 @@ def build_field_action_chain(action_cls: Type[BaseFieldAction],
     :param document_types: list of document types to inspect
     :return: iterable of suitable Action objects
     """
+    left_schema = copy(left_schema)
     for document_type in document_types:
         # Take all fields to detect if they created, changed or dropped
         all_fields = left_schema.get(document_type, {}).keys() | \
@@ -132,7 +135,7 @@ def build_field_action_chain(action_cls: Type[BaseFieldAction],
                                                  right_schema)
             if action_obj is not None:
                 try:
-                    left_schema = patch(action_obj.to_schema_patch(left_schema), left_schema)
+                    apply_patch(action_obj.to_schema_patch(left_schema), left_schema)
                 except (TypeError, ValueError, KeyError) as e:
                     raise ActionError(
                         f"Unable to apply schema patch of {action_obj!r}. More likely that the "
@@ -155,6 +158,7 @@ def build_index_action_chain(action_cls: Type[BaseIndexAction],
     :param document_types: list of document types to inspect
     :return: iterable of suitable Action objects
     """
+    left_schema = copy(left_schema)
     for document_type in document_types:
         # Take all indexes to detect if they created, altered, dropped
         all_indexes = left_schema.get(document_type, Schema.Document()).indexes.keys() | \
@@ -166,7 +170,7 @@ def build_index_action_chain(action_cls: Type[BaseIndexAction],
                                                  right_schema)
             if action_obj is not None:
                 try:
-                    left_schema = patch(action_obj.to_schema_patch(left_schema), left_schema)
+                    apply_patch(action_obj.to_schema_patch(left_schema), left_schema)
                 except (TypeError, ValueError, KeyError) as e:
                     raise ActionError(
                         f"Unable to apply schema patch of {action_obj!r}. More likely that the "
@@ -4,7 +4,7 @@ __all__ = [
     'AlterIndex'
 ]
 
-from copy import deepcopy
+from copy import copy
 from typing import Optional, Sequence
 
 from pymongo.database import Database
@@ -52,7 +52,7 @@ class CreateIndex(BaseIndexAction):
 
     def to_schema_patch(self, left_schema: Schema):
         left_item = left_schema[self.document_type]
-        right_item = deepcopy(left_item)
+        right_item = copy(left_item)
         right_item.indexes[self.index_name] = self.parameters
 
         # Document must be already created, therefore do 'change'
@@ -93,7 +93,7 @@ class DropIndex(BaseIndexAction):
 
     def to_schema_patch(self, left_schema: Schema):
         left_item = left_schema[self.document_type]
-        right_item = deepcopy(left_item)
+        right_item = copy(left_item)
         right_item.indexes.pop(self.index_name, None)
 
         # Document must be already created, therefore do 'change'
@@ -134,9 +134,8 @@ class AlterIndex(BaseIndexAction):
 
     def to_schema_patch(self, left_schema: Schema):
         left_item = left_schema[self.document_type]
-        right_item = deepcopy(left_item)
-        right_item.indexes[self.index_name].clear()
-        right_item.indexes[self.index_name].update(self.parameters)
+        right_item = copy(left_item)
+        right_item.indexes[self.index_name] = dict(self.parameters)
 
         # Document must be already created, therefore do 'change'
         return [('change', self.document_type, (left_item, right_item))]
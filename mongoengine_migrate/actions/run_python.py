@@ -52,6 +52,8 @@ class RunPython(BaseAction):
         }
         if self.dummy_action:
             parameters['dummy_action'] = True
+        if self.bulk_options:
+            parameters['bulk_options'] = repr(self.bulk_options)
 
         kwargs = []
         if self.forward_func:
@@ -0,0 +1,205 @@
+__all__ = [
+    'BulkWriteBuffer',
+    'bulk_limits',
+    'BULK_LIMITS'
+]
+
+import functools
+import time
+from contextlib import contextmanager
+from typing import Optional, Mapping, List, Callable, Any
+
+import bson
+from pymongo.collection import Collection
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.exceptions import MigrationInterrupted
+from mongoengine_migrate.metrics import get_current_metrics, record_metrics
+from mongoengine_migrate.throttle import wait_for_replication
+
+#: Names of bulk buffer limits which could be set for an action.
+#: Mapping to appropriate runtime flags
+BULK_LIMITS = {
+    'max_length': 'bulk_buffer_length',
+    'max_bytes': 'bulk_buffer_bytes',
+    'max_delay': 'bulk_buffer_delay',
+}
+
+#: Initial position of buffer, see `BulkWriteBuffer.advance`
+_NO_POSITION = object()
+
+
+class BulkWriteBuffer:
+    """
+    Buffer of write requests to a collection. Buffered requests are
+    sent by one unordered `bulk_write` call when either of limits is
+    reached: requests count, summary size of requests payload encoded
+    to BSON or time passed since the first request was buffered.
+
+    Limits default to `bulk_buffer_*` runtime flags. Zero byte or time
+    limit means no limit. Time limit is checked only when a request
+    is added. Payload size is counted only if byte limit is set or
+    metrics are collected, since encoding every request to BSON is
+    costly.
+
+    Buffer could be used as context manager, which flushes remaining
+    requests on exit if no exception was raised or if migration was
+    interrupted (all buffered requests are complete at that point).
+    """
+    def __init__(self,
+                 collection: Collection,
+                 max_length: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 max_delay: Optional[float] = None,
+                 writer=None,
+                 on_flush: Optional[Callable[[Any], None]] = None,
+                 on_write: Optional[Callable[[List, Any], None]] = None,
+                 metrics_path: str = ''):
+        """
+        :param collection: collection to write to
+        :param max_length: max requests count
+        :param max_bytes: max summary size of requests payload in bytes
+        :param max_delay: max seconds to keep a request in buffer
+        :param writer: optional object with `submit(requests)` method,
+         such as `BackgroundWriter`, which writes flushed requests
+         instead of the buffer itself
+        :param on_flush: optional function which is called with the
+         current position (see `advance`) after flushed requests
+         have been written
+        :param on_write: optional function which is called with
+         written requests and `BulkWriteResult` after every bulk write
+        :param metrics_path: dotpath to embedded documents which
+         written batches are counted for in the current metrics
+        """
+        self.collection = collection
+        self.writer = writer
+        self.on_flush = on_flush
+        self.on_write = on_write
+        self.metrics_path = metrics_path
+        self.max_length = flags.bulk_buffer_length if max_length is None else max_length
+        self.max_bytes = flags.bulk_buffer_bytes if max_bytes is None else max_bytes
+        self.max_delay = flags.bulk_buffer_delay if max_delay is None else max_delay
+        self._count_bytes = bool(self.max_bytes) or get_current_metrics() is not None
+
+        self._requests: List = []
+        self._nbytes = 0
+        self._started_at = 0.0
+        self._position = _NO_POSITION
+        self._flushed_position = _NO_POSITION
+
+    @property
+    def nbytes(self) -> int:
+        """Size of buffered requests payload in bytes. Always 0 if
+        size is not counted
+        """
+        return self._nbytes
+
+    def append(self, request, payload: Mapping) -> None:
+        """
+        Add a write request to buffer and flush buffer if any limit
+        is reached
+        :param request: pymongo write request, such as UpdateOne
+        :param payload: document which the request sends, i.e.
+         update operators or replacement document. Its BSON size is
+         counted in byte limit and metrics
+        :return:
+        """
+        if not self._is_dirty():
+            self._started_at = time.monotonic()
+
+        self._requests.append(request)
+        if self._count_bytes:
+            self._nbytes += len(bson.encode(payload))
+
+        if self._is_full():
+            self.flush()
+
+    def advance(self, position: Any) -> None:
+        """
+        Set the current position, i.e. mark that all requests up to
+        some point (such as `_id` of the last processed document) have
+        been appended. Position is passed to `on_flush` function.
+        Buffer is flushed by time limit even if there are no requests,
+        so position is reported periodically.
+        :param position: position value
+        :return:
+        """
+        if self.on_flush is None:
+            return
+
+        if not self._is_dirty():
+            self._started_at = time.monotonic()
+        self._position = position
+
+        if self._is_full():
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered requests to collection"""
+        if not self._is_dirty():
+            return
+
+        callback = None
+        if self.on_flush is not None and self._position is not _NO_POSITION:
+            callback = functools.partial(self.on_flush, self._position)
+
+        if self._requests:
+            record_metrics(self.collection.name, self.metrics_path,
+                           bulk_batches=1, bytes_written=self._nbytes)
+        if self.writer is not None:
+            self.writer.submit(self._requests, callback, self._on_write)
+        else:
+            if self._requests:
+                res = self.collection.bulk_write(self._requests, ordered=False)
+                self._on_write(self._requests, res)
+                wait_for_replication(len(self._requests))
+            if callback is not None:
+                callback()
+        self._requests = []
+        self._nbytes = 0
+        self._flushed_position = self._position
+
+    def _on_write(self, requests: List, result: Any) -> None:
+        record_metrics(self.collection.name, self.metrics_path,
+                       documents_modified=result.modified_count)
+        if self.on_write is not None:
+            self.on_write(requests, result)
+
+    def _is_dirty(self) -> bool:
+        return bool(self._requests) or self._position is not self._flushed_position
+
+    def _is_full(self) -> bool:
+        return len(self._requests) >= self.max_length \
+            or bool(self.max_bytes) and self._nbytes >= self.max_bytes \
+            or bool(self.max_delay) and time.monotonic() - self._started_at >= self.max_delay
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None or issubclass(exc_type, MigrationInterrupted):
+            self.flush()
+
+
+@contextmanager
+def bulk_limits(**limits):
+    """
+    Context manager which temporarily overrides bulk buffer limits
+    runtime flags. Accepts the same keyword parameters as
+    `BulkWriteBuffer` constructor
+    """
+    unknown = limits.keys() - BULK_LIMITS.keys()
+    if unknown:
+        raise TypeError(f'Unknown bulk limits: {", ".join(sorted(unknown))}')
+
+    old_values = {BULK_LIMITS[k]: getattr(flags, BULK_LIMITS[k]) for k in limits}
+    try:
+        for name, value in limits.items():
+            setattr(flags, BULK_LIMITS[name], value)
+        yield
+    finally:
+        for flag_name, value in old_values.items():
+            setattr(flags, flag_name, value)
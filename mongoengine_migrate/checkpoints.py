@@ -0,0 +1,327 @@
+"""Checkpoints of by_doc scans, which make an interrupted migration
+resumable without rescanning already processed documents
+"""
+__all__ = [
+    'action_scope',
+    'get_scan_checkpoint',
+    'handle_sigterm',
+    'share_interrupt_flag',
+    'worker_sigterm_scope',
+    'scan_activity',
+    'check_interrupted',
+    'ScanCheckpoint'
+]
+
+import logging
+import signal
+import threading
+from contextlib import contextmanager
+from copy import copy
+from typing import Optional, List, Any, Tuple
+
+from pymongo.collection import Collection
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.exceptions import MigrationInterrupted
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Action which scans are currently checkpointed. See `action_scope`
+_current_action: Optional['_ActionScope'] = None
+
+#: Set when SIGTERM was received. Scans check it after every document
+_interrupted = threading.Event()
+
+#: Interrupt flag in shared memory, which is visible to worker
+#: processes forked inside `share_interrupt_flag`
+_shared_interrupted = None
+
+#: Count of scans running in this process. SIGTERM handler interrupts
+#: the main thread immediately only if there are no running scans
+_active_scans = 0
+_active_scans_lock = threading.Lock()
+
+
+class _ActionScope:
+    def __init__(self, collection: Collection, key: dict):
+        self.collection = collection
+        self.key = key
+        self.scans_count = 0
+
+
+class ScanCheckpoint:
+    """
+    Checkpoint of one by_doc scan stored in migrations collection.
+    Scan is split into one or more `_id` ranges (one range per
+    parallel worker). For every range the last `_id` whose changes
+    have been written is stored, and whether the range has been
+    scanned till the end.
+
+    Since ranges are stored, the scan resumes with the same ranges
+    even if workers count has changed.
+    """
+    def __init__(self,
+                 collection: Collection,
+                 key: dict,
+                 collection_name: str,
+                 filter_dotpath: str,
+                 update_path: Tuple[str, ...]):
+        """
+        :param collection: collection where checkpoints are stored
+        :param key: checkpoint record key
+        :param collection_name: name of scanned collection
+        :param filter_dotpath: filter dotpath of scan
+        :param update_path: update path of scan
+        """
+        self.collection = collection
+        self.key = key
+        self.scan_info = {
+            'collection': collection_name,
+            'filter_dotpath': filter_dotpath,
+            'update_path': list(update_path)
+        }
+
+    def load(self) -> Optional[List[dict]]:
+        """
+        Return stored ranges state or None if scan has not been
+        started yet. Every range is a dict with `lower` and `upper`
+        bounds (None means open bound), `last_id` and `done` keys
+        """
+        record = self.collection.find_one(self.key)
+        if record is None:
+            return None
+        if any(record.get(k) != v for k, v in self.scan_info.items()):
+            # Migration has been changed since the checkpoint was made
+            log.warning('> Checkpoint %s does not match the scan, ignoring it', self.key)
+            return None
+
+        return record['ranges']
+
+    def start(self, ranges: List[dict]) -> None:
+        """
+        Store a new scan state
+        :param ranges: ranges state returned by `new_ranges`
+        :return:
+        """
+        self.collection.replace_one(self.key,
+                                    {**self.key, **self.scan_info, 'ranges': ranges},
+                                    upsert=True)
+
+    def save_position(self, range_index: int, last_id: Any) -> None:
+        """Store the last `_id` whose changes have been written"""
+        self.collection.update_one(self.key,
+                                   {'$set': {f'ranges.{range_index}.last_id': last_id}})
+
+    def finish(self, range_index: int) -> None:
+        """Mark range as scanned till the end"""
+        self.collection.update_one(self.key, {'$set': {f'ranges.{range_index}.done': True}})
+
+    def with_collection(self, collection: Collection) -> 'ScanCheckpoint':
+        """Return the same checkpoint stored in another collection
+        object, e.g. opened by another connection
+        """
+        res = copy(self)
+        res.collection = collection
+        return res
+
+    @staticmethod
+    def new_ranges(id_ranges: List[Optional[dict]]) -> List[dict]:
+        """
+        Make state of ranges which have not been started yet
+        :param id_ranges: ranges returned by `split_id_ranges`
+        :return: ranges state
+        """
+        return [
+            {
+                'lower': (r or {}).get('$gte'),
+                'upper': (r or {}).get('$lt'),
+                'last_id': None,
+                'done': False
+            }
+            for r in id_ranges
+        ]
+
+    @staticmethod
+    def range_filter(id_range: dict) -> Optional[dict]:
+        """
+        Return `_id` filter expression for the rest of given range
+        :param id_range: range state
+        :return: filter expression or None if range is open and
+         has not been started
+        """
+        fltr = {}
+        if id_range['lower'] is not None:
+            fltr['$gte'] = id_range['lower']
+        if id_range['upper'] is not None:
+            fltr['$lt'] = id_range['upper']
+        if id_range['last_id'] is not None:
+            fltr['$gt'] = id_range['last_id']
+        return fltr or None
+
+
+@contextmanager
+def action_scope(collection: Collection,
+                 migration_name: str,
+                 action_index: int,
+                 forward: bool):
+    """
+    Context manager which sets the current action. by_doc scans made
+    inside get checkpoints keyed by action and scan sequence number.
+    Checkpoints of the action are removed when it has finished
+    successfully
+    :param collection: collection where checkpoints are stored
+    :param migration_name: migration name
+    :param action_index: action index in migration
+    :param forward: action direction
+    """
+    global _current_action
+
+    key = {
+        'type': 'checkpoint',
+        'migration': migration_name,
+        'action': action_index,
+        'direction': 'forward' if forward else 'backward'
+    }
+    previous = _current_action
+    _current_action = _ActionScope(collection, key)
+    try:
+        yield
+        if flags.checkpoints and not flags.dry_run:
+            collection.delete_many(key)
+    finally:
+        _current_action = previous
+
+
+def get_scan_checkpoint(collection_name: str,
+                        filter_dotpath: str,
+                        update_path: Tuple[str, ...]) -> Optional[ScanCheckpoint]:
+    """
+    Return checkpoint for the next by_doc scan of the current action
+    :param collection_name: name of scanned collection
+    :param filter_dotpath: filter dotpath of scan
+    :param update_path: update path of scan
+    :return: checkpoint object or None if checkpoints are disabled
+     or there is no current action
+    """
+    if not flags.checkpoints or _current_action is None:
+        return None
+
+    # Action makes the same scans in the same order every time, so
+    # sequence number identifies a scan
+    _current_action.scans_count += 1
+    key = {**_current_action.key, 'scan': _current_action.scans_count}
+    return ScanCheckpoint(_current_action.collection,
+                          key,
+                          collection_name,
+                          filter_dotpath,
+                          update_path)
+
+
+@contextmanager
+def scan_activity():
+    """Context manager which marks that a scan is running in
+    current process
+    """
+    global _active_scans
+
+    with _active_scans_lock:
+        _active_scans += 1
+    try:
+        yield
+    finally:
+        with _active_scans_lock:
+            _active_scans -= 1
+
+
+def check_interrupted() -> None:
+    """Raise MigrationInterrupted if SIGTERM was received"""
+    if _interrupted.is_set() or _shared_interrupted is not None and _shared_interrupted.value:
+        raise MigrationInterrupted('Migration was interrupted by SIGTERM')
+
+
+def _sigterm_handler(signum, frame):
+    log.warning('SIGTERM received, stopping...')
+    _interrupted.set()
+    if _shared_interrupted is not None:
+        _shared_interrupted.value = True
+    # Running scans stop by themselves after flushing buffered
+    # changes and making a checkpoint
+    if not _active_scans:
+        check_interrupted()
+
+
+@contextmanager
+def handle_sigterm():
+    """
+    Context manager which handles SIGTERM by interrupting a migration
+    gracefully: running scans write buffered changes, make a
+    checkpoint and raise MigrationInterrupted. Has no effect outside
+    the main thread, since signal handler could be set only there
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    old_handler = signal.signal(signal.SIGTERM, _sigterm_handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM,
+                      signal.SIG_DFL if old_handler is None else old_handler)
+        _interrupted.clear()
+
+
+@contextmanager
+def share_interrupt_flag(mp_context):
+    """
+    Context manager which shares the interrupt flag with worker
+    processes forked inside if SIGTERM is handled (see
+    `handle_sigterm`). So SIGTERM received by any of them or by this
+    process interrupts all scans gracefully. Workers should run scans
+    in `worker_sigterm_scope`. This process counts as running a scan,
+    so that it does not raise MigrationInterrupted before workers
+    have finished
+    :param mp_context: multiprocessing context used to fork workers
+    """
+    global _shared_interrupted
+
+    if signal.getsignal(signal.SIGTERM) is not _sigterm_handler:
+        yield
+        return
+
+    previous = _shared_interrupted
+    # Raw value has no lock, so it could be set by signal handler
+    _shared_interrupted = mp_context.RawValue('b', _interrupted.is_set())
+    try:
+        with scan_activity():
+            yield
+    finally:
+        if _shared_interrupted.value:
+            _interrupted.set()
+        _shared_interrupted = previous
+
+
+@contextmanager
+def worker_sigterm_scope():
+    """
+    Context manager used by a worker process forked inside
+    `share_interrupt_flag`. If SIGTERM is handled by the parent, then
+    worker handles it too while inside, so a running scan stops by
+    itself after flushing buffered changes and making a checkpoint.
+    Otherwise, and after exit, SIGTERM terminates worker
+    """
+    if _shared_interrupted is None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        yield
+        return
+
+    signal.signal(signal.SIGTERM, _worker_sigterm_handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _worker_sigterm_handler(signum, frame):
+    _interrupted.set()
+    _shared_interrupted.value = True
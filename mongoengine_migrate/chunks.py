@@ -0,0 +1,171 @@
+"""Execution of by_path updates by `_id` ranged chunks, which keeps
+oplog bursts and replication lag under control on huge collections
+"""
+__all__ = [
+    'ChunkedCollection',
+    'iter_id_chunks',
+    'restrict_filter',
+    'run_in_chunks'
+]
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Optional, Callable, Any, Generator, List
+
+import wrapt
+from bson import Decimal128, Int64
+from pymongo.collection import Collection
+from pymongo.results import UpdateResult
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.checkpoints import check_interrupted
+from mongoengine_migrate.progress import ProgressReporter, get_progress_total
+from mongoengine_migrate.throttle import wait_for_replication
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Python types of numeric BSON values, which MongoDB compares
+#: with each other
+_NUMERIC_TYPES = (int, float, Int64, Decimal, Decimal128)
+
+
+def _id_kind(value: Any) -> type:
+    return int if isinstance(value, _NUMERIC_TYPES) else type(value)
+
+
+def iter_id_chunks(collection: Collection,
+                   chunk_size: int) -> Generator[Optional[dict], None, None]:
+    """
+    Split a collection into consecutive `_id` ranges of `chunk_size`
+    documents. Split points are found by skipping `chunk_size` entries
+    of `_id` index from the previous point, so the next range is
+    computed only when it's requested.
+
+    Range query on `_id` matches only values of the same BSON type as
+    its bounds, so if a collection contains `_id` of different types
+    then one open range is returned
+    :param collection: pymongo collection object
+    :param chunk_size: documents count in a range
+    :return: `_id` filter expressions. None means the whole collection
+    """
+    def find_id(fltr: dict, skip: int = 0, direction: int = 1):
+        cursor = collection.find(fltr, {'_id': True}).sort('_id', direction)
+        res = list(cursor.skip(skip).limit(1))
+        return res[0]['_id'] if res else None
+
+    first, last = find_id({}), find_id({}, direction=-1)
+    if first is None or _id_kind(first) != _id_kind(last):
+        if first is not None:
+            log.warning('> Collection %s contains _id of different types, it will not be split '
+                        'into chunks', collection.name)
+        yield None
+        return
+
+    lower = None
+    while True:
+        upper = find_id({'_id': {'$gte': lower}} if lower is not None else {}, skip=chunk_size)
+        id_range = {}
+        if lower is not None:
+            id_range['$gte'] = lower
+        if upper is not None:
+            id_range['$lt'] = upper
+        yield id_range or None
+
+        if upper is None:
+            return
+        lower = upper
+
+
+def restrict_filter(fltr: dict, id_fltr: Optional[dict]) -> dict:
+    """Return filter restricted by a given `_id` filter expression"""
+    if id_fltr is None:
+        return fltr
+    if '_id' not in fltr:
+        return {**fltr, '_id': id_fltr}
+
+    return {'$and': [fltr, {'_id': id_fltr}]}
+
+
+def run_in_chunks(collection: Collection, write: Callable[[Optional[dict]], Any]) -> List[Any]:
+    """
+    Call a write function for every `_id` range of a collection, see
+    `iter_id_chunks`. Ranges contain `flags.by_path_chunk_size`
+    documents, and are processed by `flags.parallel_workers` threads.
+    Every thread waits `flags.by_path_chunk_pause` seconds after a
+    chunk. Progress is reported by documents count of processed
+    chunks. If chunk size is not set then function is called once
+    :param collection: pymongo collection object
+    :param write: function which takes `_id` filter expression (or
+     None which means the whole collection) and makes writes
+     restricted by it (see `restrict_filter`)
+    :return: results of write function calls in chunks order
+    """
+    chunk_size = flags.by_path_chunk_size
+    if not chunk_size:
+        return [write(None)]
+
+    results = {}
+    progress = None
+    if flags.progress_interval:
+        progress = ProgressReporter(f'{collection.name} chunks', get_progress_total(collection))
+
+    def run_chunk(index: int, id_fltr: Optional[dict]) -> float:
+        check_interrupted()
+        started = time.monotonic()
+        res = results[index] = write(id_fltr)
+        elapsed = time.monotonic() - started
+        modified = getattr(res, 'modified_count', None)
+        log.debug('> Chunk %d of %s %s: %s modified in %.3fs', index, collection.name,
+                  id_fltr, '?' if modified is None else modified, elapsed)
+        wait_for_replication(modified or 0)
+        if progress is not None:
+            # The last chunk is usually smaller, but done count is
+            # limited by total one in reports
+            progress.advance(chunk_size)
+        if flags.by_path_chunk_pause:
+            time.sleep(flags.by_path_chunk_pause)
+        return elapsed
+
+    started = time.monotonic()
+    chunks = enumerate(iter_id_chunks(collection, chunk_size), start=1)
+    workers = flags.parallel_workers
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_chunk, index, f) for index, f in chunks]
+            timings = [future.result() for future in futures]  # Reraise exception if any
+    else:
+        timings = [run_chunk(index, f) for index, f in chunks]
+
+    if progress is not None:
+        progress.finish()
+    log.debug('> %d chunks of %s written in %.3fs, average %.3fs, max %.3fs',
+              len(timings), collection.name, time.monotonic() - started,
+              sum(timings) / len(timings), max(timings))
+    return [results[index] for index in sorted(results)]
+
+
+class ChunkedCollection(wrapt.ObjectProxy):
+    """
+    Collection proxy which executes `update_many` calls by chunks,
+    see `run_in_chunks`. Chunked `update_many` returns counters
+    summed across chunks
+    """
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        if upsert:
+            # Document could not be inserted by a chunk
+            return self.__wrapped__.update_many(filter, update, upsert=upsert, **kwargs)
+
+        results = run_in_chunks(
+            self.__wrapped__,
+            lambda id_fltr: self.__wrapped__.update_many(restrict_filter(filter, id_fltr),
+                                                         update,
+                                                         **kwargs)
+        )
+        raw_result = {
+            'n': sum(getattr(r, 'matched_count', 0) for r in results),
+            'nModified': sum(getattr(r, 'modified_count', 0) for r in results),
+            'ok': 1.0
+        }
+        return UpdateResult(raw_result, acknowledged=True)
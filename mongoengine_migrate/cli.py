@@ -7,6 +7,7 @@ from typing import Optional
 import click
 
 import mongoengine_migrate.flags as flags
+from mongoengine_migrate.checkpoints import handle_sigterm
 from mongoengine_migrate.exceptions import MongoengineMigrateError
 from mongoengine_migrate.loader import MongoengineMigrate, import_module
 
@@ -45,6 +46,15 @@ def error_handler(func):
     return w
 
 
+def validate_max_staleness(ctx, param, value):
+    """Click callback which checks that max staleness is either 0 or
+    is not less than MongoDB accepts
+    """
+    if 0 < value < flags.MIN_MAX_STALENESS:
+        raise click.BadParameter(f'must be 0 or at least {flags.MIN_MAX_STALENESS}')
+    return value
+
+
 def cli_options(f):
     decorators = [
         click.option(
@@ -89,6 +99,24 @@ def cli_options(f):
             metavar='LOG_LEVEL',
             help="Logging verbosity level",
             show_default=True
+        ),
+        click.option(
+            '--profile-commands',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_PROFILE_COMMANDS",
+            help="Measure time and reply size of MongoDB commands made by every action and log "
+                 "the slowest ones"
+        ),
+        click.option(
+            '--schema-snapshot-interval',
+            default=flags.schema_snapshot_interval,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_SCHEMA_SNAPSHOT_INTERVAL",
+            metavar='COUNT',
+            help="Store schema snapshot after every given number of migrations when schema is "
+                 "replayed by downgrade or makemigrations. 0 means no new snapshots",
+            show_default=True
         )
     ]
     for decorator in reversed(decorators):
@@ -109,6 +137,215 @@ def migration_options(f):
             default=False,
             is_flag=True,
             help='Perform migrations without doing any database modifications'
+        ),
+        click.option(
+            '--parallel-workers',
+            default=flags.parallel_workers,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_PARALLEL_WORKERS",
+            metavar='COUNT',
+            help="Split collection into _id ranges and process documents in a given number of "
+                 "parallel workers. 0 or 1 means sequential processing",
+            show_default=True
+        ),
+        click.option(
+            '--parallel-executor',
+            type=click.Choice(['thread', 'process'], case_sensitive=False),
+            default=flags.parallel_executor,
+            envvar="MONGOENGINE_MIGRATE_PARALLEL_EXECUTOR",
+            help="Type of parallel workers",
+            show_default=True
+        ),
+        click.option(
+            '--pipeline',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_PIPELINE",
+            help="Read documents, modify them and write changes in parallel threads"
+        ),
+        click.option(
+            '--raw-scan',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_RAW_SCAN",
+            help="Read documents as raw BSON and decode only fields which are being migrated"
+        ),
+        click.option(
+            '--embedded-paths-sample',
+            default=flags.embedded_paths_sample,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_EMBEDDED_PATHS_SAMPLE",
+            metavar='COUNT',
+            help="Find paths to embedded documents in a random sample of a given number of "
+                 "documents instead of the whole collection. Paths which occur only outside the "
+                 "sample are not migrated. 0 means the whole collection",
+            show_default=True
+        ),
+        click.option(
+            '--checkpoints',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_CHECKPOINTS",
+            help="Scan documents in _id order and store progress, so an interrupted migration "
+                 "continues from where it stopped"
+        ),
+        click.option(
+            '--embedded-catalog',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_EMBEDDED_CATALOG",
+            help="Store paths to embedded documents found in collections and reuse them instead "
+                 "of searching on every action. Use refresh-embedded-catalog command after "
+                 "embedded documents were changed not by migrations"
+        ),
+        click.option(
+            '--fuse-actions',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_FUSE_ACTIONS",
+            help="Merge updates of consecutive field actions on the same collection into fewer "
+                 "collection passes. Ignored if --checkpoints is set"
+        ),
+        click.option(
+            '--by-path-chunk-size',
+            default=flags.by_path_chunk_size,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_BY_PATH_CHUNK_SIZE",
+            metavar='COUNT',
+            help="Split every by-path update into chunks of _id range with a given number of "
+                 "documents. Chunks are processed by --parallel-workers. 0 means no split",
+            show_default=True
+        ),
+        click.option(
+            '--by-path-chunk-pause',
+            default=flags.by_path_chunk_pause,
+            type=click.FloatRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_BY_PATH_CHUNK_PAUSE",
+            metavar='SECONDS',
+            help="Pause after every by-path update chunk",
+            show_default=True
+        ),
+        click.option(
+            '--max-replication-lag',
+            default=flags.max_replication_lag,
+            type=click.FloatRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_MAX_REPLICATION_LAG",
+            metavar='SECONDS',
+            help="Slow down writes when replication lag of secondaries exceeds a half of given "
+                 "value and pause them when it exceeds the value. 0 means no throttling",
+            show_default=True
+        ),
+        click.option(
+            '--replication-lag-poll-interval',
+            default=flags.replication_lag_poll_interval,
+            type=click.FloatRange(min=0.1),
+            envvar="MONGOENGINE_MIGRATE_REPLICATION_LAG_POLL_INTERVAL",
+            metavar='SECONDS',
+            help="How often replica set status is polled when writes are throttled",
+            show_default=True
+        ),
+        click.option(
+            '--secondary-reads',
+            default=False,
+            is_flag=True,
+            envvar="MONGOENGINE_MIGRATE_SECONDARY_READS",
+            help="Read scanned documents from secondaries and write changes to the primary "
+                 "only if documents have not been changed since then"
+        ),
+        click.option(
+            '--max-staleness',
+            default=flags.max_staleness,
+            type=click.IntRange(min=0),
+            callback=validate_max_staleness,
+            envvar="MONGOENGINE_MIGRATE_MAX_STALENESS",
+            metavar='SECONDS',
+            help="Max replication lag of a secondary which documents are read from when "
+                 "--secondary-reads is set. 0 means no limit, otherwise at least 90",
+            show_default=True
+        ),
+        click.option(
+            '--metrics-report',
+            default=None,
+            type=click.Path(dir_okay=False, writable=True),
+            envvar="MONGOENGINE_MIGRATE_METRICS_REPORT",
+            metavar='FILE',
+            help="Write JSON report with performance metrics of every action to a given file "
+                 "and log their summary table"
+        ),
+        click.option(
+            '--profile-dir',
+            default=None,
+            type=click.Path(file_okay=False, writable=True),
+            envvar="MONGOENGINE_MIGRATE_PROFILE_DIR",
+            metavar='DIR',
+            help="Profile every action by cProfile and tracemalloc and write its stats to "
+                 "a given directory"
+        ),
+        click.option(
+            '--profile-memory-top',
+            default=flags.profile_memory_top,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_PROFILE_MEMORY_TOP",
+            metavar='COUNT',
+            help="Write a given number of source lines which allocated the most of memory "
+                 "during every action if --profile-dir is set",
+            show_default=True
+        ),
+        click.option(
+            '--progress-interval',
+            default=flags.progress_interval,
+            type=click.FloatRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_PROGRESS_INTERVAL",
+            metavar='SECONDS',
+            help="Log speed, percent done and ETA of long collection passes every given "
+                 "seconds. 0 means no progress reports",
+            show_default=True
+        ),
+        click.option(
+            '--progress-file',
+            default=None,
+            type=click.Path(dir_okay=False, writable=True),
+            envvar="MONGOENGINE_MIGRATE_PROGRESS_FILE",
+            metavar='FILE',
+            help="Append progress reports as JSON lines to a given file"
+        ),
+        click.option(
+            '--progress-total',
+            default=flags.progress_total,
+            type=click.Choice(['estimated', 'exact']),
+            envvar="MONGOENGINE_MIGRATE_PROGRESS_TOTAL",
+            help="Take expected documents count of a pass from collection metadata or count "
+                 "documents by pass filter (slower)",
+            show_default=True
+        ),
+        click.option(
+            '--bulk-buffer-length',
+            default=flags.bulk_buffer_length,
+            type=click.IntRange(min=1),
+            envvar="MONGOENGINE_MIGRATE_BULK_BUFFER_LENGTH",
+            metavar='COUNT',
+            help="Flush bulk write buffer when it contains a given number of requests",
+            show_default=True
+        ),
+        click.option(
+            '--bulk-buffer-bytes',
+            default=flags.bulk_buffer_bytes,
+            type=click.IntRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_BULK_BUFFER_BYTES",
+            metavar='BYTES',
+            help="Flush bulk write buffer when summary BSON size of its requests reaches a given "
+                 "number of bytes. 0 means no limit",
+            show_default=True
+        ),
+        click.option(
+            '--bulk-buffer-delay',
+            default=flags.bulk_buffer_delay,
+            type=click.FloatRange(min=0),
+            envvar="MONGOENGINE_MIGRATE_BULK_BUFFER_DELAY",
+            metavar='SECONDS',
+            help="Flush bulk write buffer when its first request waits a given number of "
+                 "seconds. 0 means no limit",
+            show_default=True
         )
     ]
     for decorator in reversed(decorators):
@@ -116,6 +353,14 @@ def migration_options(f):
     return f
 
 
+def set_migration_flags(**kwargs):
+    """Set runtime flags from migration command options. Option names
+    are the same as flags names
+    """
+    for name, value in kwargs.items():
+        setattr(flags, name, value)
+
+
 @click.group()
 @cli_options
 @error_handler
@@ -123,6 +368,9 @@ def cli(uri, directory, collection, **kwargs):
     global mongoengine_migrate
     setup_logger(kwargs['log_level'])
     flags.mongo_version = kwargs.get('mongo_version')
+    flags.mongo_uri = uri
+    flags.profile_commands = kwargs.get('profile_commands', False)
+    flags.schema_snapshot_interval = kwargs.get('schema_snapshot_interval', 0)
     mongoengine_migrate = MongoengineMigrate(mongo_uri=uri,
                                              collection_name=collection,
                                              migrations_dir=directory)
@@ -133,31 +381,36 @@ def cli(uri, directory, collection, **kwargs):
 @click.argument('migration', required=True)
 @migration_options
 @error_handler
-def upgrade(migration, dry_run, schema_only):
+def upgrade(migration, dry_run, schema_only, **kwargs):
     flags.dry_run = dry_run
     flags.schema_only = schema_only
-
-    mongoengine_migrate.upgrade(migration)
+    set_migration_flags(**kwargs)
+    with handle_sigterm():
+        mongoengine_migrate.upgrade(migration)
 
 
 @click.command(short_help='Downgrade db to the given migration')
 @click.argument('migration', required=True)
 @migration_options
 @error_handler
-def downgrade(migration, dry_run, schema_only):
+def downgrade(migration, dry_run, schema_only, **kwargs):
     flags.dry_run = dry_run
     flags.schema_only = schema_only
-    mongoengine_migrate.downgrade(migration)
+    set_migration_flags(**kwargs)
+    with handle_sigterm():
+        mongoengine_migrate.downgrade(migration)
 
 
 @click.command(short_help='Migrate db to the given migration. By default is to the last one')
 @click.argument('migration', required=False)
 @migration_options
 @error_handler
-def migrate(migration, dry_run, schema_only):
+def migrate(migration, dry_run, schema_only, **kwargs):
     flags.dry_run = dry_run
     flags.schema_only = schema_only
-    mongoengine_migrate.migrate(migration)
+    set_migration_flags(**kwargs)
+    with handle_sigterm():
+        mongoengine_migrate.migrate(migration)
 
 
 @click.command(short_help='Generate migration file based on mongoengine model changes')
@@ -177,10 +430,40 @@ def makemigrations(models_module):
     mongoengine_migrate.makemigrations()
 
 
+@click.command(short_help='Search paths to embedded documents again and store them')
+@click.argument('document_types', nargs=-1, metavar='[DOCUMENT_TYPE]...')
+@error_handler
+def refresh_embedded_catalog(document_types):
+    mongoengine_migrate.refresh_embedded_catalog(list(document_types) or None)
+
+
+@click.group(short_help='Manage schema snapshots used by downgrade and makemigrations')
+def snapshot():
+    pass
+
+
+@click.command(short_help='Remove schema snapshots and write new ones from scratch')
+@click.option(
+    '--interval',
+    default=10,
+    type=click.IntRange(min=1),
+    metavar='COUNT',
+    help="Write schema snapshot after every given number of migrations",
+    show_default=True
+)
+@error_handler
+def rebuild(interval):
+    mongoengine_migrate.rebuild_schema_snapshots(interval)
+
+
+snapshot.add_command(rebuild)
+
 cli.add_command(upgrade)
 cli.add_command(downgrade)
 cli.add_command(makemigrations)
 cli.add_command(migrate)
+cli.add_command(refresh_embedded_catalog)
+cli.add_command(snapshot)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+__all__ = [
+    'compile_path',
+]
+
+import functools
+from typing import Any, Callable, Iterable, Tuple
+
+#: Function which yields values found by path in a document
+PathWalker = Callable[[Any], Iterable]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_path(update_path: Tuple[str, ...]) -> PathWalker:
+    """
+    Compile update path into a function which takes a document and
+    yields values found by this path. Path consists of field names
+    and `$[]` which points to every item of an array. Compiled
+    functions are cached.
+
+    Values which are not arrays are treated as single-item arrays by
+    `$[]`. Missing fields and fields of non-dict values are skipped.
+    Values are retrieved by item access, so containers which track
+    changes (see `tracking` module) could be passed.
+
+    Example: ('field1', '$[]', 'field2') yields `field2` values of
+    every embedded document in array `field1`.
+    :param update_path: tuple of path parts
+    :return: path walker function
+    """
+    walker = _walk_end
+    for part in reversed(update_path):
+        if part == '$[]':
+            walker = _make_array_step(walker)
+        else:
+            walker = _make_field_step(part, walker)
+
+    return walker
+
+
+def _walk_end(value: Any) -> Iterable:
+    return value,
+
+
+def _make_field_step(field_name: str, walk_next: PathWalker) -> PathWalker:
+    def walk(value: Any) -> Iterable:
+        if isinstance(value, dict) and field_name in value:
+            return walk_next(value[field_name])
+        return ()
+
+    return walk
+
+
+def _make_array_step(walk_next: PathWalker) -> PathWalker:
+    def walk(value: Any) -> Iterable:
+        if not isinstance(value, list):
+            return walk_next(value)
+
+        if walk_next is _walk_end:
+            return list(value)
+        return [found for item in value for found in walk_next(item)]
+
+    return walk
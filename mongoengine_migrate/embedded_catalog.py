@@ -0,0 +1,302 @@
+"""Catalog of paths where embedded documents are located in
+collections, which is stored in migrations collection and reused by
+actions and migration runs instead of searching paths every time
+"""
+__all__ = [
+    'iter_embedded_fields',
+    'catalog_scope',
+    'get_current_catalog',
+    'EmbeddedCatalog'
+]
+
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, Set, Tuple, Callable, Iterable, Generator, List, Sequence
+
+from pymongo.collection import Collection
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.schema import Schema
+from mongoengine_migrate.utils import group_by_collection
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Update path, such as ('a', '$[]', 'b')
+Path = Tuple[str, ...]
+
+#: Document type and field name
+FieldKey = Tuple[str, str]
+
+#: Function which takes a collection name and document types stored
+#: there, and returns update paths of all embedded documents found
+#: in collection
+DiscoverFunc = Callable[[str, List[str]], Iterable[Sequence[str]]]
+
+#: Catalog which actions use currently. See `catalog_scope`
+_current_catalog: Optional['EmbeddedCatalog'] = None
+
+
+def _is_embedded_ref(field_schema: Optional[dict]) -> bool:
+    ref = (field_schema or {}).get('target_doctype')
+    return ref is not None and ref.startswith(flags.EMBEDDED_DOCUMENT_NAME_PREFIX)
+
+
+def iter_embedded_fields(root_doctype: str,
+                         db_schema: Schema,
+                         paths: Set[Path]) -> Generator[Tuple[str, str, str, list], None, None]:
+    """
+    Walk through embedded document fields of given document type
+    recursively and yield those ones which paths are present in a
+    given set of paths found in db. A field which contains objects
+    and arrays is yielded twice, with path ['a'] and ['a', '$[]']
+    :param root_doctype: document type to start from
+    :param db_schema: db schema
+    :param paths: update paths found in db
+    :return: tuple(document type, field name, embedded document type,
+     update path)
+    """
+    def walk(doctype: str, base_path: list):
+        for field, field_schema in db_schema.get(doctype, {}).items():
+            if not _is_embedded_ref(field_schema):
+                continue
+
+            ref = field_schema['target_doctype']
+            # Field contains objects and/or non-empty arrays
+            for path in (base_path + [field], base_path + [field, '$[]']):
+                if tuple(path) in paths:
+                    yield doctype, field, ref, path
+                    yield from walk(ref, path)
+
+    yield from walk(root_doctype, [])
+
+
+@contextmanager
+def catalog_scope(catalog: Optional['EmbeddedCatalog']):
+    """
+    Context manager which sets a catalog which paths to embedded
+    documents are taken from. None means to search paths every time
+    :param catalog: catalog object or None
+    """
+    global _current_catalog
+
+    previous = _current_catalog
+    _current_catalog = catalog
+    try:
+        yield
+    finally:
+        _current_catalog = previous
+
+
+def get_current_catalog() -> Optional['EmbeddedCatalog']:
+    """Return catalog set by `catalog_scope` or None"""
+    return _current_catalog
+
+
+class EmbeddedCatalog:
+    """
+    Catalog of paths to embedded documents in collections. For every
+    document type it keeps collection name and update paths of all
+    embedded documents found there, no matter of their types. Paths
+    of a certain embedded document type are obtained by matching these
+    paths against the current schema (see `iter_embedded_fields`), so
+    renaming of embedded documents and changing of field target types
+    do not require the catalog to be updated.
+
+    Paths are searched in a collection only when they are requested
+    for the first time, and since then they are taken from the catalog.
+    After every action the catalog is updated according to schema
+    changes (see `update`). Changes made to embedded documents not by
+    migrations could not be tracked, so catalog should be refreshed
+    after them.
+
+    Catalog is stored in migrations collection as one record.
+    """
+    def __init__(self, collection: Collection):
+        """
+        :param collection: migrations collection
+        """
+        self.collection = collection
+        self.key = {'type': 'embedded_catalog'}
+        self._documents: Dict[str, dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        """Load catalog from db"""
+        record = self.collection.find_one(self.key)
+        self._documents = {
+            document_type: {
+                'collection': entry['collection'],
+                'paths': {tuple(p) for p in entry['paths']}
+            }
+            for document_type, entry in (record or {}).get('value', {}).items()
+        }
+
+    def save(self) -> None:
+        """Write catalog to db. Does nothing in dry run mode"""
+        if flags.dry_run:
+            return
+
+        value = {
+            document_type: {
+                'collection': entry['collection'],
+                'paths': [list(p) for p in sorted(entry['paths'])]
+            }
+            for document_type, entry in self._documents.items()
+        }
+        self.collection.replace_one(self.key, {**self.key, 'value': value}, upsert=True)
+
+    def get_locations(self,
+                      embedded_type: str,
+                      db_schema: Schema,
+                      discover: DiscoverFunc) -> Generator[Tuple[str, list], None, None]:
+        """
+        Return locations of embedded document of given type in all
+        collections. Collections which are absent in catalog are
+        searched by `discover` function and added to catalog. Every
+        location is returned once, even if several document types
+        stored in a collection contain it
+        :param embedded_type: embedded document type
+        :param db_schema: current db schema
+        :param discover: function which takes a collection name and
+         document types stored there, and returns update paths of all
+         embedded documents found in collection
+        :return: tuple(collection name, update path)
+        """
+        groups = group_by_collection(db_schema)
+        missing = {
+            collection_name: document_types
+            for collection_name, document_types in groups.items()
+            if not all(self._is_actual(name, db_schema) for name in document_types)
+        }
+        for collection_name, document_types in missing.items():
+            log.debug('> Searching embedded documents paths in %s', collection_name)
+            self._add(collection_name, document_types, discover(collection_name, document_types))
+        if missing:
+            self.save()
+
+        for collection_name, document_types in groups.items():
+            seen = set()
+            for document_type in document_types:
+                paths = self._documents[document_type]['paths']
+                for _, _, ref, path in iter_embedded_fields(document_type, db_schema, paths):
+                    if ref == embedded_type and tuple(path) not in seen:
+                        seen.add(tuple(path))
+                        yield collection_name, path
+
+    def update(self, old_schema: Schema, new_schema: Schema) -> None:
+        """
+        Update catalog after an action which changed schema from
+        `old_schema` to `new_schema`. Paths through removed embedded
+        fields are removed. Collections where an embedded field was
+        added or changed (except for its target type) are removed
+        from catalog and will be searched again when requested
+        :param old_schema: schema before the action
+        :param new_schema: schema after the action
+        :return:
+        """
+        removed, changed = self._diff_embedded_fields(old_schema, new_schema)
+        if not removed and not changed:
+            return
+
+        modified = False
+        for document_type, entry in list(self._documents.items()):
+            if document_type not in new_schema:
+                del self._documents[document_type]
+                modified = True
+                continue
+
+            # Document types which could contain changed fields
+            present_doctypes = {document_type}
+            removed_paths = []
+            for doctype, field, ref, path in iter_embedded_fields(document_type,
+                                                                  old_schema,
+                                                                  entry['paths']):
+                present_doctypes.add(ref)
+                if (doctype, field) in removed:
+                    removed_paths.append(tuple(path))
+
+            if any(doctype in present_doctypes for doctype, _ in changed):
+                log.debug('> Embedded documents paths of %s are outdated', document_type)
+                del self._documents[document_type]
+                modified = True
+            elif removed_paths:
+                entry['paths'] = {
+                    p for p in entry['paths']
+                    if not any(p[:len(r)] == r for r in removed_paths)
+                }
+                modified = True
+
+        if modified:
+            self.save()
+
+    def refresh(self,
+                db_schema: Schema,
+                discover: DiscoverFunc,
+                document_types: Optional[List[str]] = None) -> None:
+        """
+        Search paths to embedded documents again and store them
+        :param db_schema: current db schema
+        :param discover: function which takes a collection name and
+         document types stored there, and returns update paths of all
+         embedded documents found in collection
+        :param document_types: document types which collections should
+         be refreshed. All documents if omitted
+        :return:
+        """
+        if document_types is None:
+            self._documents.clear()
+        groups = group_by_collection(db_schema)
+        for collection_name, group in groups.items():
+            if document_types is not None and not set(group) & set(document_types):
+                continue
+
+            log.info('Searching embedded documents paths in %s...', collection_name)
+            self._add(collection_name, group, discover(collection_name, group))
+
+        self.save()
+
+    def _add(self,
+             collection_name: str,
+             document_types: List[str],
+             paths: Iterable[Sequence[str]]) -> None:
+        paths = {tuple(p) for p in paths}
+        for document_type in document_types:
+            self._documents[document_type] = {'collection': collection_name, 'paths': set(paths)}
+
+    def _is_actual(self, document_type: str, db_schema: Schema) -> bool:
+        entry = self._documents.get(document_type)
+        return entry is not None \
+            and entry['collection'] == db_schema[document_type].parameters['collection']
+
+    @staticmethod
+    def _diff_embedded_fields(old_schema: Schema,
+                              new_schema: Schema) -> Tuple[Set[FieldKey], Set[FieldKey]]:
+        """
+        Return embedded fields which were removed and which were
+        added or changed
+        :return: tuple(removed, changed), both are sets of
+         tuple(document type, field name)
+        """
+        removed, changed = set(), set()
+        for doctype in old_schema.keys() | new_schema.keys():
+            old_fields = old_schema.get(doctype, {})
+            new_fields = new_schema.get(doctype, {})
+            for field in old_fields.keys() | new_fields.keys():
+                old_field, new_field = old_fields.get(field), new_fields.get(field)
+                old_embedded = _is_embedded_ref(old_field)
+                new_embedded = _is_embedded_ref(new_field)
+                if not old_embedded and not new_embedded:
+                    continue
+
+                if new_field is None:
+                    removed.add((doctype, field))
+                    continue
+
+                if old_embedded and new_embedded:
+                    # Target type change does not touch data
+                    old_field = {k: v for k, v in old_field.items() if k != 'target_doctype'}
+                    new_field = {k: v for k, v in new_field.items() if k != 'target_doctype'}
+                if old_field != new_field:
+                    changed.add((doctype, field))
+
+        return removed, changed
@@ -4,7 +4,8 @@ __all__ = [
     'ActionError',
     'SchemaError',
     'MigrationError',
-    'InconsistencyError'
+    'InconsistencyError',
+    'MigrationInterrupted'
 ]
 
 
@@ -32,3 +33,9 @@ class InconsistencyError(MigrationError):
     """Error which could occur during migration if data inconsistency
     was detected
     """
+
+
+class MigrationInterrupted(MigrationError):
+    """Migration was interrupted by a signal. It could be resumed
+    from the last checkpoint
+    """
@@ -18,7 +18,7 @@ from mongoengine_migrate.mongo import check_empty_result
 from mongoengine_migrate.schema import Schema
 from mongoengine_migrate.utils import get_closest_parent, document_type_to_class_name, Diff, UNSET
 from .registry import CONVERTION_MATRIX
-from ..updater import ByPathContext, ByDocContext, DocumentUpdater
+from ..updater import ByPathContext, ByDocContext, ByPipelineContext, DocumentUpdater
 
 
 class FieldHandlerMeta(type):
@@ -184,12 +184,15 @@ class CommonFieldHandler(metaclass=FieldHandlerMeta):
             if diff.old in doc:
                 doc[diff.new] = doc.pop(diff.old)
 
+        def by_pipeline(ctx: ByPipelineContext):
+            return {diff.new: f'{ctx.document}.{diff.old}', diff.old: '$$REMOVE'}
+
         self._check_diff(updater, diff, False, str)
         if not diff.new or not diff.old:
             raise SchemaError(f"{updater.document_type}{updater.field_name}.db_field "
                               f"must be a non-empty string")
 
-        updater.update_combined(by_path, by_doc, False)
+        updater.update_combined(by_path, by_doc, False, by_pipeline_cb=by_pipeline)
 
     def change_required(self, updater: DocumentUpdater, diff: Diff):
         """
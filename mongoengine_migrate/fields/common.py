@@ -29,7 +29,7 @@ from mongoengine_migrate.mongo import (
     check_empty_result,
     mongo_version
 )
-from ..updater import ByPathContext, ByDocContext, DocumentUpdater
+from ..updater import ByPathContext, ByDocContext, ByPipelineContext, DocumentUpdater
 from mongoengine_migrate.utils import get_document_type, Diff, UNSET
 from .base import CommonFieldHandler
 from .converters import to_string, to_decimal
@@ -95,6 +95,18 @@ class StringFieldHandler(CommonFieldHandler):
             if match:
                 doc[updater.field_name] = doc[updater.field_name][:diff.new]
 
+        def by_pipeline(ctx: ByPipelineContext):
+            is_long_string = {'$cond': [
+                {'$eq': [{'$type': ctx.value}, 'string']},
+                {'$gt': [{'$strLenCP': ctx.value}, diff.new]},
+                False
+            ]}
+            return {updater.field_name: {'$cond': [
+                is_long_string,
+                {'$substrCP': [ctx.value, 0, diff.new]},
+                ctx.value
+            ]}}
+
         self._check_diff(updater, diff, True, int)
         if diff.new in (UNSET, None):
             return
@@ -102,7 +114,7 @@ class StringFieldHandler(CommonFieldHandler):
             diff.new = 0
 
         # Cut too long strings
-        updater.update_by_document(by_doc)
+        updater.update_by_pipeline(by_pipeline, by_doc)
 
     @mongo_version(min_version='3.6')
     def change_min_length(self, updater: DocumentUpdater, diff: Diff):
@@ -373,11 +385,21 @@ class ListFieldHandler(CommonFieldHandler):
             if match:
                 doc[updater.field_name] = doc[updater.field_name][:diff.new]
 
+        def by_pipeline(ctx: ByPipelineContext):
+            # $slice requires non-zero items count
+            cut = {'$slice': [ctx.value, diff.new]} if diff.new > 0 else {'$literal': []}
+            is_long_list = {'$cond': [
+                {'$isArray': ctx.value},
+                {'$gt': [{'$size': ctx.value}, diff.new]},
+                False
+            ]}
+            return {updater.field_name: {'$cond': [is_long_list, cut, ctx.value]}}
+
         self._check_diff(updater, diff, True, int)
         if diff.new in (UNSET, None):
             return
 
-        updater.update_by_document(by_doc)
+        updater.update_by_pipeline(by_pipeline, by_doc)
 
 
 class DictFieldHandler(CommonFieldHandler):
@@ -473,7 +495,7 @@ class ReferenceFieldHandler(CommonFieldHandler):
             if isinstance(doc.get(updater.field_name), bson.ObjectId):
                 doc[updater.field_name] = bson.DBRef(ctx.collection.name, doc[updater.field_name])
 
-        updater.update_by_document(by_doc)
+        updater.update_by_document(by_doc, {'$type': 'objectId'})
 
     def _dbref_to_objectid(self, updater: DocumentUpdater):
         def by_doc(ctx: ByDocContext):
@@ -481,7 +503,8 @@ class ReferenceFieldHandler(CommonFieldHandler):
             if isinstance(doc.get(updater.field_name), bson.DBRef):
                 doc[updater.field_name] = doc[updater.field_name].id
 
-        updater.update_by_document(by_doc)
+        # DBRef is stored as object
+        updater.update_by_document(by_doc, {'$type': 'object'})
 
     @classmethod
     def build_schema(
@@ -33,9 +33,16 @@ from dateutil.parser import parse as dateutil_parse
 
 from mongoengine_migrate.exceptions import MigrationError, InconsistencyError
 from mongoengine_migrate.mongo import (
-    check_empty_result
+    check_empty_result,
+    type_filter_except,
+    type_filter_only
+)
+from mongoengine_migrate.updater import (
+    ByPathContext,
+    ByDocContext,
+    ByPipelineContext,
+    DocumentUpdater
 )
-from mongoengine_migrate.updater import ByPathContext, ByDocContext, DocumentUpdater
 
 
 def nothing(*args, **kwargs):
@@ -74,7 +81,15 @@ def item_to_list(updater: DocumentUpdater, remove_cls_key=False):
             else:
                 ctx.document[updater.field_name] = []  # null -> []
 
-    updater.update_by_document(by_doc)
+    def by_pipeline(ctx: ByPipelineContext):
+        item = __remove_cls_key_expr(ctx.value) if remove_cls_key else ctx.value
+        return {updater.field_name: {'$cond': [
+            {'$isArray': ctx.value},
+            ctx.value,
+            {'$cond': [{'$eq': [ctx.value, None]}, {'$literal': []}, [item]]}
+        ]}}
+
+    updater.update_by_pipeline(by_pipeline, by_doc)
 
 
 def extract_from_list(updater: DocumentUpdater, item_type, remove_cls_key=False):
@@ -109,7 +124,22 @@ def extract_from_list(updater: DocumentUpdater, item_type, remove_cls_key=False)
             raise MigrationError(f'Could not extract item from non-list value '
                                  f'{updater.field_name}: {doc[updater.field_name]}')
 
-    updater.update_by_document(by_doc)
+    def by_pipeline(ctx: ByPipelineContext):
+        item = {'$arrayElemAt': [ctx.value, 0]}
+        if remove_cls_key:
+            item = __remove_cls_key_expr(item)
+        return {updater.field_name: {'$cond': [
+            {'$isArray': ctx.value},
+            {'$cond': [{'$gt': [{'$size': ctx.value}, 0]}, item, None]},
+            ctx.value
+        ]}}
+
+    # Strict policy requires item type checks, which could be made
+    # only in python
+    if updater.migration_policy.name == 'strict':
+        updater.update_by_document(by_doc)
+    else:
+        updater.update_by_pipeline(by_pipeline, by_doc)
 
 
 def remove_cls_key(updater: DocumentUpdater):
@@ -152,8 +182,7 @@ def to_object_id(updater: DocumentUpdater):
                                      f"(should be DBRef, ObjectId, manual ref, dynamic ref, "
                                      f"ObjectId string) in record {doc}")
 
-    # TODO: precheck if field actually contains value other than ObjectId
-    updater.update_by_document(by_doc)
+    updater.update_by_document(by_doc, type_filter_except('objectId', 'null'))
 
 
 def to_manual_ref(updater: DocumentUpdater):
@@ -283,8 +312,7 @@ def to_string(updater: DocumentUpdater):
                     raise MigrationError(f'Cannot convert value {updater.field_name}: '
                                          f'{doc[updater.field_name]} to string') from e
 
-    # TODO: precheck if field actually contains value other than string
-    updater.update_by_document(by_doc)
+    updater.update_by_document(by_doc, type_filter_except('string', 'null'))
 
 
 def to_int(updater: DocumentUpdater):
@@ -358,7 +386,9 @@ def to_uuid_bin(updater: DocumentUpdater):
 
     uuid_pattern = re.compile(r'\A[0-9a-z]{8}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{12}\Z',
                               re.IGNORECASE)
-    updater.update_by_document(by_doc)
+    # Binary data which is not UUID is rejected by callback on strict
+    # policy, and `$type` could not distinguish it
+    updater.update_by_document(by_doc, type_filter_except('null'))
 
 
 def to_url_string(updater: DocumentUpdater, check_only=False):
@@ -408,11 +438,32 @@ def __mongo_convert(updater: DocumentUpdater, target_type: str):
     Convert field to a given type in a given collection. `target_type`
     contains MongoDB type name, such as 'string', 'decimal', etc.
 
+    On MongoDB 4.2+ values of some source types are converted on
+    server side by `$convert`, where it gives the same result as
+    python conversion. Values of other types are converted by python
+
     https://docs.mongodb.com/manual/reference/operator/aggregation/convert/
     :param updater: DocumentUpdater object
     :param target_type: MongoDB type name
     :return:
     """
+    # BSON types of values which are left unchanged by callback on any
+    # policy for every target type. They are filtered out on server
+    # side. Decimal128 and binData with UUID are not instances of
+    # python types, so callback converts or rejects them
+    skip_types = {
+        'double': ('double', ),
+        'string': ('string', ),
+        'objectId': ('objectId', ),
+        'bool': ('bool', ),
+        'date': ('date', ),
+        'int': ('int', 'long', 'bool'),  # bool and Int64 are subclasses of int
+        'long': ('long', ),
+        'decimal': ('double', ),
+        'binary': (),
+        'object': ('object', )
+    }
+
     def by_doc(ctx: ByDocContext):
         # https://docs.mongodb.com/manual/reference/operator/aggregation/convert/
         type_map = {
@@ -441,4 +492,55 @@ def __mongo_convert(updater: DocumentUpdater, target_type: str):
                         raise MigrationError(f'Cannot convert value '
                                              f'{field_name}: {doc[field_name]} to type {t}') from e
 
-    updater.update_by_document(by_doc)
+    def by_pipeline(ctx: ByPipelineContext):
+        convert = {'input': ctx.value, 'to': pipeline_target}
+        if updater.migration_policy.name != 'strict':
+            convert['onError'] = ctx.value  # Keep value as is
+        expr = {'$convert': convert}
+        if target_type == 'bool':
+            # Any string is converted to true by $convert, but empty
+            # string is false in python
+            expr = {'$cond': [{'$eq': [{'$type': ctx.value}, 'string']},
+                              {'$ne': [ctx.value, '']},
+                              expr]}
+
+        # Values of other types are left for by_doc callback
+        return {updater.field_name: {'$cond': [
+            {'$in': [{'$type': ctx.value}, list(source_types)]},
+            expr,
+            ctx.value
+        ]}}
+
+    # Target types which `$convert` converts values of given source
+    # types to the same values as python does. E.g. dates are
+    # converted to numbers by `$convert`, whereas python fails, and
+    # python converts arrays to bool, whereas `$convert` fails.
+    # Decimal values are stored as double
+    pipeline_types = {
+        'double': ('double', ('int', 'long', 'bool')),
+        'objectId': ('objectId', ('string', )),
+        'bool': ('bool', ('int', 'long', 'double', 'string', 'objectId', 'date')),
+        'long': ('long', ('int', 'bool')),
+        'decimal': ('double', ('int', 'long', 'bool')),
+    }
+    skip = skip_types[target_type]
+    if target_type in pipeline_types:
+        pipeline_target, source_types = pipeline_types[target_type]
+        updater.update_by_pipeline(by_pipeline, by_doc, type_filter_only(*source_types))
+        skip += source_types
+
+    updater.update_by_document(by_doc, type_filter_except(*skip, 'null'))
+
+
+def __remove_cls_key_expr(value_expr):
+    """Return aggregation expression which removes '_cls' key from
+    a given value if it is an object
+    """
+    return {'$cond': [
+        {'$eq': [{'$type': value_expr}, 'object']},
+        {'$arrayToObject': {'$filter': {
+            'input': {'$objectToArray': value_expr},
+            'cond': {'$ne': ['$$this.k', '_cls']}
+        }}},
+        value_expr
+    ]}
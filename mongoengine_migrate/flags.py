@@ -24,6 +24,157 @@ mongo_version: Optional[str] = None
 database2: Optional[Database] = None
 
 
+#: MongoDB connect URI. Used by process workers in order to open
+#: their own connections
+mongo_uri: Optional[str] = None
+
+
+#: Number of workers which process documents during by_doc updates.
+#: If more than one, then collection is split into `_id` ranges, each
+#: one is scanned by a separate worker with its own cursor and bulk
+#: writer. 0 or 1 means sequential scan
+parallel_workers: int = 0
+
+
+#: Type of parallel workers: 'thread' or 'process'. Process workers
+#: require 'fork' start method
+parallel_executor: str = 'thread'
+
+
+#: Run by_doc updates as pipeline: documents are read by a separate
+#: thread, and changes are written by another thread using
+#: `database2` connection while callbacks are being called
+pipeline: bool = False
+
+
+#: Read documents in by_doc updates as raw BSON batches and decode
+#: only fields which a callback works with. Documents which could not
+#: contain such fields are skipped without decoding
+raw_scan: bool = False
+
+
+#: Make by_doc scans resumable. Documents are scanned in `_id` order
+#: and the last `_id` whose changes have been written is periodically
+#: stored in migrations collection. Interrupted migration continues
+#: from that point on the next run
+checkpoints: bool = False
+
+
+#: Size of random sample of documents which is used to find paths to
+#: embedded documents in a collection. 0 means to scan all documents.
+#: Paths which are present only in documents out of sample are missed
+embedded_paths_sample: int = 0
+
+
+#: Keep paths to embedded documents found in collections in
+#: migrations collection and reuse them in further actions and runs
+#: instead of searching them every time. See `EmbeddedCatalog`
+embedded_catalog: bool = False
+
+
+#: Queue updates of consecutive field actions which change the same
+#: collection and execute them by fewer collection passes: by_path
+#: updates are merged where possible, by_doc scans are chained into
+#: one scan. Ignored if `checkpoints` is set. See `ActionPlanner`
+fuse_actions: bool = False
+
+
+#: Split every `update_many` call made by by_path updates into chunks
+#: of `_id` range containing given documents count, which limits oplog
+#: bursts and write locks on huge collections. Chunks are processed by
+#: `parallel_workers` threads. 0 means to update the whole collection
+#: by one call. See `run_in_chunks`
+by_path_chunk_size: int = 0
+
+
+#: Seconds which a worker waits after every by_path update chunk
+by_path_chunk_pause: float = 0.0
+
+
+#: Slow down and pause writes when replication lag of secondaries
+#: exceeds a half of given seconds and given seconds appropriately.
+#: 0 means no throttling. See `ReplicationThrottle`
+max_replication_lag: float = 0.0
+
+
+#: Min seconds between replica set status polls made by throttle
+replication_lag_poll_interval: float = 1.0
+
+
+#: Read documents scanned by by_doc updates and probed by embedded
+#: documents search from secondaries. Changes are written to the
+#: primary only if fields which they change have not been changed
+#: since they were read
+secondary_reads: bool = False
+
+
+#: Max replication lag in seconds of a secondary which documents could
+#: be read from if `secondary_reads` is set. 0 means no limit
+max_staleness: int = 0
+
+#: The least max staleness in seconds which MongoDB accepts
+MIN_MAX_STALENESS = 90
+
+
+#: Path to file where JSON report with performance metrics of every
+#: action of a migration run is written. See `MetricsReport`
+metrics_report: Optional[str] = None
+
+
+#: Measure time and reply size of every MongoDB command made by
+#: actions and log the slowest commands. See `CommandProfiler`
+profile_commands: bool = False
+
+
+#: Directory where cProfile stats of every action are written to.
+#: Memory peak of actions is measured as well. See `profile_action`
+profile_dir: Optional[str] = None
+
+
+#: Number of source lines allocated the most of memory which are
+#: written for every action if `profile_dir` is set. 0 means none
+profile_memory_top: int = 0
+
+
+#: Log progress of by_doc scans and chunked by_path updates every
+#: given seconds. 0 means no progress reports. Off by default, since
+#: every pass makes one more query to get documents count. See
+#: `ProgressReporter`
+progress_interval: float = 0.0
+
+
+#: Path to file where progress reports are appended as JSON lines
+progress_file: Optional[str] = None
+
+
+#: How the expected documents count of a pass is obtained: 'estimated'
+#: (collection size from metadata) or 'exact' (count by pass filter)
+progress_total: str = 'estimated'
+
+
+#: Store schema snapshot after every given count of migrations when
+#: schema is replayed. 0 means no new snapshots. See `SchemaSnapshots`
+schema_snapshot_interval: int = 0
+
+
+#: Max requests count in bulk write buffer
+bulk_buffer_length: int = 10000
+
+
+#: Max summary size of requests in bulk write buffer in bytes.
+#: 0 means no limit. Off by default, since every buffered request
+#: has to be encoded to BSON to count its size. Pay attention: max
+#: BSON size is 16Mb, however the driver splits bulk writes by
+#: message size itself
+#: https://docs.mongodb.com/manual/reference/limits/#bson-documents
+bulk_buffer_bytes: int = 0
+
+
+#: Max seconds which a request could stay in bulk write buffer.
+#: 0 means no limit
+bulk_buffer_delay: float = 10.0
+
+
 #: If this prefix contains in collection name then this document
 #: is considered as embedded
 EMBEDDED_DOCUMENT_NAME_PREFIX = '~'
@@ -33,10 +184,24 @@ EMBEDDED_DOCUMENT_NAME_PREFIX = '~'
 DOCUMENT_NAME_SEPARATOR = '->'
 
 
-#: Maximum memory items buffer size on bulk write operations
-#: Pay attention: max BSON size is 16Mb
-#: https://docs.mongodb.com/manual/reference/limits/#bson-documents
-BULK_BUFFER_LENGTH = 10000
+#: How many split points per worker are sampled in order to divide
+#: collection into `_id` ranges for parallel scan
+PARALLEL_SAMPLES_PER_WORKER = 32
+
+
+#: Documents count which pipeline reader passes to callbacks at once
+PIPELINE_BATCH_SIZE = 1000
+
+
+#: Max count of batches of documents waiting for callbacks and of
+#: bulk writes waiting to be written in pipeline
+PIPELINE_QUEUE_SIZE = 4
+
+
+#: How many times a document is read from the primary and written
+#: again if its changes were not written because it was changed after
+#: being read from a secondary
+SECONDARY_READ_WRITE_RETRIES = 5
 
 
 #: Separator which separates parts in index name
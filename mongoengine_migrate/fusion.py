@@ -0,0 +1,435 @@
+"""Deferred execution of updates made for several paths or by several
+consecutive actions, which allows to merge them into fewer commands
+and collection passes. See `FusionSession`
+"""
+__all__ = [
+    'FusionSession',
+    'FusedCollection',
+    'fusion_scope',
+    'get_current_session',
+    'can_fuse_scan',
+    'match_scan_filter'
+]
+
+import logging
+import re
+from contextlib import contextmanager
+from typing import Optional, List, Any, Iterable, Dict
+
+import wrapt
+from pymongo import UpdateMany
+from pymongo.collection import Collection
+
+from mongoengine_migrate.chunks import restrict_filter, run_in_chunks
+from mongoengine_migrate.metrics import MeasuredCollection
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Update operators which could be merged into one update
+MERGEABLE_OPERATORS = {'$set', '$unset', '$rename'}
+
+#: Session which defers updates currently. See `fusion_scope`
+_current_session: Optional['FusionSession'] = None
+
+
+#: Array filter identifier in update path, such as `$[elem1]`
+_IDENTIFIER_RE = re.compile(r'\$\[([a-z][a-zA-Z0-9]*)\]')
+
+
+class _PendingUpdate:
+    """One or more merged `update_many` calls"""
+    def __init__(self,
+                 collection: Collection,
+                 fltr: dict,
+                 update: dict,
+                 array_filters: Optional[List[dict]] = None):
+        self.collection = collection
+        self.filters = [fltr]
+        self.update = {op: dict(fields) for op, fields in update.items()}
+        self.array_filters = list(array_filters or [])
+        self.guard = _get_guard(fltr, update)
+        self.count = 1
+
+    def merge(self,
+              collection: Collection,
+              fltr: dict,
+              update: dict,
+              array_filters: Optional[List[dict]] = None) -> bool:
+        """
+        Try to merge an update which should be executed after this
+        one. Return False if it could not be merged
+        """
+        if collection.name != self.collection.name:
+            return False
+        if (self.update.keys() | update.keys()) - MERGEABLE_OPERATORS:
+            return False
+
+        touched = list(_touched_paths(self.update))
+        # Updates could not touch the same fields. The next update
+        # filter must not depend on fields changed by this one
+        if _overlap(touched, _touched_paths(update)) or _overlap(touched, _filter_paths(fltr)):
+            return False
+
+        if self.filters == [fltr]:
+            pass
+        elif self.guard is not None and self.guard == _get_guard(fltr, update):
+            # Both updates do nothing on documents which their filters
+            # do not match, so they could be applied to union of them
+            self.filters.append(fltr)
+        else:
+            return False
+
+        update, array_filters = self._rename_identifiers(update, array_filters or [])
+        for op, fields in update.items():
+            self.update.setdefault(op, {}).update(fields)
+        self.array_filters.extend(f for f in array_filters if f not in self.array_filters)
+        self.count += 1
+        return True
+
+    def execute(self) -> None:
+        if self.count > 1:
+            log.debug('> Merged %d updates of %s into one', self.count, self.collection.name)
+        self.collection.update_many(self._get_filter(), self.update,
+                                    array_filters=self.array_filters or None)
+
+    def as_request(self, id_fltr: Optional[dict] = None) -> UpdateMany:
+        """
+        Return the update as bulk write request
+        :param id_fltr: optional `_id` filter expression which
+         restricts the update
+        :return:
+        """
+        return UpdateMany(restrict_filter(self._get_filter(), id_fltr), self.update,
+                          array_filters=self.array_filters or None)
+
+    def _get_filter(self) -> dict:
+        return self.filters[0] if len(self.filters) == 1 else {'$or': self.filters}
+
+    def _rename_identifiers(self, update: dict, array_filters: List[dict]):
+        """
+        Rename array filter identifiers of the next update which are
+        already used by this one with another condition. Array filters
+        of every update are built with the same identifiers
+        """
+        used = _get_identifiers(self.array_filters)
+        renames = {}
+        for identifier, afilters in _get_identifiers(array_filters).items():
+            if identifier in used and afilters != used[identifier]:
+                renames[identifier] = f'{identifier}u{self.count}'
+        if not renames:
+            return update, array_filters
+
+        def rename_path(path: str) -> str:
+            return _IDENTIFIER_RE.sub(
+                lambda m: f'$[{renames.get(m.group(1), m.group(1))}]', path
+            )
+
+        def rename_key(key: str) -> str:
+            identifier, sep, rest = key.partition('.')
+            return f'{renames.get(identifier, identifier)}{sep}{rest}'
+
+        update = {
+            op: {rename_path(path): value for path, value in fields.items()}
+            for op, fields in update.items()
+        }
+        array_filters = [{rename_key(k): v for k, v in f.items()} for f in array_filters]
+        return update, array_filters
+
+
+class _PendingScan:
+    """One or more by_doc scans of a collection chained together"""
+    def __init__(self, updater, scan):
+        self.jobs = [(updater, scan)]
+
+    def merge(self, updater, scan) -> bool:
+        first_scan = self.jobs[0][1]
+        if scan.collection.name != first_scan.collection.name:
+            return False
+
+        self.jobs.append((updater, scan))
+        return True
+
+    def execute(self) -> None:
+        updater = self.jobs[0][0]
+        updater._run_fused_scan(self.jobs)
+
+
+class FusionSession:
+    """
+    Queue of updates made by consecutive actions. Updates are not
+    executed immediately, but queued in order and executed by `flush`.
+    An update is merged with the previous one in queue if it's
+    possible to do that without changing the result:
+
+    * `update_many` calls of a collection made by by_path callbacks
+      are merged into one call with merged `$set`/`$unset`/`$rename`
+      operators and array filters if their filters are equal, or if
+      both of them do nothing on documents which their filters do not
+      match (such as `$unset` of a field which existence is checked by
+      filter). Updates which touch the same fields or which filter
+      depends on fields changed by previous update are not merged.
+      Consecutive updates of a collection which could not be merged
+      are sent by one ordered `bulk_write`
+    * by_doc scans of a collection are chained into one scan, where
+      callbacks of every scan are called in order for every document
+      matched by scan filter. Only scans which filters could be
+      checked in python are deferred (see `can_fuse_scan`)
+
+    Any other operation on a collection (such as a read made by a
+    callback) flushes the queue first, so it sees all previous
+    changes.
+    """
+    def __init__(self):
+        self._queue: List[Any] = []
+
+    def add_update(self,
+                   collection: Collection,
+                   fltr: dict,
+                   update: dict,
+                   array_filters: Optional[List[dict]] = None) -> None:
+        """Queue `update_many` call"""
+        last = self._queue[-1] if self._queue else None
+        if not isinstance(last, _PendingUpdate) \
+                or not last.merge(collection, fltr, update, array_filters):
+            self._queue.append(_PendingUpdate(collection, fltr, update, array_filters))
+
+    def add_scan(self, updater, scan) -> None:
+        """
+        Queue a by_doc scan
+        :param updater: DocumentUpdater object which performs the scan
+        :param scan: DocumentScan object
+        :return:
+        """
+        last = self._queue[-1] if self._queue else None
+        if not isinstance(last, _PendingScan) or not last.merge(updater, scan):
+            self._queue.append(_PendingScan(updater, scan))
+
+    def wrap(self, collection: Collection) -> 'FusedCollection':
+        """Return collection which `update_many` calls are queued"""
+        return FusedCollection(collection, self)
+
+    def flush(self) -> None:
+        """
+        Execute queued updates. Consecutive updates of a collection
+        which could not be merged are sent by one ordered `bulk_write`
+        """
+        queue, self._queue = self._queue, []
+        batch: List[_PendingUpdate] = []
+        for item in queue:
+            if isinstance(item, _PendingUpdate) \
+                    and (not batch or batch[0].collection.name == item.collection.name):
+                batch.append(item)
+                continue
+
+            self._write_updates(batch)
+            batch = []
+            if isinstance(item, _PendingUpdate):
+                batch.append(item)
+            else:
+                item.execute()
+
+        self._write_updates(batch)
+
+    def discard(self) -> None:
+        """Drop queued updates"""
+        self._queue = []
+
+    @staticmethod
+    def _write_updates(updates: List[_PendingUpdate]) -> None:
+        if len(updates) == 1:
+            updates[0].execute()
+        elif updates:
+            collection = updates[0].collection
+            log.debug('> Writing %d updates of %s by one bulk', len(updates), collection.name)
+            run_in_chunks(
+                collection,
+                lambda id_fltr: collection.bulk_write([u.as_request(id_fltr) for u in updates],
+                                                      ordered=True)
+            )
+            if isinstance(collection, MeasuredCollection):
+                # Chunks of a bulk are parts of the same passes
+                collection.record(passes=len(updates))
+
+
+def make_flushing_method(func_name: str):
+    def w(instance, *args, **kwargs):
+        instance._self_session.flush()
+        return getattr(instance.__wrapped__, func_name)(*args, **kwargs)
+
+    return w
+
+
+class FusedCollection(wrapt.ObjectProxy):
+    """
+    Collection proxy which queues `update_many` calls to session.
+    Other operations flush the session queue before they are executed.
+
+    Queued `update_many` returns None
+    """
+    def __init__(self, wrapped: Collection, session: FusionSession):
+        super().__init__(wrapped)
+        self._self_session = session
+
+    def update_many(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        mergeable = isinstance(update, dict) and not upsert and not kwargs
+        if not mergeable:
+            self._self_session.flush()
+            return self.__wrapped__.update_many(filter, update, upsert=upsert,
+                                                array_filters=array_filters, **kwargs)
+
+        self._self_session.add_update(self.__wrapped__, filter, update, array_filters)
+
+    find = make_flushing_method('find')
+    find_one = make_flushing_method('find_one')
+    find_raw_batches = make_flushing_method('find_raw_batches')
+    count_documents = make_flushing_method('count_documents')
+    estimated_document_count = make_flushing_method('estimated_document_count')
+    distinct = make_flushing_method('distinct')
+    aggregate = make_flushing_method('aggregate')
+    aggregate_raw_batches = make_flushing_method('aggregate_raw_batches')
+    insert_one = make_flushing_method('insert_one')
+    insert_many = make_flushing_method('insert_many')
+    replace_one = make_flushing_method('replace_one')
+    update_one = make_flushing_method('update_one')
+    delete_one = make_flushing_method('delete_one')
+    delete_many = make_flushing_method('delete_many')
+    bulk_write = make_flushing_method('bulk_write')
+    find_one_and_update = make_flushing_method('find_one_and_update')
+    find_one_and_replace = make_flushing_method('find_one_and_replace')
+    find_one_and_delete = make_flushing_method('find_one_and_delete')
+    create_index = make_flushing_method('create_index')
+    drop_index = make_flushing_method('drop_index')
+    rename = make_flushing_method('rename')
+    drop = make_flushing_method('drop')
+
+
+@contextmanager
+def fusion_scope(session: Optional[FusionSession]):
+    """
+    Context manager which sets a session where updates are queued.
+    None means to execute updates immediately
+    :param session: session object or None
+    """
+    global _current_session
+
+    previous = _current_session
+    _current_session = session
+    try:
+        yield
+    finally:
+        _current_session = previous
+
+
+def get_current_session() -> Optional[FusionSession]:
+    """Return session set by `fusion_scope` or None"""
+    return _current_session
+
+
+def can_fuse_scan(find_fltr: dict) -> bool:
+    """
+    Return True if by_doc scan with given filter could be chained with
+    other scans, i.e. if its filter could be checked in python by
+    `match_scan_filter`. Such filter could contain only `$exists: true`
+    checks and `_cls` equality
+    """
+    return all(
+        (key == '_cls' and isinstance(cond, str)) or cond == {'$exists': True}
+        for key, cond in find_fltr.items()
+    )
+
+
+def match_scan_filter(document: dict, find_fltr: dict) -> bool:
+    """
+    Check if a document matches by_doc scan filter which satisfies
+    `can_fuse_scan`. Dotpaths are resolved the same way as MongoDB
+    does: through arrays and array indexes
+    """
+    for key, cond in find_fltr.items():
+        if key == '_cls':
+            if document.get('_cls') != cond:
+                return False
+        elif not _dotpath_exists(document, key.split('.')):
+            return False
+
+    return True
+
+
+def _dotpath_exists(value: Any, parts: List[str]) -> bool:
+    if not parts:
+        return True
+
+    if isinstance(value, dict):
+        return parts[0] in value and _dotpath_exists(value[parts[0]], parts[1:])
+    if isinstance(value, list):
+        if parts[0].isdigit() and int(parts[0]) < len(value) \
+                and _dotpath_exists(value[int(parts[0])], parts[1:]):
+            return True
+        return any(_dotpath_exists(item, parts) for item in value if isinstance(item, dict))
+
+    return False
+
+
+def _get_guard(fltr: dict, update: dict) -> Optional[dict]:
+    """
+    If update does nothing on documents which are not matched by
+    filter, i.e. it unsets or renames a field which existence is
+    checked by filter, then return the rest of filter conditions.
+    Return None otherwise. Updates through arrays are not considered,
+    since array update fails on a document where array is missing
+    """
+    if len(update) != 1:
+        return None
+
+    (op, fields), = update.items()
+    if op not in ('$unset', '$rename') or len(fields) != 1:
+        return None
+    path, = fields
+    if '$' in path or fltr.get(path) != {'$exists': True}:
+        return None
+
+    return {k: v for k, v in fltr.items() if k != path}
+
+
+def _get_identifiers(array_filters: List[dict]) -> Dict[str, List[dict]]:
+    """Return array filters grouped by identifiers they define"""
+    res = {}
+    for afilter in array_filters:
+        for key in afilter:
+            res.setdefault(key.split('.', 1)[0], []).append(afilter)
+
+    return res
+
+
+def _touched_paths(update: dict) -> Iterable[str]:
+    for op, fields in update.items():
+        for path, value in fields.items():
+            yield _strip_positional(path)
+            if op == '$rename':
+                yield _strip_positional(value)
+
+
+def _filter_paths(fltr: Any) -> Iterable[str]:
+    if isinstance(fltr, dict):
+        for key, value in fltr.items():
+            if not key.startswith('$'):
+                yield _strip_positional(key)
+            yield from _filter_paths(value)
+    elif isinstance(fltr, (list, tuple)):
+        for item in fltr:
+            yield from _filter_paths(item)
+
+
+def _strip_positional(path: str) -> str:
+    """Remove array positional operators and indexes from dotpath"""
+    return '.'.join(p for p in path.split('.') if not p.startswith('$') and not p.isdigit())
+
+
+def _overlap(paths1: Iterable[str], paths2: Iterable[str]) -> bool:
+    """Return True if any path of one list is equal to or is a prefix
+    of any path of another one
+    """
+    paths2 = list(paths2)
+    return any(
+        a == b or a.startswith(b + '.') or b.startswith(a + '.')
+        for a in paths1 for b in paths2
+    )
@@ -44,9 +44,26 @@ class Migration(Slotinit):
     * dependencies -- name list of migrations which this migration is
       dependent by
     * applied -- is migration was applied or not. Taken from database
+    * path -- migration file path
+    * file_hash -- sha256 hex digest of migration file if known
+    * module -- migration python module. If `module_loader` function
+      is set instead, then module is loaded by it on first access
+    * policy_name -- policy name if it's known without loading module
     """
-    __slots__ = ('name', 'dependencies', 'applied', 'module')
-    defaults = {'applied': False}
+    __slots__ = ('name', 'dependencies', 'applied', 'path', 'file_hash', 'module_loader',
+                 'policy_name', '_module')
+    defaults = {'applied': False, 'path': None, 'file_hash': None, 'module_loader': None,
+                'policy_name': None}
+
+    def __init__(self, **kwargs):
+        self._module = kwargs.pop('module', None)
+        super().__init__(**kwargs)
+
+    @property
+    def module(self):
+        if self._module is None and self.module_loader is not None:
+            self._module = self.module_loader()
+        return self._module
 
     def get_actions(self):
         # FIXME: type checking, attribute checking
@@ -55,7 +72,9 @@ class Migration(Slotinit):
 
     @property
     def policy(self) -> MigrationPolicy:
-        attr = getattr(self.module, 'policy', MigrationPolicy.strict.name)
+        attr = self.policy_name
+        if attr is None:
+            attr = getattr(self.module, 'policy', MigrationPolicy.strict.name)
         return getattr(MigrationPolicy, attr)
 
 
@@ -1,5 +1,6 @@
 __all__ = [
     'import_module',
+    'load_migration_module',
     'collect_models_schema',
     'MongoengineMigrate',
 ]
@@ -10,6 +11,7 @@ import logging
 import random
 import re
 import string
+from contextlib import contextmanager, nullcontext
 from datetime import timezone, datetime
 from pathlib import Path
 from types import ModuleType
@@ -18,7 +20,7 @@ from typing import Tuple, Dict, List, Type, Optional, Iterable
 import pymongo.database
 import pymongo.errors
 from bson import CodecOptions
-from dictdiffer import patch, swap
+from dictdiffer import swap
 from jinja2 import Environment
 from mongoengine.base import _document_registry
 from mongoengine.document import Document, BaseDocument
@@ -26,12 +28,23 @@ from pymongo import MongoClient
 
 import mongoengine_migrate.flags as runtime_flags
 from mongoengine_migrate.actions.factory import build_actions_chain
-from mongoengine_migrate.actions.base import BaseIndexAction
+from mongoengine_migrate.actions.base import BaseAction, BaseIndexAction
+from mongoengine_migrate.bulk import bulk_limits
+from mongoengine_migrate.checkpoints import action_scope
+from mongoengine_migrate.embedded_catalog import EmbeddedCatalog, catalog_scope
 from mongoengine_migrate.exceptions import MongoengineMigrateError, ActionError, MigrationGraphError
 from mongoengine_migrate.fields.registry import type_key_registry
 from mongoengine_migrate.graph import Migration, MigrationsGraph, MigrationPolicy
+from mongoengine_migrate.metrics import ActionMetrics, MetricsReport
+from mongoengine_migrate.migrations_index import MigrationsIndex
+from mongoengine_migrate.planner import ActionPlanner
+from mongoengine_migrate.profiling import get_event_listeners, profile_action
 from mongoengine_migrate.query_tracer import DatabaseQueryTracer
+from mongoengine_migrate.updater import DocumentUpdater
 from mongoengine_migrate.schema import Schema
+from mongoengine_migrate.schema_patch import SchemaUndoLog, apply_patch, snapshot_schema
+from mongoengine_migrate.snapshots import SchemaSnapshots
+from mongoengine_migrate.throttle import ReplicationThrottle, throttle_scope
 from mongoengine_migrate.utils import (
     get_closest_parent,
     get_document_type,
@@ -88,6 +101,20 @@ def import_module(path: str) -> Tuple[ModuleType, str]:
             attrs.append(attr)
 
 
+def load_migration_module(name: str, path: Path) -> ModuleType:
+    """
+    Execute migration module from file
+    :param name: module name
+    :param path: module file path
+    :return: module object
+    """
+    log.debug('> Loading migration file %s', path)
+    spec = importlib.util.spec_from_file_location(name, str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 def collect_models_schema() -> Schema:
     """
     Transform all available mongoengine document objects to db schema
@@ -240,11 +267,11 @@ class MongoengineMigrate:
         self.migrations_collection_name = collection_name
         self.migration_dir = migrations_dir
         self._kwargs = kwargs
-        self.client = MongoClient(mongo_uri)
+        self.client = MongoClient(mongo_uri, event_listeners=get_event_listeners())
         # Another MongoClient for additional operations which should
         # be performed in separate connection such as parallel bulk
         # writes
-        self.client2 = MongoClient(mongo_uri)
+        self.client2 = MongoClient(mongo_uri, event_listeners=get_event_listeners())
 
         # Initiate immediate connect to MongoDB in order to ensure
         # that it is accessible
@@ -291,6 +318,47 @@ class MongoengineMigrate:
             codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
         )
 
+    @functools.cached_property
+    def embedded_catalog(self) -> EmbeddedCatalog:
+        """Return catalog of paths to embedded documents"""
+        return EmbeddedCatalog(self.migration_collection)
+
+    @functools.cached_property
+    def replication_throttle(self) -> Optional[ReplicationThrottle]:
+        """Return throttle of writes by replication lag or None if
+        throttling is not enabled
+        """
+        if not runtime_flags.max_replication_lag or runtime_flags.dry_run:
+            return None
+
+        return ReplicationThrottle(self.client,
+                                   runtime_flags.max_replication_lag,
+                                   runtime_flags.replication_lag_poll_interval)
+
+    def refresh_embedded_catalog(self, document_types: Optional[List[str]] = None):
+        """
+        Search paths to embedded documents in collections again and
+        write them to catalog
+        :param document_types: document types which collections should
+         be searched. All documents if omitted
+        :return:
+        """
+        log.debug('Loading schema from database...')
+        db_schema = self.load_db_schema()
+
+        unknown = set(document_types or ()) - db_schema.keys()
+        if unknown:
+            raise MongoengineMigrateError(f'Unknown document types: {", ".join(sorted(unknown))}')
+
+        def discover(collection_name: str, document_types: List[str]):
+            updater = DocumentUpdater(self.db, document_types[0], db_schema, '',
+                                      MigrationPolicy.strict)
+            return updater._find_all_embedded_fields(self.db[collection_name],
+                                                     document_types,
+                                                     db_schema)
+
+        self.embedded_catalog.refresh(db_schema, discover, document_types)
+
     def get_db_migration_names(self) -> Iterable[str]:
         """
         Return iterable with migration names was written in db in
@@ -343,8 +411,11 @@ class MongoengineMigrate:
                         directory: Path,
                         namespace: str = f"{__name__}._migrations") -> Iterable[Migration]:
         """
-        Load migrations python modules located in a given directory.
-        Every module is loaded on a given namespace. Function skips
+        Load migrations located in a given directory. Dependencies and
+        policy are read from modules source (see `MigrationsIndex`),
+        modules themselves are loaded on a given namespace only when
+        their actions are requested. Module is loaded immediately if
+        its dependencies could not be read from source. Function skips
         modules which names are started from double underscore
         :param directory: directory where modules will be searhed for
         :param namespace: namespace name where module names will be
@@ -355,22 +426,36 @@ class MongoengineMigrate:
         if not directory.exists():
             raise MongoengineMigrateError(f"Directory '{directory}' does not exist")
 
+        index = MigrationsIndex(directory)
         for module_file in directory.glob("*.py"):
             if module_file.name.startswith("__"):
                 continue
 
-            log.debug('> Loading migration file %s', module_file)
             migration_name = module_file.stem
-            spec = importlib.util.spec_from_file_location(
-                f"{namespace}.{migration_name}", str(module_file)
-            )
-            migration_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(migration_module)
-            yield Migration(
-                name=migration_name,
-                module=migration_module,
-                dependencies=migration_module.dependencies
-            )
+            module_loader = functools.partial(load_migration_module,
+                                              f"{namespace}.{migration_name}",
+                                              module_file)
+            entry = index.get(module_file)
+            if 'dependencies' in entry:
+                yield Migration(
+                    name=migration_name,
+                    dependencies=entry['dependencies'],
+                    policy_name=entry['policy'] or MigrationPolicy.strict.name,
+                    path=str(module_file),
+                    file_hash=entry['hash'],
+                    module_loader=module_loader
+                )
+            else:
+                migration_module = module_loader()
+                yield Migration(
+                    name=migration_name,
+                    module=migration_module,
+                    dependencies=migration_module.dependencies,
+                    path=str(module_file),
+                    file_hash=entry['hash']
+                )
+
+        index.save()
 
     def build_graph(self) -> MigrationsGraph:
         """Build migrations graph with all migration modules"""
@@ -404,6 +489,13 @@ class MongoengineMigrate:
          will be loaded
         :return:
         """
+        with self._collect_metrics('upgrade') as report:
+            self._upgrade(migration_name, graph, report)
+
+    def _upgrade(self,
+                 migration_name: str,
+                 graph: Optional[MigrationsGraph],
+                 report: MetricsReport):
         if graph is None:
             log.debug('Loading migration files...')
             graph = self.build_graph()
@@ -414,25 +506,30 @@ class MongoengineMigrate:
             raise MigrationGraphError(f'Migration {migration_name} not found')
 
         db = self.db
+        planner = ActionPlanner()
         for migration in graph.walk_down(graph.initial, unapplied_only=True):
             log.info('Upgrading %s...', migration.name)
             for idx, action_object in enumerate(migration.get_actions(), start=1):
                 log.debug('> [%d] %s', idx, str(action_object))
                 if not action_object.dummy_action and not runtime_flags.schema_only:
-                    action_object.prepare(db, left_schema, migration.policy)
-                    action_object.run_forward()
-                    action_object.cleanup()
+                    # Updates of action could be deferred by planner
+                    # after schema was patched by next actions
+                    self._run_action(action_object, db, snapshot_schema(left_schema), migration,
+                                     idx, True, planner, report)
 
                 try:
-                    left_schema = patch(action_object.to_schema_patch(left_schema), left_schema)
+                    undo_log = apply_patch(action_object.to_schema_patch(left_schema), left_schema)
                 except (TypeError, ValueError, KeyError) as e:
                     raise ActionError(
                         f"Unable to apply schema patch of {action_object!r}. More likely that the "
                         f"schema is corrupted. You can use schema repair tools to fix this issue"
                     ) from e
+                self._update_embedded_catalog(undo_log)
 
             graph.migrations[migration.name].applied = True
 
+            with throttle_scope(self.replication_throttle):
+                planner.flush()
             if not runtime_flags.dry_run:
                 log.debug('Writing db schema and migrations graph...')
                 self.write_db_schema(left_schema)
@@ -451,6 +548,13 @@ class MongoengineMigrate:
          will be loaded
         :return:
         """
+        with self._collect_metrics('downgrade') as report:
+            self._downgrade(migration_name, graph, report)
+
+    def _downgrade(self,
+                   migration_name: str,
+                   graph: Optional[MigrationsGraph],
+                   report: MetricsReport):
         if graph is None:
             log.debug('Loading migration files...')
             graph = self.build_graph()
@@ -461,24 +565,30 @@ class MongoengineMigrate:
             raise MigrationGraphError(f'Migration {migration_name} not found')
 
         log.debug('Precalculating schema diffs...')
-        # Collect schema diffs across all migrations
-        migration_diffs = {}  # {migration_name: [action1_diff, ...]}
-        temp_left_schema = Schema()
-        for migration in graph.walk_down(graph.initial, unapplied_only=False):
-            migration_diffs[migration.name] = []
-            for action in migration.get_actions():
-                forward_patch = action.to_schema_patch(temp_left_schema)
-                migration_diffs[migration.name].append(forward_patch)
+        # Collect schema diffs of migrations which will be downgraded.
+        # Replay starts from the nearest schema snapshot before them
+        migrations = list(graph.walk_down(graph.initial, unapplied_only=False))
+        downgraded = set()
+        for migration in graph.walk_up(graph.last, applied_only=True):
+            if migration.name == migration_name:
+                break
+            downgraded.add(migration.name)
+        positions = [i for i, m in enumerate(migrations) if m.name in downgraded]
 
-                try:
-                    temp_left_schema = patch(forward_patch, temp_left_schema)
-                except (TypeError, ValueError, KeyError) as e:
-                    raise ActionError(
-                        f"Unable to apply schema patch of {action!r}. More likely that the "
-                        f"schema is corrupted. You can use schema repair tools to fix this issue"
-                    ) from e
+        migration_diffs = {}  # {migration_name: [action1_diff, ...]}
+        if positions:
+            snapshots = SchemaSnapshots(self.migration_collection, migrations)
+            start, temp_left_schema = snapshots.find(positions[0])
+            if temp_left_schema is None:
+                temp_left_schema = Schema()
+            for position in range(start, positions[-1] + 1):
+                migration = migrations[position]
+                migration_diffs[migration.name] = self._replay_migration(migration,
+                                                                         temp_left_schema)
+                snapshots.save(position + 1, temp_left_schema)
 
         db = self.db
+        planner = ActionPlanner()
         for migration in graph.walk_up(graph.last, applied_only=True):
             if migration.name == migration_name:
                 break  # We've reached the target migration
@@ -494,7 +604,7 @@ class MongoengineMigrate:
                 log.debug('> [%d] %s', idx, str(action_object))
 
                 try:
-                    left_schema = patch(list(swap(action_diff)), left_schema)
+                    undo_log = apply_patch(list(swap(action_diff)), left_schema)
                 except (TypeError, ValueError, KeyError) as e:
                     raise ActionError(
                         f"Unable to apply schema patch of {action_object!r}. More likely that the "
@@ -502,12 +612,14 @@ class MongoengineMigrate:
                     ) from e
 
                 if not action_object.dummy_action and not runtime_flags.schema_only:
-                    action_object.prepare(db, left_schema, migration.policy)
-                    action_object.run_backward()
-                    action_object.cleanup()
+                    self._run_action(action_object, db, snapshot_schema(left_schema), migration,
+                                     idx, False, planner, report)
+                self._update_embedded_catalog(undo_log)
 
             graph.migrations[migration.name].applied = False
 
+            with throttle_scope(self.replication_throttle):
+                planner.flush()
             if not runtime_flags.dry_run:
                 log.debug('Writing db schema and migrations graph...')
                 self.write_db_schema(left_schema)
@@ -515,6 +627,88 @@ class MongoengineMigrate:
 
         self._verify_schema(left_schema)
 
+    def _run_action(self,
+                    action_object: BaseAction,
+                    db: pymongo.database.Database,
+                    left_schema: Schema,
+                    migration: Migration,
+                    action_index: int,
+                    forward: bool,
+                    planner: ActionPlanner,
+                    report: MetricsReport) -> None:
+        """
+        Prepare and run an action in a given direction
+        :param action_object: action to run
+        :param db: database object
+        :param left_schema: db schema before the action
+        :param migration: migration which the action belongs to
+        :param action_index: action index in migration, starting from 1
+        :param forward: run forward if True, backward otherwise
+        :param planner: planner which fuses updates of the action with
+         updates of neighbour actions
+        :param report: report which action metrics are added to
+        :return:
+        """
+        measure = report.measure(migration.name, action_index, str(action_object), forward)
+        with measure as metrics, \
+                self._profile_action(action_object, migration, action_index, forward, metrics):
+            action_object.prepare(db, left_schema, migration.policy)
+            scope = action_scope(self.migration_collection, migration.name, action_index, forward)
+            catalog = self.embedded_catalog if runtime_flags.embedded_catalog else None
+            with planner.action_scope(action_object, left_schema), scope, \
+                    catalog_scope(catalog), \
+                    bulk_limits(**(action_object.bulk_options or {})), \
+                    throttle_scope(self.replication_throttle):
+                if forward:
+                    action_object.run_forward()
+                else:
+                    action_object.run_backward()
+        action_object.cleanup()
+
+    @staticmethod
+    def _profile_action(action_object: BaseAction,
+                        migration: Migration,
+                        action_index: int,
+                        forward: bool,
+                        metrics: ActionMetrics):
+        """Return context manager which profiles an action if
+        `flags.profile_dir` is set
+        """
+        if not runtime_flags.profile_dir:
+            return nullcontext()
+
+        direction = 'forward' if forward else 'backward'
+        name = f'{migration.name}.{action_index:03d}.{direction}.{action_object.__class__.__name__}'
+        return profile_action(runtime_flags.profile_dir, name, metrics)
+
+    @contextmanager
+    def _collect_metrics(self, command: str):
+        """
+        Context manager which yields metrics report of a command run.
+        Summary table is logged and report is written to
+        `flags.metrics_report` file on exit, even if migration failed
+        :param command: command name
+        """
+        report = MetricsReport(command)
+        try:
+            yield report
+        finally:
+            if report.actions:
+                level = logging.INFO if runtime_flags.metrics_report else logging.DEBUG
+                log.log(level, 'Actions metrics:\n%s', report.format_table())
+                if runtime_flags.profile_commands:
+                    log.info('Commands profile:\n%s', report.format_commands())
+            if runtime_flags.metrics_report:
+                report.write(runtime_flags.metrics_report)
+                log.info('Metrics report is written to %s', runtime_flags.metrics_report)
+
+    def _update_embedded_catalog(self, undo_log: SchemaUndoLog) -> None:
+        """Update catalog of paths to embedded documents after schema
+        was patched by an action if catalog is used
+        """
+        if runtime_flags.embedded_catalog and undo_log.changed_documents:
+            self.embedded_catalog.update(undo_log.previous_schema(), undo_log.schema)
+
     def migrate(self, migration_name: str = None):
         """
         Migrate db in order to reach a given migration. This process
@@ -550,18 +744,22 @@ class MongoengineMigrate:
         db_schema = self.load_db_schema()
 
         # Obtain schema changes which migrations would make (including
-        #  unapplied ones)
+        #  unapplied ones). Replay starts from the latest schema
+        #  snapshot if any
         # If mongoengine models schema was changed regarding db schema
         #  then try to guess which actions would reflect such changes
-        for migration in graph.walk_down(graph.initial, unapplied_only=False):
-            for action_object in migration.get_actions():
-                try:
-                    db_schema = patch(action_object.to_schema_patch(db_schema), db_schema)
-                except (TypeError, ValueError, KeyError) as e:
-                    raise ActionError(
-                        f"Unable to apply schema patch of {action_object!r}. More likely that the "
-                        f"schema is corrupted. You can use schema repair tools to fix this issue"
-                    ) from e
+        migrations = list(graph.walk_down(graph.initial, unapplied_only=False))
+        snapshots = SchemaSnapshots(self.migration_collection, migrations)
+        start, snapshot = snapshots.find()
+        # Snapshot could be written only if replay starts from
+        # migrations themselves, not from arbitrary db schema
+        pure_replay = snapshot is not None or not db_schema
+        if snapshot is not None:
+            db_schema = snapshot
+        for position in range(start, len(migrations)):
+            self._replay_migration(migrations[position], db_schema)
+            if pure_replay:
+                snapshots.save(position + 1, db_schema)
 
         log.debug('Collecting schema from mongoengine documents...')
         models_schema = collect_models_schema()
@@ -603,6 +801,51 @@ class MongoengineMigrate:
 
         log.info('Migration file "%s" was created', migration_file)
 
+    def rebuild_schema_snapshots(self, interval: int):
+        """
+        Remove all schema snapshots and write new ones by replaying
+        all migrations from scratch
+        :param interval: write snapshot after every `interval`-th
+         migration
+        :return:
+        """
+        log.debug('Loading migration files...')
+        graph = self.build_graph()
+        migrations = list(graph.walk_down(graph.initial, unapplied_only=False))
+        snapshots = SchemaSnapshots(self.migration_collection, migrations)
+        snapshots.clear()
+
+        schema = Schema()
+        written = 0
+        for position, migration in enumerate(migrations, start=1):
+            self._replay_migration(migration, schema)
+            written += snapshots.save(position, schema, interval)
+
+        log.info('Written %d schema snapshots', written)
+
+    @staticmethod
+    def _replay_migration(migration: Migration, schema: Schema) -> List[list]:
+        """
+        Apply schema patches of all actions of a migration to schema
+        in place
+        :param migration: migration object
+        :param schema: schema state before migration
+        :return: schema patches of actions
+        """
+        diffs = []
+        for action_object in migration.get_actions():
+            diff = action_object.to_schema_patch(schema)
+            try:
+                apply_patch(diff, schema)
+            except (TypeError, ValueError, KeyError) as e:
+                raise ActionError(
+                    f"Unable to apply schema patch of {action_object!r}. More likely that the "
+                    f"schema is corrupted. You can use schema repair tools to fix this issue"
+                ) from e
+            diffs.append(diff)
+
+        return diffs
+
     def _verify_schema(self, schema: Schema):
         # Check if all derived documents have the same collection as
         # their parents.
@@ -0,0 +1,344 @@
+"""Performance metrics of actions of a migration run, which are
+written as JSON report and summary table
+"""
+__all__ = [
+    'METRICS_COUNTERS',
+    'ActionMetrics',
+    'MetricsReport',
+    'MeasuredCollection',
+    'metrics_scope',
+    'get_current_metrics',
+    'record_metrics'
+]
+
+import heapq
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Dict, Tuple, List, Iterable, Callable
+
+import wrapt
+
+#: Counters collected for every collection and embedded documents path.
+#: `passes` are commands which go through documents of a collection:
+#: by_doc scans, `update_many` calls and requests of bulk writes
+#: made by by_path updates
+METRICS_COUNTERS = (
+    'passes',
+    'documents_scanned',
+    'documents_modified',
+    'bulk_batches',
+    'bytes_written',
+    'update_many_matched',
+    'update_many_modified'
+)
+
+#: How many slowest commands are kept for every action
+SLOWEST_COMMANDS_COUNT = 10
+
+#: Short column names of counters in summary table
+_COLUMNS = ('Passes', 'Scanned', 'Modified', 'Batches', 'Bytes', 'Matched', 'Updated')
+
+#: Metrics which counters are currently added to. See `metrics_scope`
+_current_metrics: Optional['ActionMetrics'] = None
+
+
+class ActionMetrics:
+    """
+    Metrics of one action. Counters are kept separately for every
+    collection and path to embedded documents in it (empty string
+    means documents themselves). Thread-safe
+    """
+    def __init__(self,
+                 migration: str = '',
+                 index: int = 0,
+                 action: str = '',
+                 forward: bool = True):
+        """
+        :param migration: migration name
+        :param index: action index in migration, starting from 1
+        :param action: action description
+        :param forward: True if action is run forward
+        """
+        self.migration = migration
+        self.index = index
+        self.action = action
+        self.forward = forward
+        self.wall_time = 0.0
+        #: Peak size of allocated memory in bytes if it was measured
+        self.memory_peak: Optional[int] = None
+        self.counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        #: Count, server time and reply bytes of commands by type
+        self.commands: Dict[str, Dict[str, float]] = {}
+        #: Heap of (duration, seq, type, collection, description)
+        self.slowest_commands: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, collection_name: str, path: str, **counts: int) -> None:
+        """
+        Add values to counters of collection and embedded path
+        :param collection_name: collection name
+        :param path: dotpath to embedded documents
+        :param counts: values by counter names, see `METRICS_COUNTERS`
+        :return:
+        """
+        with self._lock:
+            counters = self.counters.get((collection_name, path))
+            if counters is None:
+                counters = self.counters[(collection_name, path)] = \
+                    dict.fromkeys(METRICS_COUNTERS, 0)
+            for name, value in counts.items():
+                counters[name] += value
+
+    def add_command(self,
+                    command_type: str,
+                    collection_name: str,
+                    duration: float,
+                    reply_bytes: int,
+                    describe: Callable[[], str]) -> None:
+        """
+        Account a command executed by server
+        :param command_type: command type, such as 'find'
+        :param collection_name: collection name
+        :param duration: server time in seconds
+        :param reply_bytes: reply size in bytes
+        :param describe: function which returns command description.
+         Called only if command is one of the slowest
+        :return:
+        """
+        with self._lock:
+            stats = self.commands.get(command_type)
+            if stats is None:
+                stats = self.commands[command_type] = {'count': 0, 'time': 0.0, 'bytes': 0}
+            stats['count'] += 1
+            stats['time'] += duration
+            stats['bytes'] += reply_bytes
+
+            slowest = self.slowest_commands
+            if len(slowest) < SLOWEST_COMMANDS_COUNT or duration > slowest[0][0]:
+                item = (duration, next(_command_seq), command_type, collection_name, describe())
+                if len(slowest) < SLOWEST_COMMANDS_COUNT:
+                    heapq.heappush(slowest, item)
+                else:
+                    heapq.heapreplace(slowest, item)
+
+    def merge(self, other: 'ActionMetrics') -> None:
+        """Add counters and commands collected by another metrics
+        object, e.g. in a process worker
+        """
+        for (collection_name, path), counts in other.counters.items():
+            self.add(collection_name, path, **counts)
+
+        with self._lock:
+            for command_type, stats in other.commands.items():
+                own = self.commands.setdefault(command_type, {'count': 0, 'time': 0.0, 'bytes': 0})
+                for name, value in stats.items():
+                    own[name] += value
+            slowest = self.slowest_commands + other.slowest_commands
+            self.slowest_commands = heapq.nlargest(SLOWEST_COMMANDS_COUNT, slowest)
+            heapq.heapify(self.slowest_commands)
+
+    @property
+    def server_time(self) -> float:
+        """Summary server time of commands in seconds"""
+        return sum(stats['time'] for stats in self.commands.values())
+
+    @property
+    def totals(self) -> Dict[str, int]:
+        """Counters summed across collections"""
+        return _sum_counters(self.counters.values())
+
+    def as_dict(self) -> dict:
+        return {
+            'migration': self.migration,
+            'index': self.index,
+            'action': self.action,
+            'direction': 'forward' if self.forward else 'backward',
+            'wall_time': round(self.wall_time, 6),
+            'memory_peak': self.memory_peak,
+            'totals': self.totals,
+            'server_time': round(self.server_time, 6),
+            'commands': self.commands,
+            'slowest_commands': [
+                {'type': command_type, 'collection': collection_name,
+                 'duration': round(duration, 6), 'command': description}
+                for duration, _, command_type, collection_name, description
+                in sorted(self.slowest_commands, reverse=True)
+            ],
+            'collections': [
+                {'collection': collection_name, 'path': path, **counts}
+                for (collection_name, path), counts in sorted(self.counters.items())
+            ]
+        }
+
+
+class MetricsReport:
+    """Metrics of all actions run by a migration command"""
+    def __init__(self, command: str):
+        """
+        :param command: command name, such as 'upgrade'
+        """
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        self.actions: List[ActionMetrics] = []
+        self._started = time.monotonic()
+
+    @contextmanager
+    def measure(self, migration: str, index: int, action: str, forward: bool):
+        """
+        Context manager which measures wall time of an action and
+        makes its metrics current, so that counters are added to them.
+        Parameters are the same as in `ActionMetrics` constructor
+        """
+        metrics = ActionMetrics(migration, index, action, forward)
+        self.actions.append(metrics)
+        started = time.monotonic()
+        try:
+            with metrics_scope(metrics):
+                yield metrics
+        finally:
+            metrics.wall_time += time.monotonic() - started
+
+    def as_dict(self) -> dict:
+        return {
+            'command': self.command,
+            'started_at': self.started_at.isoformat(),
+            'wall_time': round(time.monotonic() - self._started, 6),
+            'totals': _sum_counters(a.totals for a in self.actions),
+            'actions': [a.as_dict() for a in self.actions]
+        }
+
+    def write(self, path: str) -> None:
+        """Write report to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+            f.write('\n')
+
+    def format_table(self) -> str:
+        """Return summary table with a row for every action and rows
+        for every collection and embedded path it touched
+        """
+        header = ('Action', 'Wall, s') + _COLUMNS
+        rows = []
+        for metrics in self.actions:
+            rows.append((f'{metrics.migration}[{metrics.index}] {metrics.action}',
+                         f'{metrics.wall_time:.3f}')
+                        + tuple(str(metrics.totals[c]) for c in METRICS_COUNTERS))
+            for (collection_name, path), counts in sorted(metrics.counters.items()):
+                rows.append((f'  {collection_name}' + (f' {path}' if path else ''), '')
+                            + tuple(str(counts[c]) for c in METRICS_COUNTERS))
+
+        totals = _sum_counters(a.totals for a in self.actions)
+        rows.append(('Total', f'{sum(a.wall_time for a in self.actions):.3f}')
+                    + tuple(str(totals[c]) for c in METRICS_COUNTERS))
+
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        lines = [
+            '  '.join(cell.ljust(w) if i == 0 else cell.rjust(w)
+                      for i, (cell, w) in enumerate(zip(row, widths))).rstrip()
+            for row in [header] + rows
+        ]
+        return '\n'.join(lines)
+
+    def format_commands(self) -> str:
+        """Return server time and the slowest commands of every action"""
+        lines = []
+        for metrics in self.actions:
+            lines.append(f'{metrics.migration}[{metrics.index}] {metrics.action}: '
+                         f'wall {metrics.wall_time:.3f}s, server {metrics.server_time:.3f}s')
+            commands = sorted(metrics.commands.items(), key=lambda i: i[1]['time'], reverse=True)
+            for command_type, stats in commands:
+                lines.append(f'  {command_type}: {stats["count"]} commands, '
+                             f'{stats["time"]:.3f}s, {stats["bytes"]} bytes replied')
+            for duration, _, command_type, collection_name, description \
+                    in sorted(metrics.slowest_commands, reverse=True):
+                lines.append(f'  {duration:.3f}s {command_type} {collection_name} {description}')
+
+        return '\n'.join(lines)
+
+
+class MeasuredCollection(wrapt.ObjectProxy):
+    """
+    Collection proxy which adds results of `update_many` and
+    `bulk_write` calls to the current metrics. Every `update_many`
+    call is counted as a collection pass
+    """
+    def __init__(self, wrapped, path: str):
+        """
+        :param wrapped: collection object
+        :param path: dotpath to embedded documents being updated
+        """
+        super().__init__(wrapped)
+        self._self_path = path
+
+    def update_many(self, *args, **kwargs):
+        res = self.__wrapped__.update_many(*args, **kwargs)
+        self.record(passes=1,
+                    update_many_matched=getattr(res, 'matched_count', 0),
+                    update_many_modified=getattr(res, 'modified_count', 0))
+        return res
+
+    def bulk_write(self, *args, **kwargs):
+        res = self.__wrapped__.bulk_write(*args, **kwargs)
+        self.record(update_many_matched=getattr(res, 'matched_count', 0),
+                    update_many_modified=getattr(res, 'modified_count', 0))
+        return res
+
+    def record(self, **counts: int) -> None:
+        """Add values to counters of this collection"""
+        record_metrics(self.__wrapped__.name, self._self_path, **counts)
+
+
+@contextmanager
+def metrics_scope(metrics: Optional[ActionMetrics]):
+    """
+    Context manager which sets metrics which counters are added to.
+    None means not to collect metrics
+    :param metrics: metrics object or None
+    """
+    global _current_metrics
+
+    previous = _current_metrics
+    _current_metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _current_metrics = previous
+
+
+def get_current_metrics() -> Optional[ActionMetrics]:
+    """Return metrics set by `metrics_scope` or None"""
+    return _current_metrics
+
+
+def record_metrics(collection_name: str, path: str, **counts: int) -> None:
+    """Add values to counters of the current metrics if any. See
+    `ActionMetrics.add`
+    """
+    if _current_metrics is not None:
+        _current_metrics.add(collection_name, path, **counts)
+
+
+#: Sequence which makes heap items with equal duration comparable
+_command_seq = itertools.count()
+
+
+def _sum_counters(counters: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    res = dict.fromkeys(METRICS_COUNTERS, 0)
+    for counts in counters:
+        for name, value in counts.items():
+            res[name] += value
+
+    return res
@@ -0,0 +1,145 @@
+"""Index of migration files which keeps their dependencies and policy
+read without executing migration modules
+"""
+__all__ = [
+    'MigrationsIndex',
+    'parse_migration_header'
+]
+
+import ast
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Module variables which are read from migration source
+HEADER_NAMES = ('dependencies', 'policy')
+
+#: Index format version. Index with another version is discarded
+_INDEX_VERSION = 1
+
+
+class MigrationsIndex:
+    """
+    Dependencies, policy and hash of migration files in a directory.
+    They're read from module source by `parse_migration_header` and
+    cached in `__pycache__/mongoengine_migrate_index.json` file in
+    that directory. Cached entry of a file is used while its mtime
+    and size remain the same, or while contents hash is the same if
+    they've changed.
+
+    If cache file could not be written, index works without it
+    """
+    file_name = 'mongoengine_migrate_index.json'
+
+    def __init__(self, directory: Path):
+        """
+        :param directory: migrations directory
+        """
+        self.path = directory / '__pycache__' / self.file_name
+        self._entries: Dict[str, dict] = {}
+        self._modified = False
+        self.load()
+
+    def load(self) -> None:
+        """Load cached entries from index file"""
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict) and data.get('version') == _INDEX_VERSION:
+            self._entries = data.get('files', {})
+
+    def save(self) -> None:
+        """Write index file if entries were changed"""
+        if not self._modified:
+            return
+
+        data = {'version': _INDEX_VERSION, 'files': self._entries}
+        try:
+            self.path.parent.mkdir(exist_ok=True)
+            self.path.write_text(json.dumps(data, indent=1, sort_keys=True))
+        except OSError as e:
+            log.debug('> Unable to write migrations index %s: %s', self.path, e)
+            return
+
+        self._modified = False
+
+    def get(self, module_file: Path) -> Dict[str, Any]:
+        """
+        Return index entry of migration file
+        :param module_file: migration file path
+        :return: dict with `hash` key and, if header could be read
+         from source, with `dependencies` and `policy` keys
+        """
+        stat = module_file.stat()
+        entry = self._entries.get(module_file.name)
+        if entry is not None and (entry['mtime'], entry['size']) == (stat.st_mtime_ns,
+                                                                      stat.st_size):
+            return entry
+
+        source = module_file.read_bytes()
+        file_hash = hashlib.sha256(source).hexdigest()
+        if entry is None or entry['hash'] != file_hash:
+            log.debug('> Parsing migration file %s', module_file)
+            entry = {'hash': file_hash}
+            header = parse_migration_header(source, str(module_file))
+            if header is not None:
+                entry.update(header)
+
+        entry.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+        self._entries[module_file.name] = entry
+        self._modified = True
+        return entry
+
+
+def parse_migration_header(source: bytes, filename: str = '<unknown>') -> Optional[dict]:
+    """
+    Read `dependencies` and `policy` of migration module from its
+    source without executing it. They could be read if they are
+    assigned by literals on the top level of module, and not bound
+    anywhere else.
+    :param source: module source
+    :param filename: file name used in syntax errors
+    :return: dict with `dependencies` and `policy` keys (policy is
+     None if omitted), or None if module should be executed to get them
+    """
+    tree = ast.parse(source, filename)
+    values = {}
+    assignments = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in HEADER_NAMES:
+            try:
+                values[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+            assignments.add(id(node.targets[0]))
+        elif values and isinstance(node, (ast.Import, ast.ImportFrom)):
+            # Import after assignment could bind these names again
+            return None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            bound = node.id if isinstance(node.ctx, ast.Store) else None
+        elif isinstance(node, ast.alias):
+            bound = node.asname or node.name
+        else:
+            bound = getattr(node, 'name', None)  # Functions, classes, except handlers
+        if bound in HEADER_NAMES and id(node) not in assignments:
+            return None
+
+    dependencies = values.get('dependencies')
+    policy = values.get('policy')
+    if not isinstance(dependencies, (list, tuple)) or not all(isinstance(d, str)
+                                                              for d in dependencies):
+        return None
+    if policy is not None and not isinstance(policy, str):
+        return None
+
+    return {'dependencies': list(dependencies), 'policy': policy}
@@ -1,20 +1,32 @@
 __all__ = [
     'check_empty_result',
-    'mongo_version'
+    'mongo_version',
+    'type_filter_except',
+    'type_filter_only',
+    'BSON_TYPE_ALIASES'
 ]
 
 import functools
 import logging
+from typing import Optional
 
 from pymongo.collection import Collection
 
 from mongoengine_migrate.exceptions import InconsistencyError
 from . import flags
 from mongoengine_migrate.updater import DocumentUpdater, FallbackDocumentUpdater
+from mongoengine_migrate.utils import parse_version
 
 
 log = logging.getLogger('mongoengine-migrate')
 
+#: BSON type aliases which could be used in `$type` query operator
+BSON_TYPE_ALIASES = (
+    'double', 'string', 'object', 'array', 'binData', 'undefined', 'objectId', 'bool', 'date',
+    'null', 'regex', 'dbPointer', 'javascript', 'symbol', 'javascriptWithScope', 'int',
+    'timestamp', 'long', 'decimal', 'minKey', 'maxKey'
+)
+
 
 def check_empty_result(collection: Collection, db_field: str, find_filter: dict) -> None:
     """
@@ -36,6 +48,43 @@ def check_empty_result(collection: Collection, db_field: str, find_filter: dict)
                                  f"{','.join(examples)}")
 
 
+def type_filter_except(*type_aliases: str) -> Optional[dict]:
+    """
+    Return `$type` query expression which matches values of all BSON
+    types except given ones. Arrays are always matched.
+
+    Unlike `$not`, positive `$type` matches an array field if at least
+    one of its items matches, so such expression keeps documents where
+    at least one of values needs to be handled
+    :param type_aliases: BSON type aliases to exclude
+    :return: query expression or None if MongoDB version does not
+     support array of types in `$type`
+    """
+    assert all(t in BSON_TYPE_ALIASES for t in type_aliases)
+
+    if flags.mongo_version and parse_version(flags.mongo_version) < (3, 6):
+        return None
+
+    return {'$type': [t for t in BSON_TYPE_ALIASES if t not in type_aliases]}
+
+
+def type_filter_only(*type_aliases: str) -> Optional[dict]:
+    """
+    Return `$type` query expression which matches values of given BSON
+    types only. Array field is matched if at least one of its items
+    matches
+    :param type_aliases: BSON type aliases to match
+    :return: query expression or None if MongoDB version does not
+     support array of types in `$type`
+    """
+    assert all(t in BSON_TYPE_ALIASES for t in type_aliases)
+
+    if flags.mongo_version and parse_version(flags.mongo_version) < (3, 6):
+        return None
+
+    return {'$type': list(type_aliases)}
+
+
 def mongo_version(min_version: str = None, max_version: str = None):
     """
     Decorator restrict decorated change method execution by
@@ -0,0 +1,164 @@
+__all__ = [
+    'Prefetcher',
+    'BackgroundWriter'
+]
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from pymongo.collection import Collection
+
+from mongoengine_migrate.throttle import wait_for_replication
+
+#: Marks the end of a stream in a queue
+_STOP = object()
+
+#: How often a blocked thread checks if it should stop, seconds
+_POLL_INTERVAL = 0.5
+
+
+class Prefetcher:
+    """
+    Reader stage of by_doc pipeline. Iterates over a given iterable
+    (typically a cursor) in a separate thread and passes items to
+    consumer by batches through a bounded queue. So the next batches
+    are fetched while consumer handles the current one. If queue is
+    full then reader waits until consumer takes a batch.
+
+    Exception raised in reader thread is reraised in consumer thread.
+    Should be used as context manager, which stops reader thread on
+    exit.
+    """
+    def __init__(self, iterable: Iterable, batch_size: int, queue_size: int):
+        """
+        :param iterable: iterable to read items from
+        :param batch_size: items count passed through queue at once
+        :param queue_size: max batches count in queue
+        """
+        self._iterable = iterable
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mongoengine-migrate-reader',
+                                        daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_event.set()
+        self._thread.join()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            batch = self._queue.get()
+            if batch is _STOP:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+
+            yield from batch
+
+    def _run(self):
+        batch = []
+        try:
+            for item in self._iterable:
+                batch.append(item)
+                if len(batch) >= self._batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch and not self._put(batch):
+                return
+            self._put(_STOP)
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        """Put an item to queue and wait if queue is full. Return
+        False if the thread was stopped while waiting
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+
+class BackgroundWriter:
+    """
+    Writer stage of by_doc pipeline. Writes bulks of requests to a
+    collection in a separate thread. Bulks are passed through a
+    bounded queue, so `submit` blocks if writer can't keep up.
+
+    Exception raised by a bulk write is reraised on the next `submit`
+    call or on exit. Should be used as context manager, which waits
+    until all submitted requests are written.
+    """
+    def __init__(self, collection: Collection, queue_size: int):
+        """
+        :param collection: collection to write to. Typically it's a
+         collection from another connection (`flags.database2`)
+        :param queue_size: max bulks count waiting to be written
+        """
+        self.collection = collection
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='mongoengine-migrate-writer',
+                                        daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if exc_type is None:
+            self._raise_error()
+
+    def submit(self,
+               requests: List,
+               callback: Optional[Callable[[], None]] = None,
+               on_write: Optional[Callable[[List, Any], None]] = None) -> None:
+        """
+        Pass requests to be written by one `bulk_write` call
+        :param requests: write requests, could be empty
+        :param callback: optional function which is called in writer
+         thread after requests have been written
+        :param on_write: optional function which is called in writer
+         thread with requests and `BulkWriteResult` after bulk write
+        :return:
+        """
+        self._raise_error()
+        self._queue.put((requests, callback, on_write))
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            # Discard the rest after error, but keep draining the queue
+            # in order to not block a producer
+            if self._error is None:
+                requests, callback, on_write = item
+                try:
+                    if requests:
+                        res = self.collection.bulk_write(requests, ordered=False)
+                        if on_write is not None:
+                            on_write(requests, res)
+                        wait_for_replication(len(requests))
+                    if callback is not None:
+                        callback()
+                except BaseException as e:
+                    self._error = e
@@ -0,0 +1,117 @@
+"""Execution planner which runs consecutive actions touching the same
+collection in one fusion session, so their updates take fewer
+collection passes. See `mongoengine_migrate.fusion`
+"""
+__all__ = [
+    'ActionPlanner'
+]
+
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.actions.base import BaseAction, BaseFieldAction
+from mongoengine_migrate.fusion import FusionSession, fusion_scope
+from mongoengine_migrate.metrics import ActionMetrics, metrics_scope, get_current_metrics
+from mongoengine_migrate.schema import Schema
+
+log = logging.getLogger('mongoengine-migrate')
+
+
+class ActionPlanner:
+    """
+    Groups consecutive field actions by collection which they change.
+    Updates made by actions of a group are queued in one
+    `FusionSession` and merged where it does not change the result.
+    The queue is flushed when an action of another group comes, and
+    at the end of a migration by `flush`.
+
+    Other actions (document, index, RunPython actions and actions
+    with `bulk_options`) are executed immediately after the queue
+    has been flushed. Fusion is disabled if by_doc scans are
+    checkpointed, since a chained scan could not be resumed by a
+    checkpoint of any of its parts.
+
+    Metrics of queued updates are counted for the first action of
+    a group
+    """
+    def __init__(self):
+        self.session: Optional[FusionSession] = None
+        self._group_key: Optional[str] = None
+        self._actions_count = 0
+        self._metrics: Optional[ActionMetrics] = None
+
+    @contextmanager
+    def action_scope(self, action_object: BaseAction, left_schema: Schema):
+        """
+        Context manager where an action should be run. Queued updates
+        are discarded if the action raised an exception
+        :param action_object: action to run
+        :param left_schema: db schema before the action
+        """
+        group_key = self._get_group_key(action_object, left_schema)
+        if group_key is None or group_key != self._group_key:
+            self.flush()
+        if group_key is not None and self.session is None:
+            self.session = FusionSession()
+            self._group_key = group_key
+            self._metrics = get_current_metrics()
+
+        try:
+            with fusion_scope(self.session):
+                yield
+        except BaseException:
+            self.discard()
+            raise
+
+        if self.session is not None:
+            self._actions_count += 1
+
+    def flush(self) -> None:
+        """Execute updates queued by the current group of actions"""
+        session = self.session
+        if session is None:
+            return
+
+        if self._actions_count > 1:
+            log.debug('> Executing updates of %d actions on %s',
+                      self._actions_count, self._group_key)
+        metrics = self._metrics
+        self._reset()
+        with metrics_scope(metrics):
+            session.flush()
+
+    def discard(self) -> None:
+        """Drop the current group with its queued updates"""
+        if self.session is not None:
+            self.session.discard()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.session = None
+        self._group_key = None
+        self._actions_count = 0
+        self._metrics = None
+
+    @staticmethod
+    def _get_group_key(action_object: BaseAction, left_schema: Schema) -> Optional[str]:
+        """
+        Return key of group which action could be joined to, i.e. name
+        of collection which it changes, or embedded document type.
+        None means that action should be run separately
+        """
+        if not flags.fuse_actions or flags.checkpoints:
+            return None
+        if not isinstance(action_object, BaseFieldAction) or action_object.dummy_action:
+            return None
+        if action_object.bulk_options:
+            return None
+
+        document_type = action_object.document_type
+        if document_type.startswith(flags.EMBEDDED_DOCUMENT_NAME_PREFIX):
+            return document_type
+        if document_type not in left_schema:
+            return None
+
+        return left_schema[document_type].parameters.get('collection')
@@ -0,0 +1,162 @@
+"""Profiling of migration actions: MongoDB commands which they make,
+Python code which they run and memory which they allocate
+"""
+__all__ = [
+    'COMMAND_TYPES',
+    'CommandProfiler',
+    'get_event_listeners',
+    'profile_action'
+]
+
+import cProfile
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Mapping, Any, Optional
+
+import bson
+from bson import json_util
+from pymongo import monitoring
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.metrics import ActionMetrics, get_current_metrics
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Command types by command names. Write commands with several
+#: statements are counted as 'bulk'
+COMMAND_TYPES = {
+    'find': 'find',
+    'getMore': 'getMore',
+    'update': 'update',
+    'insert': 'insert',
+    'delete': 'delete',
+    'aggregate': 'aggregate',
+    'count': 'count',
+    'distinct': 'distinct',
+    'findAndModify': 'update',
+}
+
+#: Statements field of write commands
+_WRITE_STATEMENTS = {'update': 'updates', 'insert': 'documents', 'delete': 'deletes'}
+
+#: Max length of command description in profile
+_DESCRIPTION_LENGTH = 200
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """
+    pymongo command listener which adds duration and reply size of
+    every command to metrics of the currently running action. Duration
+    is measured by the driver, so it includes network round trip.
+    Commands made out of actions are not counted
+    """
+    def __init__(self):
+        #: Started commands by connection and request id
+        self._started = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if get_current_metrics() is None:
+            return
+
+        self._started[(event.connection_id, event.request_id)] = (event.command_name,
+                                                                  event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, None)
+
+    def _finish(self, event, reply: Optional[Mapping]) -> None:
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        metrics = get_current_metrics()
+        if started is None or metrics is None:
+            return
+
+        command_name, command = started
+        command_type = COMMAND_TYPES.get(command_name, command_name)
+        statements = command.get(_WRITE_STATEMENTS.get(command_name, ''))
+        if statements is not None and len(statements) > 1:
+            command_type = 'bulk'
+        collection_name = command.get('collection' if command_name == 'getMore' else command_name)
+        if not isinstance(collection_name, str):
+            collection_name = ''
+
+        metrics.add_command(command_type,
+                            collection_name,
+                            event.duration_micros / 1000000,
+                            len(bson.encode(reply)) if reply is not None else 0,
+                            lambda: _describe(command_name, command))
+
+
+def get_event_listeners() -> List[monitoring.CommandListener]:
+    """Return event listeners which MongoClient objects should be
+    created with according to flags
+    """
+    return [CommandProfiler()] if flags.profile_commands else []
+
+
+@contextmanager
+def profile_action(directory: str, name: str, metrics: Optional[ActionMetrics] = None):
+    """
+    Context manager which profiles code run inside it by cProfile and
+    writes stats to `<name>.pstats` file in a given directory. Peak
+    size of memory allocated meanwhile is measured by tracemalloc.
+    If `flags.profile_memory_top` is set, then this number of source
+    lines which allocated the most of memory still used at exit is
+    written to `<name>.memory.txt` file.
+
+    Only the current thread is profiled
+    :param directory: directory where files are written to, it's
+     created if needed
+    :param name: files name without extension
+    :param metrics: optional metrics of action where memory peak
+     is saved to
+    """
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    else:
+        tracemalloc.clear_traces()  # Also resets peak
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot() if flags.profile_memory_top else None
+        if started_tracing:
+            tracemalloc.stop()
+
+        stats_path = path / f'{name}.pstats'
+        profiler.dump_stats(str(stats_path))
+        if metrics is not None:
+            metrics.memory_peak = peak
+        if snapshot is not None:
+            top = snapshot.statistics('lineno')[:flags.profile_memory_top]
+            with open(path / f'{name}.memory.txt', 'w') as f:
+                f.writelines(f'{stat}\n' for stat in top)
+        log.info('> Profile is written to %s, memory peak is %.1f MiB', stats_path, peak / 2**20)
+
+
+def _describe(command_name: str, command: Mapping[str, Any]) -> str:
+    """Return short description of a command without documents"""
+    if command_name in _WRITE_STATEMENTS:
+        statements = command.get(_WRITE_STATEMENTS[command_name]) or []
+        details = {'statements': len(statements)}
+        if statements and command_name != 'insert':
+            details['q'] = statements[0].get('q')
+    else:
+        details = {k: v for k, v in command.items()
+                   if k in ('filter', 'pipeline', 'query', 'projection', 'sort', 'key')}
+
+    description = json_util.dumps(details)
+    if len(description) > _DESCRIPTION_LENGTH:
+        description = description[:_DESCRIPTION_LENGTH - 3] + '...'
+    return description
@@ -0,0 +1,146 @@
+"""Periodic reports of progress of long collection passes"""
+__all__ = [
+    'ProgressReporter',
+    'get_progress_total'
+]
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, List
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from mongoengine_migrate import flags
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Reporter checks the clock once per this count of processed items
+_CHECK_STEP = 256
+
+#: Lock of progress file shared by reporters of parallel scans
+_file_lock = threading.Lock()
+
+
+class ProgressReporter:
+    """
+    Counter of processed items (documents) of a collection pass, which
+    reports speed, percent done and ETA every `flags.progress_interval`
+    seconds. Reports are written to log and as JSON lines to
+    `flags.progress_file` if it's set.
+
+    Clock is checked once per several hundreds of items, so `advance`
+    could be called for every document. Thread-safe
+    """
+    def __init__(self, name: str, total: Optional[int], unit: str = 'documents'):
+        """
+        :param name: what is being processed, such as collection name
+        :param total: expected items count or None if unknown
+        :param unit: items name
+        """
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.interval = flags.progress_interval
+        self.done = 0
+        self._started = time.monotonic()
+        self._reported_at = self._started
+        self._reports = 0
+        self._check_at = _CHECK_STEP
+        self._lock = threading.Lock()
+
+    def advance(self, count: int = 1) -> None:
+        """Account processed items and report progress if interval
+        has passed since the last report
+        """
+        with self._lock:
+            self.done += count
+            if self.done < self._check_at:
+                return
+
+            self._check_at = self.done + _CHECK_STEP
+            now = time.monotonic()
+            if now - self._reported_at >= self.interval:
+                self._reported_at = now
+                self._report(now, False)
+
+    def finish(self) -> None:
+        """Report that pass is finished. It's logged only if progress
+        of this pass has been logged before
+        """
+        with self._lock:
+            self._report(time.monotonic(), True)
+
+    def _report(self, now: float, finished: bool) -> None:
+        elapsed = now - self._started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        percent = eta = None
+        if self.total:
+            done = min(self.done, self.total)
+            percent = 100.0 * done / self.total
+            if rate > 0:
+                eta = 0.0 if finished else (self.total - done) / rate
+
+        if not finished:
+            log.info('Progress of %s: %d of %s %s (%s), %.1f %s/s, ETA %s',
+                     self.name, self.done, self.total if self.total is not None else '?',
+                     self.unit, '?' if percent is None else f'{percent:.1f}%', rate, self.unit,
+                     '?' if eta is None else _format_duration(eta))
+        elif self._reports:
+            log.info('Finished %s: %d %s in %s, %.1f %s/s', self.name, self.done, self.unit,
+                     _format_duration(elapsed), rate, self.unit)
+        self._reports += 1
+
+        if flags.progress_file:
+            record = {
+                'time': datetime.now(timezone.utc).isoformat(),
+                'name': self.name,
+                'unit': self.unit,
+                'done': self.done,
+                'total': self.total,
+                'percent': None if percent is None else round(percent, 2),
+                'rate': round(rate, 2),
+                'elapsed': round(elapsed, 3),
+                'eta': None if eta is None else round(eta, 3),
+                'finished': finished
+            }
+            with _file_lock, open(flags.progress_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+def get_progress_total(collection: Collection,
+                       fltr: Optional[dict] = None,
+                       id_filters: Optional[List[Optional[dict]]] = None) -> Optional[int]:
+    """
+    Return expected documents count of a collection pass according to
+    `flags.progress_total`: documents count by filter ('exact') or
+    collection size from its metadata ('estimated'). None if count
+    could not be obtained
+    :param collection: pymongo collection object
+    :param fltr: filter of documents which pass goes through
+    :param id_filters: `_id` filters of ranges which remain to be
+     processed if pass was resumed. Collection size includes already
+     processed documents, so only exact count is made in this case
+    :return:
+    """
+    try:
+        if id_filters is not None:
+            if flags.progress_total != 'exact':
+                return None
+            fltr = fltr or {}
+            return sum(collection.count_documents({**fltr, '_id': f} if f else fltr)
+                       for f in id_filters)
+        if flags.progress_total == 'exact' and fltr:
+            return collection.count_documents(fltr)
+        return collection.estimated_document_count()
+    except PyMongoError as e:  # Progress should never break migration
+        log.debug('> Unable to count documents of %s: %s', collection.name, e)
+        return None
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
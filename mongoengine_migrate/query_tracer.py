@@ -72,6 +72,20 @@ def make_history_method(func_name, method_kind, return_value=_sentinel):
     return w
 
 
+def make_aggregate_history_method(func_name):
+    """Aggregation pipelines which write results ($out, $merge) are
+    only written to history, the rest are executed as reading methods
+    """
+    read_method = make_history_method(func_name, 'READ')
+    write_method = make_history_method(func_name, 'AGGREGATE', return_value=[])
+
+    def w(instance, pipeline, *args, **kwargs):
+        writes = any(stage_name in ('$out', '$merge') for stage in pipeline for stage_name in stage)
+        method = write_method if writes else read_method
+        return method(instance, pipeline, *args, **kwargs)
+    return w
+
+
 class CollectionQueryTracer(wrapt.ObjectProxy):
     """
     pymongo.Collection wrapper object which mocks modification methods
@@ -108,10 +122,8 @@ class CollectionQueryTracer(wrapt.ObjectProxy):
     find_and_modify = make_history_method('find_and_modify', 'MODIFY', return_value=None)
 
     # Aggregation methods
-    aggregate = make_history_method('aggregate', 'AGGREGATE', return_value=[])
-    aggregate_raw_batches = make_history_method('aggregate_raw_batches',
-                                                'AGGREGATE',
-                                                return_value=[])
+    aggregate = make_aggregate_history_method('aggregate')
+    aggregate_raw_batches = make_aggregate_history_method('aggregate_raw_batches')
 
     # Collection reading methods
     find_one = make_history_method('find_one', 'READ')
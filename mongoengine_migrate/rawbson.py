@@ -0,0 +1,111 @@
+"""Minimal reading of raw BSON data without decoding values"""
+__all__ = [
+    'iter_raw_documents',
+    'index_elements',
+    'decode_elements',
+    'BSON_OBJECT',
+    'BSON_ARRAY',
+]
+
+import struct
+from typing import Collection, Dict, Iterable, Iterator, Tuple
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
+
+#: BSON element type codes
+BSON_OBJECT = 0x03
+BSON_ARRAY = 0x04
+
+#: Value sizes of BSON types with fixed size
+_FIXED_SIZES = {
+    0x01: 8,   # double
+    0x06: 0,   # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,   # bool
+    0x09: 8,   # UTC datetime
+    0x0A: 0,   # null
+    0x10: 4,   # int32
+    0x11: 8,   # timestamp
+    0x12: 8,   # int64
+    0x13: 16,  # decimal128
+    0xFF: 0,   # min key
+    0x7F: 0,   # max key
+}
+
+#: Element position in raw document: (type code, start, end)
+Element = Tuple[int, int, int]
+
+_int32 = struct.Struct('<i')
+
+
+def iter_raw_documents(data: bytes) -> Iterator[bytes]:
+    """
+    Split concatenated BSON documents (such as a batch returned by
+    `find_raw_batches`) without decoding them
+    :param data: raw BSON data
+    :return: iterator of raw documents
+    """
+    pos = 0
+    while pos < len(data):
+        size = _int32.unpack_from(data, pos)[0]
+        yield data[pos:pos + size]
+        pos += size
+
+
+def index_elements(raw: bytes, names: Collection[str]) -> Dict[str, Element]:
+    """
+    Find top-level elements with given names in raw BSON document
+    :param raw: raw BSON document
+    :param names: names of elements to find
+    :return: dict with element name and its position
+    """
+    res = {}
+    encoded_names = {n.encode('utf-8') for n in names}
+    pos, end = 4, len(raw) - 1
+    while pos < end and len(res) < len(encoded_names):
+        type_code = raw[pos]
+        name_end = raw.index(b'\x00', pos + 1)
+        value_pos = name_end + 1
+        value_end = value_pos + _value_size(raw, type_code, value_pos)
+
+        name = raw[pos + 1:name_end]
+        if name in encoded_names:
+            res[name.decode('utf-8')] = (type_code, pos, value_end)
+        pos = value_end
+
+    return res
+
+
+def decode_elements(raw: bytes,
+                    elements: Iterable[Element],
+                    codec_options: CodecOptions) -> dict:
+    """
+    Decode only given elements of raw BSON document
+    :param raw: raw BSON document
+    :param elements: positions of elements returned by
+     `index_elements`
+    :param codec_options: codec options to decode with
+    :return: decoded document with given elements only
+    """
+    body = b''.join(raw[start:end] for _, start, end in elements)
+    return bson.decode(_int32.pack(len(body) + 5) + body + b'\x00', codec_options)
+
+
+def _value_size(raw: bytes, type_code: int, pos: int) -> int:
+    size = _FIXED_SIZES.get(type_code)
+    if size is not None:
+        return size
+    if type_code in (0x02, 0x0D, 0x0E):  # string, code, symbol
+        return 4 + _int32.unpack_from(raw, pos)[0]
+    if type_code in (0x03, 0x04, 0x0F):  # object, array, code with scope
+        return _int32.unpack_from(raw, pos)[0]
+    if type_code == 0x05:  # binary
+        return 5 + _int32.unpack_from(raw, pos)[0]
+    if type_code == 0x0C:  # DBPointer
+        return 16 + _int32.unpack_from(raw, pos)[0]
+    if type_code == 0x0B:  # regex, two cstrings
+        return raw.index(b'\x00', raw.index(b'\x00', pos) + 1) + 1 - pos
+
+    raise InvalidBSON(f'Unknown BSON type code {type_code:#x}')
@@ -71,6 +71,16 @@ class Schema(SchemaAccessMixin, dict):
                 'indexes': self.__indexes
             }
 
+        def __copy__(self):
+            """Shallow copy with its own parameters and indexes dicts.
+            Field schemas and index specs are shared
+            """
+            indexes = Schema.Document.Indexes()
+            dict.update(indexes, self.__indexes)  # Specs are already normalized
+            return Schema.Document(self,
+                                   parameters=Schema.Document.Parameters(self.__parameters),
+                                   indexes=indexes)
+
         def __eq__(self, other):
             if self is other:
                 return True
@@ -0,0 +1,183 @@
+"""In-place application of dictdiffer patches produced by actions to
+a schema. See `apply_patch`
+"""
+__all__ = [
+    'SchemaUndoLog',
+    'apply_patch',
+    'snapshot_schema'
+]
+
+from copy import copy
+from typing import Iterable, Any, Dict, List
+
+from dictdiffer import ADD, CHANGE, REMOVE
+
+from mongoengine_migrate.schema import Schema
+
+#: Marks document which was absent in schema before patch
+_MISSING = object()
+
+
+class SchemaUndoLog:
+    """
+    Documents of schema which were replaced, added or removed by a
+    patch, with their previous values. Previous documents are never
+    modified by patches, so they could be restored or used to look at
+    the schema before patch
+    """
+    def __init__(self, schema: Schema):
+        """
+        :param schema: patched schema
+        """
+        self.schema = schema
+        #: Previous documents by name, `_MISSING` if document was added
+        self.previous: Dict[str, Any] = {}
+        #: Containers copied during the patch, by id. They belong to
+        #: the patched schema only, so they're changed in place
+        self._copies: Dict[int, Any] = {}
+
+    @property
+    def changed_documents(self) -> List[str]:
+        """Names of documents touched by patch"""
+        return list(self.previous.keys())
+
+    def rollback(self) -> None:
+        """Restore schema state before patch"""
+        for name, document in self.previous.items():
+            if document is _MISSING:
+                self.schema.pop(name, None)
+            else:
+                self.schema[name] = document
+
+        self.previous.clear()
+        self._copies.clear()
+
+    def previous_schema(self) -> Schema:
+        """Return schema state before patch. Unchanged documents are
+        shared with the patched schema
+        """
+        res = snapshot_schema(self.schema)
+        for name, document in self.previous.items():
+            if document is _MISSING:
+                res.pop(name, None)
+            else:
+                res[name] = document
+
+        return res
+
+    def _remember(self, name: str) -> None:
+        if name not in self.previous:
+            self.previous[name] = self.schema.get(name, _MISSING)
+
+    def _get_writable(self, keys: List[Any]) -> Any:
+        """
+        Return container by path which could be changed in place. Every
+        container on path is replaced by its shallow copy on the first
+        access, so objects which schema contained before patch, and
+        the ones which were put there from action patches, stay intact
+        """
+        container = self.schema
+        for key in keys:
+            if isinstance(container, list):
+                key = int(key)
+            if container is self.schema:
+                self._remember(key)
+
+            value = container[key]
+            if id(value) not in self._copies:
+                value = copy(value)
+                self._copies[id(value)] = value
+                container[key] = value
+            container = value
+
+        return container
+
+
+def apply_patch(diff: Iterable[tuple], schema: Schema) -> SchemaUndoLog:
+    """
+    Apply dictdiffer patch, such as one returned by action
+    `to_schema_patch`, to schema in place. Unlike `dictdiffer.patch`
+    the whole schema is not copied: only documents touched by patch
+    are copied along the changed paths, so the cost depends on
+    changed documents, not on schema size. Values from patch are
+    put to schema without copying.
+
+    If patch could not be applied, then schema is rolled back and
+    exception is reraised
+    :param diff: dictdiffer diff
+    :param schema: schema to patch
+    :return: undo log of patch
+    """
+    undo_log = SchemaUndoLog(schema)
+    try:
+        for action, node, changes in diff:
+            _patchers[action](undo_log, _split_node(node), changes)
+    except BaseException:
+        undo_log.rollback()
+        raise
+
+    return undo_log
+
+
+def snapshot_schema(schema: Schema) -> Schema:
+    """
+    Return shallow copy of schema which is not affected by further
+    `apply_patch` calls on the original schema, since they never
+    change documents in place
+    :param schema: schema
+    :return: schema copy which shares documents with original one
+    """
+    return Schema(schema)
+
+
+def _split_node(node: Any) -> List[Any]:
+    if node is None or node == '' or node == []:
+        return []
+    if isinstance(node, str):
+        return node.split('.')
+    if isinstance(node, (list, tuple)):
+        return list(node)
+
+    raise TypeError('lookup must be string or list')
+
+
+def _add(undo_log: SchemaUndoLog, keys: List[Any], changes: Iterable[tuple]) -> None:
+    for key, value in changes:
+        dest = undo_log._get_writable(keys)
+        if isinstance(dest, list):
+            dest.insert(key, value)
+        elif isinstance(dest, set):
+            dest |= value
+        else:
+            if dest is undo_log.schema:
+                undo_log._remember(key)
+            dest[key] = value
+
+
+def _change(undo_log: SchemaUndoLog, keys: List[Any], changes: tuple) -> None:
+    dest = undo_log._get_writable(keys[:-1])
+    last_key = keys[-1]
+    if isinstance(dest, list):
+        last_key = int(last_key)
+    if dest is undo_log.schema:
+        undo_log._remember(last_key)
+    _, value = changes
+    dest[last_key] = value
+
+
+def _remove(undo_log: SchemaUndoLog, keys: List[Any], changes: Iterable[tuple]) -> None:
+    for key, value in changes:
+        dest = undo_log._get_writable(keys)
+        if isinstance(dest, set):
+            dest -= value
+        else:
+            if dest is undo_log.schema:
+                undo_log._remember(key)
+            del dest[key]
+
+
+_patchers = {
+    ADD: _add,
+    CHANGE: _change,
+    REMOVE: _remove
+}
@@ -0,0 +1,113 @@
+"""Reading scanned documents from secondaries of a replica set, while
+changes are written to the primary only if documents have not been
+changed since they were read
+"""
+__all__ = [
+    'get_read_collection',
+    'get_write_conditions',
+    'is_update_applied'
+]
+
+from typing import Optional, Mapping
+
+from pymongo.collection import Collection
+from pymongo.read_preferences import SecondaryPreferred
+
+from mongoengine_migrate import flags
+
+
+def get_read_collection(collection: Collection) -> Collection:
+    """
+    Return collection object which reads from secondaries if
+    `flags.secondary_reads` is set, with max staleness of
+    `flags.max_staleness` seconds. Otherwise return collection as is
+    :param collection: pymongo collection object
+    :return:
+    """
+    if not flags.secondary_reads:
+        return collection
+
+    read_preference = SecondaryPreferred(max_staleness=flags.max_staleness or -1)
+    return collection.with_options(read_preference=read_preference)
+
+
+def get_write_conditions(original: Mapping,
+                         update: Optional[Mapping],
+                         projection: Optional[Mapping] = None) -> dict:
+    """
+    Return filter conditions which match a document only if its root
+    fields changed by update still have values which they had when
+    document was read. So a write made after a stale read does not
+    overwrite concurrent changes.
+
+    If document was read with projection, then its root fields could
+    be read partially. In this case values of projected dotpaths of
+    changed root fields are compared instead. Changed root fields
+    which were not projected are not checked
+    :param original: document as it was read
+    :param update: update operators or None if the whole document
+     is replaced
+    :param projection: projection which document was read with
+    :return: filter expressions by root fields or projected dotpaths
+    """
+    if update is None:
+        roots = set(original.keys())
+    else:
+        roots = {path.split('.', 1)[0] for fields in update.values() for path in fields}
+    roots.discard('_id')
+
+    if projection is None:
+        paths = roots
+    else:
+        paths = {path for path in projection if path.split('.', 1)[0] in roots}
+
+    conditions = {}
+    for path in sorted(paths):
+        exists, value = _get_by_path(original, path, through_lists=False)
+        if exists is None:
+            continue  # Value inside an array, where dotpath could match several values
+        conditions[path] = {'$eq': value} if exists else {'$exists': False}
+
+    return conditions
+
+
+def is_update_applied(document: Mapping, update: Mapping) -> bool:
+    """
+    Return True if document already contains changes which given
+    `$set`/`$unset` update operators make
+    :param document: document read from the primary
+    :param update: update operators
+    :return:
+    """
+    for path, value in update.get('$set', {}).items():
+        if _get_by_path(document, path) != (True, value):
+            return False
+    for path in update.get('$unset', {}):
+        if _get_by_path(document, path)[0]:
+            return False
+
+    return True
+
+
+def _get_by_path(document: Mapping, dotpath: str, through_lists: bool = True) -> tuple:
+    """
+    Return (True, value) by dotpath or (False, None) if value
+    does not exist
+    :param document: document
+    :param dotpath: dotpath, which could contain array indexes
+    :param through_lists: if False, then (None, None) is returned if
+     a list is met on the path
+    :return:
+    """
+    value = document
+    for part in dotpath.split('.'):
+        if isinstance(value, Mapping) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and not through_lists:
+            return None, None
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return False, None
+
+    return True, value
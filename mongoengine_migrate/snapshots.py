@@ -0,0 +1,122 @@
+"""Snapshots of schema state after migrations, which let a schema
+replay start from the nearest snapshot instead of the first migration
+"""
+__all__ = [
+    'SchemaSnapshots',
+    'get_file_hash'
+]
+
+import hashlib
+import logging
+from typing import Sequence, List, Optional, Tuple
+
+from pymongo.collection import Collection
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.graph import Migration
+from mongoengine_migrate.schema import Schema
+
+log = logging.getLogger('mongoengine-migrate')
+
+
+class SchemaSnapshots:
+    """
+    Snapshots of schema state after migrations of a sequence (in order
+    of applying), such as state after the 10th, 20th, etc. migration.
+    Snapshot is keyed by a hash chained over names and file hashes of
+    its migration and all migrations before it. So a snapshot becomes
+    invalid if any of these files was changed or migrations order has
+    changed, and it is not used then.
+
+    Snapshots are stored in migrations collection, one record per
+    migration
+    """
+    def __init__(self, collection: Collection, migrations: Sequence[Migration]):
+        """
+        :param collection: migrations collection
+        :param migrations: migrations in order of applying
+        """
+        self.collection = collection
+        self.migrations = list(migrations)
+        self.keys = _get_keys(self.migrations)
+        self.key = {'type': 'schema_snapshot'}
+        self._stored = {r['key'] for r in collection.find(self.key, {'key': True})}
+
+    def find(self, stop: Optional[int] = None) -> Tuple[int, Optional[Schema]]:
+        """
+        Find the latest valid snapshot among snapshots of first `stop`
+        migrations
+        :param stop: count of first migrations to look through. All
+         migrations if omitted
+        :return: tuple(count of migrations which snapshot includes,
+         schema). (0, None) if no snapshots found
+        """
+        keys = self.keys[:stop]
+        for position in range(len(keys), 0, -1):
+            key = keys[position - 1]
+            if key not in self._stored:
+                continue
+
+            record = self.collection.find_one({**self.key, 'key': key})
+            if record is not None:
+                log.debug('> Found schema snapshot of %s', self.migrations[position - 1].name)
+                return position, Schema().load(record['value'])
+
+        return 0, None
+
+    def save(self, position: int, schema: Schema, interval: Optional[int] = None) -> bool:
+        """
+        Write snapshot of schema state after first `position`
+        migrations if position is a multiple of interval and snapshot
+        is not stored yet. Does nothing in dry run mode
+        :param position: count of migrations which schema includes
+        :param schema: schema state
+        :param interval: snapshots interval in migrations. Default is
+         `flags.schema_snapshot_interval`, 0 means no snapshots
+        :return: True if snapshot was written
+        """
+        if interval is None:
+            interval = flags.schema_snapshot_interval
+        if flags.dry_run or not interval or position % interval:
+            return False
+
+        key = self.keys[position - 1]
+        if key is None or key in self._stored:
+            return False
+
+        migration_name = self.migrations[position - 1].name
+        log.debug('> Writing schema snapshot of %s', migration_name)
+        fltr = {**self.key, 'migration': migration_name}
+        self.collection.replace_one(fltr, {**fltr, 'key': key, 'value': schema.dump()},
+                                    upsert=True)
+        self._stored.add(key)
+        return True
+
+    def clear(self) -> None:
+        """Remove all snapshots from db"""
+        self.collection.delete_many(self.key)
+        self._stored.clear()
+
+
+def get_file_hash(path: str) -> str:
+    """Return sha256 hex digest of file contents"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _get_keys(migrations: Sequence[Migration]) -> List[Optional[str]]:
+    """Return snapshot keys of migrations. Key is None if migration or
+    one of migrations before it has no file
+    """
+    keys = []
+    key = ''
+    for migration in migrations:
+        if key is not None and migration.path is not None:
+            file_hash = migration.file_hash or get_file_hash(migration.path)
+            source = f'{key}:{migration.name}:{file_hash}'
+            key = hashlib.sha256(source.encode()).hexdigest()
+        else:
+            key = None
+        keys.append(key)
+
+    return keys
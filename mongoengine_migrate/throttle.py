@@ -0,0 +1,172 @@
+"""Throttling of migration writes by replication lag of secondaries"""
+__all__ = [
+    'ReplicationThrottle',
+    'throttle_scope',
+    'get_current_throttle',
+    'wait_for_replication'
+]
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from copy import copy
+from typing import Optional
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from mongoengine_migrate.checkpoints import check_interrupted
+
+log = logging.getLogger('mongoengine-migrate')
+
+#: Replica set member states, see `replSetGetStatus` command
+_PRIMARY_STATE = 1
+_SECONDARY_STATE = 2
+
+#: How often the current write rate is logged, seconds
+_RATE_LOG_INTERVAL = 30.0
+
+#: Throttle which writes currently report to. See `throttle_scope`
+_current_throttle: Optional['ReplicationThrottle'] = None
+
+
+class ReplicationThrottle:
+    """
+    Controller which slows down migration writes when secondaries
+    fall behind the primary. Writers call `wait` after every write,
+    and the throttle polls `replSetGetStatus` not more often than
+    once per poll interval. Lag is the difference between optime of
+    the primary and optime of the most lagging healthy secondary.
+
+    When lag exceeds a half of max lag, a writer sleeps for a time
+    proportional to lag. When lag exceeds max lag, all writers are
+    paused until it drops back. Effective write rate (written
+    documents per second including pauses) is logged periodically.
+
+    If the server is not a replica set member, or the user has no
+    permission to run `replSetGetStatus`, throttling is disabled.
+    """
+    def __init__(self, client: MongoClient, max_lag: float, poll_interval: float):
+        """
+        :param client: client connected to replica set
+        :param max_lag: max replication lag in seconds
+        :param poll_interval: min seconds between status polls
+        """
+        self.client = client
+        self.max_lag = max_lag
+        self.poll_interval = poll_interval
+        self.lag = 0.0
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._written = 0
+        self._rate_started_at = time.monotonic()
+
+    def get_lag(self) -> Optional[float]:
+        """
+        Return the current replication lag in seconds or None if it
+        could not be determined
+        """
+        try:
+            status = self.client.admin.command('replSetGetStatus')
+        except OperationFailure as e:
+            log.warning('Unable to get replica set status, replication lag throttling is '
+                        'disabled: %s', e)
+            self.enabled = False
+            return None
+
+        members = status.get('members', [])
+        primary = next((m for m in members if m.get('state') == _PRIMARY_STATE), None)
+        if primary is None:
+            return None
+
+        secondaries = [
+            m for m in members if m.get('state') == _SECONDARY_STATE and m.get('health', 1)
+        ]
+        lags = [(primary['optimeDate'] - m['optimeDate']).total_seconds() for m in secondaries]
+        return max(lags + [0.0])
+
+    def wait(self, written: int = 0) -> None:
+        """
+        Account written documents and wait if replication lag is too
+        big. Thread-safe, concurrent writers are paused altogether
+        :param written: documents count written since previous call
+        :return:
+        """
+        with self._lock:
+            self._written += written
+            now = time.monotonic()
+            if not self.enabled or now - self._checked_at < self.poll_interval:
+                return
+
+            self._poll()
+            while self.enabled and self.lag > self.max_lag:
+                log.info('Replication lag is %.1fs (max %.1fs), writes are paused',
+                         self.lag, self.max_lag)
+                check_interrupted()
+                time.sleep(self.poll_interval)
+                self._poll()
+
+            half = self.max_lag / 2
+            if self.lag > half:
+                delay = self.poll_interval * (self.lag - half) / half
+                log.debug('> Replication lag is %.1fs, slowing down writes by %.2fs',
+                          self.lag, delay)
+                time.sleep(delay)
+
+            self._log_rate()
+
+    def with_client(self, client: MongoClient) -> 'ReplicationThrottle':
+        """Return the same throttle which uses another client, e.g.
+        opened in another process
+        """
+        res = copy(self)
+        res.client = client
+        res._lock = threading.Lock()
+        return res
+
+    def _poll(self) -> None:
+        lag = self.get_lag()
+        self.lag = 0.0 if lag is None else lag
+        self._checked_at = time.monotonic()
+
+    def _log_rate(self) -> None:
+        elapsed = time.monotonic() - self._rate_started_at
+        if elapsed < _RATE_LOG_INTERVAL:
+            return
+
+        log.info('Write rate: %.1f documents/s, replication lag: %.1fs',
+                 self._written / elapsed, self.lag)
+        self._written = 0
+        self._rate_started_at = time.monotonic()
+
+
+@contextmanager
+def throttle_scope(throttle: Optional[ReplicationThrottle]):
+    """
+    Context manager which sets a throttle which writes report to.
+    None means not to throttle writes
+    :param throttle: throttle object or None
+    """
+    global _current_throttle
+
+    previous = _current_throttle
+    _current_throttle = throttle
+    try:
+        yield
+    finally:
+        _current_throttle = previous
+
+
+def get_current_throttle() -> Optional[ReplicationThrottle]:
+    """Return throttle set by `throttle_scope` or None"""
+    return _current_throttle
+
+
+def wait_for_replication(written: int = 0) -> None:
+    """Report written documents to the current throttle if any, and
+    wait if replication lag is too big
+    """
+    if _current_throttle is not None:
+        _current_throttle.wait(written)
@@ -0,0 +1,335 @@
+__all__ = [
+    'ObservedDict',
+    'ObservedList',
+    'track_changes',
+    'get_changed_paths',
+    'get_update_operators',
+    'is_addressable_key',
+]
+
+from typing import Any, Optional, Set, Tuple, Union
+
+#: Path of a value inside a document, e.g. ('field', 0, 'subfield')
+Path = Tuple[Union[str, int], ...]
+
+_missing = object()
+
+
+def track_changes(document: dict) -> 'ObservedDict':
+    """
+    Wrap a document fetched from database to track changes made with
+    it in-place. Nested dicts and lists are wrapped lazily when they
+    are accessed, so untouched parts of a document are not copied at
+    all
+    :param document: raw document
+    :return: root observed dict
+    """
+    root = ObservedDict(document)
+    root._root = root
+    root._changes = set()
+    return root
+
+
+def get_changed_paths(document: 'ObservedDict') -> Set[Path]:
+    """
+    Return paths of changed values in tracked document. Nested paths
+    of changed value are not included.
+    :param document: root document returned by `track_changes`
+    :return: set of changed paths
+    """
+    return _drop_nested_paths(document._changes)
+
+
+def get_update_operators(document: 'ObservedDict') -> Optional[dict]:
+    """
+    Return update operators dict which applies changes made with
+    tracked document. Changed values are set by `$set`, removed ones
+    are unset by `$unset`. `_id` is never touched.
+    :param document: root document returned by `track_changes`
+    :return: update operators dict, empty dict if document was not
+     changed or None if changes could not be expressed by update
+     operators (e.g. if changed root key contains a dot)
+    """
+    paths = set()
+    for path in document._changes:
+        # Key which could not be used in dotpath makes its parent
+        # to be set entirely
+        for ind, part in enumerate(path):
+            if isinstance(part, str) and not is_addressable_key(part):
+                path = path[:ind]
+                break
+        if not path:
+            return None
+        paths.add(path)
+
+    sets, unsets = {}, {}
+    for path in _drop_nested_paths(paths):
+        if path[0] == '_id':
+            continue
+
+        parent = _resolve(document, path[:-1])
+        while parent is _missing:  # Parent was not changed, but it's broken
+            path = path[:-1]
+            parent = _resolve(document, path[:-1])
+
+        value = _missing
+        if isinstance(parent, dict):
+            value = dict.get(parent, path[-1], _missing)
+        elif isinstance(parent, list) and isinstance(path[-1], int) and path[-1] < len(parent):
+            value = list.__getitem__(parent, path[-1])
+
+        dotpath = '.'.join(str(p) for p in path)
+        if value is not _missing:
+            sets[dotpath] = value
+        elif isinstance(parent, dict):
+            unsets[dotpath] = ''
+        else:
+            sets['.'.join(str(p) for p in path[:-1])] = parent
+
+    update = {}
+    if sets:
+        update['$set'] = sets
+    if unsets:
+        update['$unset'] = unsets
+
+    return update
+
+
+def is_addressable_key(key: Any) -> bool:
+    """Return True if a key could be used as part of dotpath in update
+    operators
+    """
+    return isinstance(key, str) and bool(key) and '.' not in key and not key.startswith('$')
+
+
+def _drop_nested_paths(paths: Set[Path]) -> Set[Path]:
+    """Return paths without ones which are nested to other paths"""
+    result = set()
+    for path in sorted(paths, key=len):
+        if not any(path[:i] in result for i in range(1, len(path))):
+            result.add(path)
+
+    return result
+
+
+def _resolve(document: dict, path: Path) -> Any:
+    """Return value by path without wrapping nested values or
+    `_missing` if path could not be resolved
+    """
+    value = document
+    for part in path:
+        if isinstance(value, dict):
+            value = dict.get(value, part, _missing)
+        elif isinstance(value, list) and isinstance(part, int) and part < len(value):
+            value = list.__getitem__(value, part)
+        else:
+            return _missing
+        if value is _missing:
+            return _missing
+
+    return value
+
+
+def _is_same(old: Any, new: Any) -> bool:
+    """Return True if value assignment does not change anything. Values
+    of different types are treated as different (1 != 1.0)
+    """
+    if old is new:
+        return True
+    if type(old) is not type(new) or isinstance(new, (dict, list)):
+        return False
+
+    return old == new
+
+
+class _Observed:
+    """Common part of observed containers"""
+    #: Root observed dict which keeps set of changed paths. None
+    #: for containers created outside of tracked document
+    _root = None
+
+    #: Path of this container in root document
+    _path: Path = ()
+
+    def _observe(self, key, value):
+        """Wrap nested container value in order to track its changes
+        and bind it to the given key of this container
+        """
+        value_type = type(value)
+        if value_type is dict:
+            value = ObservedDict(value)
+        elif value_type is list:
+            value = ObservedList(value)
+        elif not isinstance(value, _Observed):
+            return value
+
+        path = self._path + (key, )
+        if value._root is not self._root or value._path != path:
+            value._root = self._root
+            value._path = path
+            self._store(key, value)
+
+        return value
+
+    def _store(self, key, value):
+        raise NotImplementedError
+
+    def _mark(self, *key):
+        """Mark this container (or its item if key is given) as
+        changed"""
+        if self._root is not None:
+            self._root._changes.add(self._path + key)
+
+
+class ObservedDict(_Observed, dict):
+    """
+    Dict which reports changes made with it and with its nested values
+    to the root document
+    """
+    def _store(self, key, value):
+        dict.__setitem__(self, key, value)
+
+    def _observe_all(self):
+        for key, value in dict.items(self):
+            if type(value) in (dict, list):
+                self._observe(key, value)
+
+    def __getitem__(self, key):
+        return self._observe(key, dict.__getitem__(self, key))
+
+    def __setitem__(self, key, value):
+        old = dict.get(self, key, _missing)
+        dict.__setitem__(self, key, value)
+        if not _is_same(old, value):
+            self._mark(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._mark(key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._mark(key)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in dict.keys(self):
+            self._mark(key)
+        dict.clear(self)
+
+    def items(self):
+        self._observe_all()
+        return dict.items(self)
+
+    def values(self):
+        self._observe_all()
+        return dict.values(self)
+
+
+class ObservedList(_Observed, list):
+    """
+    List which reports changes made with it and with its nested values
+    to the root document. Every operation which changes list length
+    or items order marks the whole list as changed
+    """
+    def _store(self, key, value):
+        list.__setitem__(self, key, value)
+
+    def _observe_all(self):
+        for ind, value in enumerate(list.__iter__(self)):
+            if type(value) in (dict, list):
+                self._observe(ind, value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._observe_all()
+            return list.__getitem__(self, index)
+
+        value = list.__getitem__(self, index)
+        return self._observe(index if index >= 0 else index + len(self), value)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            list.__setitem__(self, index, value)
+            self._mark()
+            return
+
+        index = index if index >= 0 else index + len(self)
+        old = list.__getitem__(self, index)
+        list.__setitem__(self, index, value)
+        if not _is_same(old, value):
+            self._mark(index)
+
+    def __iter__(self):
+        self._observe_all()
+        return list.__iter__(self)
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._mark()
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, count):
+        list.__imul__(self, count)
+        self._mark()
+        return self
+
+    def append(self, value):
+        list.append(self, value)
+        self._mark()
+
+    def extend(self, values):
+        list.extend(self, values)
+        self._mark()
+
+    def insert(self, index, value):
+        list.insert(self, index, value)
+        self._mark()
+
+    def pop(self, *args):
+        value = list.pop(self, *args)
+        self._mark()
+        return value
+
+    def remove(self, value):
+        list.remove(self, value)
+        self._mark()
+
+    def clear(self):
+        list.clear(self)
+        self._mark()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._mark()
+
+    def reverse(self):
+        list.reverse(self)
+        self._mark()
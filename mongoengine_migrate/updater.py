@@ -1,27 +1,225 @@
 __all__ = [
+    'split_id_ranges',
     'ByPathContext',
     'ByDocContext',
+    'ByPipelineContext',
+    'DocumentScan',
     'DocumentUpdater',
     'FallbackDocumentUpdater'
 ]
 
+import functools
 import logging
-from copy import copy
-from typing import NamedTuple, Optional, List, Union, Callable, Any, Generator, Tuple
-
-import jsonpath_rw
-from pymongo import ReplaceOne
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from copy import copy, deepcopy
+from typing import (
+    NamedTuple,
+    Optional,
+    List,
+    Union,
+    Callable,
+    Any,
+    Generator,
+    Tuple,
+    Set,
+    Iterable
+)
+
+from pymongo import ReplaceOne, UpdateOne, MongoClient
 from pymongo.collection import Collection
 from pymongo.database import Database
-from copy import deepcopy
+from pymongo.errors import OperationFailure
 
 from mongoengine_migrate import flags
+from mongoengine_migrate.bulk import BulkWriteBuffer
+from mongoengine_migrate.checkpoints import (
+    get_scan_checkpoint,
+    scan_activity,
+    check_interrupted,
+    share_interrupt_flag,
+    worker_sigterm_scope,
+    ScanCheckpoint
+)
+from mongoengine_migrate.chunks import ChunkedCollection
+from mongoengine_migrate.docpath import compile_path, PathWalker
+from mongoengine_migrate.embedded_catalog import get_current_catalog, iter_embedded_fields
+from mongoengine_migrate.fusion import (
+    FusionSession,
+    fusion_scope,
+    get_current_session,
+    can_fuse_scan,
+    match_scan_filter
+)
 from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.metrics import (
+    ActionMetrics,
+    MeasuredCollection,
+    metrics_scope,
+    get_current_metrics,
+    record_metrics
+)
+from mongoengine_migrate.pipeline import Prefetcher, BackgroundWriter
+from mongoengine_migrate.rawbson import (
+    iter_raw_documents,
+    index_elements,
+    decode_elements,
+    BSON_OBJECT
+)
+from mongoengine_migrate.profiling import get_event_listeners
+from mongoengine_migrate.progress import ProgressReporter, get_progress_total
 from mongoengine_migrate.schema import Schema
-from mongoengine_migrate.exceptions import InconsistencyError
+from mongoengine_migrate.secondary import (
+    get_read_collection,
+    get_write_conditions,
+    is_update_applied
+)
+from mongoengine_migrate.throttle import get_current_throttle, throttle_scope
+from mongoengine_migrate.tracking import track_changes, get_update_operators
+from mongoengine_migrate.utils import group_by_collection, parse_version
+from mongoengine_migrate.exceptions import InconsistencyError, MigrationError, MigrationInterrupted
 
 log = logging.getLogger('mongoengine-migrate')
 
+#: Scan parameters passed to forked process workers. See
+#: `DocumentUpdater._scan_in_processes`
+_process_scan_state = {}
+
+
+def split_id_ranges(collection: Collection, count: int) -> List[Optional[dict]]:
+    """
+    Split a collection into `count` ranges of `_id` of approximately
+    equal size. Split points are taken from a sorted random sample of
+    `_id` values. The first and the last ranges are open, so the
+    ranges always cover the whole collection.
+    :param collection: pymongo collection object
+    :param count: desired ranges count
+    :return: list of `_id` filter expressions. The list may contain
+     single `None` item if collection could not be split
+    """
+    if count <= 1:
+        return [None]
+
+    pipeline = [
+        {'$sample': {'size': count * flags.PARALLEL_SAMPLES_PER_WORKER}},
+        {'$project': {'_id': 1}},
+        {'$sort': {'_id': 1}}
+    ]
+    sample = [doc['_id'] for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+    if not sample:
+        return [None]
+
+    # Take every n-th sampled _id as a split point. Sorting is
+    # performed by MongoDB, so _id values of various types will be
+    # compared in the same way as a cursor does it
+    step = max(len(sample) // count, 1)
+    points = []
+    for point in sample[step::step][:count - 1]:
+        if not points or points[-1] != point:
+            points.append(point)
+
+    bounds = [None] + points + [None]
+    ranges = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        id_range = {}
+        if lower is not None:
+            id_range['$gte'] = lower
+        if upper is not None:
+            id_range['$lt'] = upper
+        ranges.append(id_range or None)
+
+    return ranges
+
+
+def _get_embedded_fields_info(root_doctypes: Iterable[str],
+                              db_schema: Schema) -> Tuple[Set[str], int]:
+    """
+    Return names of fields which could contain embedded documents in
+    documents of given types and their nested embedded documents, and
+    max nesting depth of such fields. If embedded documents refer to
+    each other recursively, then depth is limited
+    :param root_doctypes: document types
+    :param db_schema: db schema
+    :return: tuple(field names, depth)
+    """
+    max_depth = 32
+    names = set()
+    depths = {}
+    visiting = set()
+
+    def visit(doctype: str) -> int:
+        if doctype in depths:
+            return depths[doctype]
+        if doctype in visiting:
+            return max_depth  # Recursive reference
+
+        visiting.add(doctype)
+        depth = 0
+        for field, field_schema in db_schema.get(doctype, {}).items():
+            ref = field_schema.get('target_doctype')
+            if ref is None or not ref.startswith(flags.EMBEDDED_DOCUMENT_NAME_PREFIX):
+                continue
+            names.add(field)
+            depth = max(depth, 1 + visit(ref))
+        visiting.discard(doctype)
+
+        depths[doctype] = min(depth, max_depth)
+        return depths[doctype]
+
+    return names, max((visit(d) for d in root_doctypes), default=0)
+
+
+def _get_metrics_path(update_path: Iterable[str]) -> str:
+    """Return dotpath to embedded documents which metrics are
+    collected for by update path
+    """
+    return '.'.join(p for p in update_path if p != '$[]')
+
+
+def _pipeline_updates_supported() -> bool:
+    """Return True if MongoDB supports updates with aggregation
+    pipeline (4.2+)
+    """
+    return bool(flags.mongo_version) and parse_version(flags.mongo_version) >= (4, 2)
+
+
+def _scan_in_process(index: int) -> Optional[ActionMetrics]:
+    """Process worker function. Performs a scan with given index in
+    `_process_scan_state`. Returns metrics collected by scan
+    """
+    state = _process_scan_state
+    scan = state['scans'][index]
+    listeners = get_event_listeners()
+    db_name = scan.collection.database.name
+    client = MongoClient(flags.mongo_uri, event_listeners=listeners)
+    client2 = MongoClient(flags.mongo_uri, event_listeners=listeners)
+    db = client.get_database(db_name)
+    database2 = flags.database2
+    flags.database2 = client2.get_database(db_name)
+    try:
+        # Progress of a worker could not be passed to the parent reporter
+        scan = scan._replace(collection=db[scan.collection.name], progress=None)
+        if scan.checkpoint is not None:
+            checkpoint_collection = db.get_collection(scan.checkpoint.collection.name,
+                                                      scan.checkpoint.collection.codec_options)
+            scan = scan._replace(
+                checkpoint=scan.checkpoint.with_collection(checkpoint_collection)
+            )
+        throttle = get_current_throttle()
+        # Metrics are passed to parent, since process memory is not shared
+        metrics = ActionMetrics() if get_current_metrics() is not None else None
+        with throttle_scope(throttle.with_client(client) if throttle else None), \
+                metrics_scope(metrics), worker_sigterm_scope():
+            state['updater']._scan_documents(scan)
+    finally:
+        # Worker process is reused for next scans
+        flags.database2 = database2
+        client.close()
+        client2.close()
+
+    return metrics
+
 
 def build_array_filters(
         self, value: Optional[Union[Callable, Any]] = None
@@ -95,7 +293,9 @@ class ByDocContext(NamedTuple):
     * `collection` -- current collection object
     * `document` -- raw field value which should contain a document.
       Typically this is a dict. But keep in mind that any other value
-      could be contained there on some data inconsistency
+      could be contained there on some data inconsistency. Dicts and
+      lists are `ObservedDict` and `ObservedList`, which track changes
+      made in-place, so only changed paths are written to database
     * `filter_dotpath` -- string dotpath to a field or document which
       have to be updated (depends on whether `Updater.field_name` is
       set or not). Could be empty string which points to all documents
@@ -106,6 +306,61 @@ class ByDocContext(NamedTuple):
     filter_dotpath: str
 
 
+class ByPipelineContext(NamedTuple):
+    """
+    Context of `by_pipeline` callback. Callback builds aggregation
+    expressions which are evaluated by MongoDB against every (embedded)
+    document, so context fields are expressions too
+
+    Fields:
+
+    * `collection` -- current collection object
+    * `document` -- expression which points to a (embedded) document,
+      such as `$field1` or `$$item0`
+    * `value` -- expression which points to the field value in this
+      document. The same as `document` if `Updater.field_name` is
+      not set
+    * `filter_dotpath` -- dotpath of field
+    """
+    collection: Collection
+    document: str
+    value: str
+    filter_dotpath: str
+
+
+class DocumentScan(NamedTuple):
+    """
+    Parameters of documents scan performed by `by_document` update
+
+    Fields:
+
+    * `callback` -- by_doc callback
+    * `collection` -- collection object to scan
+    * `find_fltr` -- filter of documents to scan
+    * `projection` -- projection of document fields to fetch. None
+      means the whole document
+    * `update_path` -- update path (with $[]) of embedded documents
+      which should be passed to the callback
+    * `walker` -- compiled update path which yields those embedded
+      documents
+    * `filter_dotpath` -- dotpath of field
+    * `checkpoint` -- checkpoint of scan if checkpoints are enabled
+    * `range_index` -- index of `_id` range in checkpoint which this
+      scan handles
+    * `progress` -- progress reporter shared by scans of all ranges
+    """
+    callback: Callable
+    collection: Collection
+    find_fltr: dict
+    projection: Optional[dict]
+    update_path: Tuple[str, ...]
+    walker: PathWalker
+    filter_dotpath: str
+    checkpoint: Optional[ScanCheckpoint] = None
+    range_index: int = 0
+    progress: Optional[ProgressReporter] = None
+
+
 class DocumentUpdater:
     """Document updater class. Used to update certain field in
     collection or embedded document
@@ -178,6 +433,11 @@ class DocumentUpdater:
           is used for pointing
         * array_filters - dict with array filters which could be
           passed to update_many method for instance
+
+        `update_many` calls made by callback for paths of embedded
+        document in a collection are merged into one call where
+        possible, the rest are sent by one ordered `bulk_write`. See
+        `FusionSession`
         :param callback:
         :return:
         """
@@ -187,10 +447,20 @@ class DocumentUpdater:
             self._update_by_path(callback, collection, [], [])
             return
 
-        for collection, update_path, filter_path in self._get_embedded_paths():
-            self._update_by_path(callback, collection, filter_path, update_path)
+        session = get_current_session()
+        if session is not None:
+            # Updates are queued to session of fused actions
+            for collection, update_path, filter_path in self._get_embedded_paths():
+                self._update_by_path(callback, collection, filter_path, update_path)
+            return
+
+        session = FusionSession()
+        with fusion_scope(session):
+            for collection, update_path, filter_path in self._get_embedded_paths():
+                self._update_by_path(callback, collection, filter_path, update_path)
+            session.flush()
 
-    def update_by_document(self, callback: Callable) -> None:
+    def update_by_document(self, callback: Callable, value_fltr: Optional[dict] = None) -> None:
         """
         Call the given callback for every document of needed
         type found in db. If field contains array of documents then
@@ -205,22 +475,73 @@ class DocumentUpdater:
           embedded document
         * filter_path -- dotpath of field
         :param callback:
+        :param value_fltr: optional query expression for field value,
+         such as `{'$type': 'string'}`. Only documents which field
+         matches this expression will be fetched. Keep in mind that
+         expression is matched against array items as well. Ignored if
+         `field_name` is not set or missed fields are included
+        :return:
+        """
+        if not self.is_embedded:
+            collection_name = self.db_schema[self.document_type].parameters['collection']
+            collection = self.db[collection_name]
+            self._update_by_document(callback, collection, [], [], value_fltr)
+            return
+
+        for collection, update_path, filter_path in self._get_embedded_paths():
+            self._update_by_document(callback, collection, filter_path, update_path, value_fltr)
+
+    def update_by_pipeline(self,
+                           callback: Callable,
+                           by_doc_callback: Callable,
+                           value_fltr: Optional[dict] = None) -> None:
+        """
+        Update every document of needed type by one `update_many`
+        call with aggregation pipeline per path. So documents are
+        changed on server side without fetching them. If field
+        contains array of documents then every of them is updated.
+
+        Callback gets `ByPipelineContext` and returns dict with
+        changes of (embedded) document: field names and aggregation
+        expressions of their new values. `'$$REMOVE'` value removes
+        a field. Documents which do not contain `field_name` and
+        values which are not documents are left untouched.
+
+        Updates with aggregation pipeline are supported by MongoDB
+        4.2+. On earlier versions (or if a path could not be updated
+        by pipeline) a given by_doc callback is used instead
+        :param callback: by_pipeline callback
+        :param by_doc_callback: by_doc callback which does the same
+        :param value_fltr: optional query expression for field value,
+         see `update_by_document`
         :return:
         """
+        if not _pipeline_updates_supported():
+            log.debug('MongoDB version does not support updates with aggregation pipeline. '
+                      'Using by_doc callback')
+            FallbackDocumentUpdater(self).update_by_pipeline(callback, by_doc_callback, value_fltr)
+            return
+
         if not self.is_embedded:
             collection_name = self.db_schema[self.document_type].parameters['collection']
             collection = self.db[collection_name]
-            self._update_by_document(callback, collection, [], [])
+            self._update_by_pipeline(callback, collection, [], [], value_fltr)
             return
 
         for collection, update_path, filter_path in self._get_embedded_paths():
-            self._update_by_document(callback, collection, filter_path, update_path)
+            if self._can_update_by_pipeline(update_path):
+                self._update_by_pipeline(callback, collection, filter_path, update_path,
+                                         value_fltr)
+            else:
+                self._update_by_document(by_doc_callback, collection, filter_path, update_path,
+                                         value_fltr)
 
     def update_combined(self,
                         by_path_cb: Callable,
                         by_doc_cb: Callable,
                         embedded_nonarray_by_doc: bool = True,
-                        embedded_array_by_doc: bool = True) -> None:
+                        embedded_array_by_doc: bool = True,
+                        by_pipeline_cb: Optional[Callable] = None) -> None:
         """
         Perform an update depending on document type. Usual documents
         will get updated using by_path.
@@ -251,14 +572,20 @@ class DocumentUpdater:
         :param embedded_nonarray_by_doc: if True then embedded docs with
          non-array dotpaths (without "$[]") will get updated using
          by_doc callback, or by_path otherwise.
+        :param by_pipeline_cb: optional "by_pipeline" callback which
+         is used instead of by_doc callback if MongoDB supports
+         updates with aggregation pipeline
         """
+        use_pipeline = by_pipeline_cb is not None and _pipeline_updates_supported()
         if self.is_embedded:
             for collection, update_path, filter_path in self._get_embedded_paths():
                 is_array_update = bool('$[]' in update_path)
                 call_by_doc = is_array_update and embedded_array_by_doc \
                     or not is_array_update and embedded_nonarray_by_doc
 
-                if call_by_doc:
+                if call_by_doc and use_pipeline and self._can_update_by_pipeline(update_path):
+                    self._update_by_pipeline(by_pipeline_cb, collection, filter_path, update_path)
+                elif call_by_doc:
                     self._update_by_document(by_doc_cb, collection, filter_path, update_path)
                 else:
                     self._update_by_path(by_path_cb, collection, filter_path, update_path)
@@ -272,6 +599,7 @@ class DocumentUpdater:
                         collection: Collection,
                         filter_path: List[str],
                         update_path: List[str]) -> None:
+        metrics_path = '.'.join(filter_path)
         if self.field_name:
             filter_path = filter_path + [self.field_name]  # Don't modify filter_path
             update_path = update_path + [self.field_name]  #
@@ -281,6 +609,12 @@ class DocumentUpdater:
 
         filter_dotpath = '.'.join(filter_path)
         update_dotpath = '.'.join(update_path)
+        if flags.by_path_chunk_size:
+            collection = ChunkedCollection(collection)
+        collection = MeasuredCollection(collection, metrics_path)
+        session = get_current_session()
+        if session is not None:
+            collection = session.wrap(collection)
         ctx = ByPathContext(collection=collection,
                             filter_dotpath=filter_dotpath,
                             update_dotpath=update_dotpath,
@@ -292,7 +626,8 @@ class DocumentUpdater:
                             callback: Callable,
                             collection: Collection,
                             filter_path: List[str],
-                            update_path: List[str]) -> None:
+                            update_path: List[str],
+                            value_fltr: Optional[dict] = None) -> None:
         """
         Call a callback for every document found by given filterpath
         :param callback: by_doc callback
@@ -302,6 +637,7 @@ class DocumentUpdater:
          pointed which document to pick and call the callback
          for each of them (nested array of embedded documents for
          instance). If None is passed then we pick a document itself
+        :param value_fltr: optional query expression for field value
         :return:
         """
         field_filter_path = copy(filter_path)
@@ -309,70 +645,627 @@ class DocumentUpdater:
             field_filter_path += [self.field_name]
         filter_dotpath = '.'.join(field_filter_path)
 
-        if not update_path:
-            json_path = '$'  # update_path points to any document
+        # Empty update_path points to a document itself
+        update_path = tuple(update_path)
+        walker = compile_path(update_path)
+
+        find_fltr = self._get_find_filter(filter_dotpath, value_fltr)
+        if flags.dry_run:
+            msg = '* db.%s.find(%s) -> [Loop](%s) -> db.%s.bulk_write(...)'
+            log.info(msg, collection.name, find_fltr, filter_dotpath, collection.name)
+            return
+
+        scan = DocumentScan(callback=callback,
+                            collection=collection,
+                            find_fltr=find_fltr,
+                            projection=self._get_projection(list(update_path)),
+                            update_path=update_path,
+                            walker=walker,
+                            filter_dotpath=filter_dotpath)
+
+        session = get_current_session()
+        if session is not None:
+            if can_fuse_scan(find_fltr):
+                session.add_scan(self, scan)
+                return
+            session.flush()
+
+        self._run_scan(scan)
+
+    def _run_scan(self, scan: DocumentScan) -> None:
+        """
+        Perform a scan, maybe split into `_id` ranges processed by
+        parallel workers and resumed from a checkpoint
+        :param scan: scan parameters
+        :return:
+        """
+        collection = scan.collection
+        find_fltr = scan.find_fltr
+        workers = flags.parallel_workers
+        record_metrics(collection.name, _get_metrics_path(scan.update_path), passes=1)
+        checkpoint = get_scan_checkpoint(collection.name, scan.filter_dotpath, scan.update_path)
+        ranges = checkpoint.load() if checkpoint else None
+        resumed = ranges is not None
+        if resumed:
+            log.debug('> Resume scan of %s from checkpoint', collection.name)
+        else:
+            id_ranges = split_id_ranges(collection, workers) if workers > 1 else [None]
+            ranges = ScanCheckpoint.new_ranges(id_ranges)
+            if checkpoint:
+                checkpoint.start(ranges)
+
+        progress = None
+        if flags.progress_interval:
+            path = _get_metrics_path(scan.update_path)
+            id_filters = None
+            if resumed:
+                id_filters = [ScanCheckpoint.range_filter(r) for r in ranges if not r['done']]
+            progress = ProgressReporter(collection.name + (f' {path}' if path else ''),
+                                        get_progress_total(collection, find_fltr, id_filters))
+
+        scans = []
+        for index, id_range in enumerate(ranges):
+            if id_range['done']:
+                continue
+            id_fltr = ScanCheckpoint.range_filter(id_range)
+            scans.append(scan._replace(
+                find_fltr={**find_fltr, '_id': id_fltr} if id_fltr else find_fltr,
+                checkpoint=checkpoint,
+                range_index=index,
+                progress=progress
+            ))
+
+        if workers > 1 and len(scans) > 1:
+            log.debug('> Scan %s using %d %s workers, %d _id ranges',
+                      collection.name, workers, flags.parallel_executor, len(scans))
+            if flags.parallel_executor == 'process':
+                self._scan_in_processes(scans)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(self._scan_documents, s) for s in scans]
+                    for future in futures:
+                        future.result()  # Reraise worker exception if any
+        else:
+            for s in scans:
+                self._scan_documents(s)
+
+        if progress is not None:
+            progress.finish()
+
+    def _update_by_pipeline(self,
+                            callback: Callable,
+                            collection: Collection,
+                            filter_path: List[str],
+                            update_path: List[str],
+                            value_fltr: Optional[dict] = None) -> None:
+        """
+        Update documents found by given filterpath by one `update_many`
+        call with aggregation pipeline built by a by_pipeline callback
+        :param callback: by_pipeline callback
+        :param collection: pymongo.Collection object
+        :param filter_path: filter dotpath to substitute to find()
+        :param update_path: update dotpath (with $[]) which points to
+         embedded documents to update. Empty list points to a
+         document itself
+        :param value_fltr: optional query expression for field value
+        :return:
+        """
+        field_filter_path = copy(filter_path)
+        if self.field_name:
+            field_filter_path += [self.field_name]
+        filter_dotpath = '.'.join(field_filter_path)
+        find_fltr = self._get_find_filter(filter_dotpath, value_fltr)
+        session = get_current_session()
+        if session is not None:
+            session.flush()
+
+        if update_path:
+            root_field = update_path[0]
+            new_value = self._build_pipeline_expr(callback,
+                                                  collection,
+                                                  filter_dotpath,
+                                                  tuple(update_path[1:]),
+                                                  f'${root_field}')
+            changes = {root_field: new_value}
         else:
-            # update_path is mongo update path
-            json_path = '.'.join(f.replace('$[]', '[*]') for f in update_path)
-            json_path = json_path.replace('.[*]', '[*]')
-        parser = jsonpath_rw.parse(json_path)
+            ctx = ByPipelineContext(collection=collection,
+                                    document='$$ROOT',
+                                    value=f'${self.field_name}' if self.field_name else '$$ROOT',
+                                    filter_dotpath=filter_dotpath)
+            changes = callback(ctx)
+            if self.field_name and self._include_missed_fields:
+                # Keep documents without the field untouched
+                changes = {
+                    k: {'$cond': [{'$eq': [{'$type': ctx.value}, 'missing']}, f'${k}', v]}
+                    for k, v in changes.items()
+                }
+
+        try:
+            res = collection.update_many(find_fltr, [{'$set': changes}])
+        except OperationFailure as e:
+            # Such as value which could not be converted by $convert
+            raise MigrationError(f'Unable to update field {collection.name}.{filter_dotpath} '
+                                 f'by pipeline: {e}') from e
+        record_metrics(collection.name, '.'.join(filter_path), passes=1,
+                       update_many_matched=getattr(res, 'matched_count', 0),
+                       update_many_modified=getattr(res, 'modified_count', 0))
+
+    def _build_pipeline_expr(self,
+                             callback: Callable,
+                             collection: Collection,
+                             filter_dotpath: str,
+                             update_path: Tuple[str, ...],
+                             expr: str,
+                             _depth: int = 0) -> dict:
+        """
+        Build aggregation expression which evaluates to the new value
+        of value pointed by `expr`, where embedded documents found by
+        the rest of update path are changed by a by_pipeline callback.
+        Values are traversed the same way as `compile_path` does
+        :param callback: by_pipeline callback
+        :param collection: collection object
+        :param filter_dotpath: dotpath of field
+        :param update_path: the rest of update path
+        :param expr: expression which points to the current value
+        :return: aggregation expression
+        """
+        if not update_path:
+            return self._build_pipeline_document_expr(callback, collection, filter_dotpath, expr)
+
+        part = update_path[0]
+        if part == '$[]':
+            # Non-array value is treated as single-item array
+            item, mapped = f'item{_depth}', f'mapped{_depth}'
+            item_expr = self._build_pipeline_expr(callback, collection, filter_dotpath,
+                                                  update_path[1:], f'$${item}', _depth + 1)
+            is_array = {'$isArray': expr}
+            return {'$cond': [
+                {'$eq': [{'$type': expr}, 'missing']},
+                expr,
+                {'$let': {
+                    'vars': {mapped: {'$map': {
+                        'input': {'$cond': [is_array, expr, [expr]]},
+                        'as': item,
+                        'in': item_expr
+                    }}},
+                    'in': {'$cond': [is_array, f'$${mapped}', {'$arrayElemAt': [f'$${mapped}', 0]}]}
+                }}
+            ]}
+
+        field_expr = self._build_pipeline_expr(callback, collection, filter_dotpath,
+                                               update_path[1:], f'{expr}.{part}', _depth)
+        return {'$cond': [
+            {'$eq': [{'$type': expr}, 'object']},
+            {'$mergeObjects': [expr, {part: field_expr}]},
+            expr
+        ]}
+
+    def _build_pipeline_document_expr(self,
+                                      callback: Callable,
+                                      collection: Collection,
+                                      filter_dotpath: str,
+                                      expr: str) -> dict:
+        """
+        Build aggregation expression which evaluates to embedded
+        document pointed by `expr` changed by a by_pipeline callback.
+        Values which are not documents, documents without the field
+        and documents of another class are left as is
+        """
+        value = f'{expr}.{self.field_name}' if self.field_name else expr
+        ctx = ByPipelineContext(collection=collection,
+                                document=expr,
+                                value=value,
+                                filter_dotpath=filter_dotpath)
+        changes = callback(ctx)
+
+        conditions = [{'$eq': [{'$type': expr}, 'object']}]
+        if self.field_name:
+            conditions.append({'$ne': [{'$type': value}, 'missing']})
+        if self.document_cls:
+            cls_expr = f'{expr}._cls'
+            conditions.append({'$or': [
+                {'$eq': [{'$type': cls_expr}, 'missing']},
+                {'$eq': [cls_expr, self.document_cls]}
+            ]})
+
+        removed = [k for k, v in changes.items() if v == '$$REMOVE']
+        new_document = {'$mergeObjects': [
+            expr,
+            {k: v for k, v in changes.items() if k not in removed}
+        ]}
+        if removed:
+            new_document = {'$arrayToObject': {'$filter': {
+                'input': {'$objectToArray': new_document},
+                'cond': {'$not': [{'$in': ['$$this.k', removed]}]}
+            }}}
+
+        return {'$cond': [{'$and': conditions}, new_document, expr]}
+
+    def _can_update_by_pipeline(self, update_path: List[str]) -> bool:
+        """
+        Return True if embedded documents by given update path could
+        be updated by aggregation pipeline. Field names with dots or
+        dollar sign could not be addressed in aggregation expressions.
+        Strict policy requires an error on a non-document value of
+        inherited document, which could not be raised by pipeline
+        """
+        fields = [p for p in update_path if p != '$[]'] + [self.field_name]
+        if any('.' in f or f.startswith('$') for f in fields):
+            return False
 
+        return not (update_path and self.document_cls
+                    and self.migration_policy.name == 'strict')
+
+    def _get_find_filter(self, filter_dotpath: str, value_fltr: Optional[dict]) -> dict:
+        """
+        Return filter of documents which contain the field
+        :param filter_dotpath: dotpath of field
+        :param value_fltr: optional query expression for field value
+        :return: filter dict
+        """
         find_fltr = {}
         if not self._include_missed_fields and filter_dotpath:
             find_fltr = {filter_dotpath: {'$exists': True}}
+            if value_fltr and self.field_name:
+                find_fltr[filter_dotpath].update(value_fltr)
         if self.document_cls:
             find_fltr['_cls'] = self.document_cls
 
-        if flags.dry_run:
-            msg = '* db.%s.find(%s) -> [Loop](%s) -> db.%s.bulk_write(...)'
-            log.info(msg, collection.name, find_fltr, filter_dotpath, collection.name)
-            return
+        return find_fltr
+
+    def _get_projection(self, update_path: List[str]) -> Optional[dict]:
+        """
+        Return projection which contains only fields which a by_doc
+        callback could work with plus `_id` and `_cls`.
+
+        If update path contains arrays then the whole array will be
+        fetched, because projection through arrays drops non-object
+        array items which shifts items positions.
+        :param update_path: update path (with $[])
+        :return: projection dict or None if the whole document is
+         needed
+        """
+        if '$[]' in update_path:
+            base_path = update_path[:update_path.index('$[]')]
+            fields = ['.'.join(base_path)]
+        elif self.field_name:
+            fields = ['.'.join(update_path + [self.field_name])]
+            if self.document_cls:
+                fields.append('.'.join(update_path + ['_cls']))
+        elif update_path:
+            fields = ['.'.join(update_path)]
+        else:
+            return None  # Callback works with the whole document
+
+        return {'_id': True, '_cls': True, **{f: True for f in fields}}
 
+    def _scan_documents(self, scan: DocumentScan) -> None:
+        """
+        Call a by_doc callback for every embedded document in documents
+        found by a given filter and write changes back. Only changed
+        fields are written.
+        This is a unit of work of one scan worker, so it uses its own
+        cursor and its own bulk buffer. If `flags.pipeline` is set,
+        then reading and writing are made in background threads
+        :param scan: scan parameters
+        :return:
+        """
         bulk_db = flags.database2
-        bulk_collection = bulk_db[collection.name]
+        bulk_collection = bulk_db[scan.collection.name]
+        checkpoint = scan.checkpoint
+        on_flush = None
+        if checkpoint is not None:
+            on_flush = functools.partial(checkpoint.save_position, scan.range_index)
+        metrics_path = _get_metrics_path(scan.update_path)
+        scanned = 0
+        progress = scan.progress
+        # Documents read from a secondary could be stale, so writes
+        # are conditioned on values which were read
+        conditional = flags.secondary_reads
+        on_write = None
+        written = {}
+        if conditional:
+            on_write = functools.partial(self._resolve_conflicts, scan, bulk_collection, written)
+
+        with scan_activity(), ExitStack() as stack:
+            if flags.raw_scan and scan.projection is not None:
+                documents = self._find_raw_documents(scan)
+            else:
+                documents = get_read_collection(scan.collection).find(scan.find_fltr,
+                                                                      scan.projection)
+                if checkpoint is not None:
+                    documents = documents.sort('_id', 1)
+            writer = None
+            if flags.pipeline:
+                # Read and write in separate threads while callbacks
+                # are called in this one
+                documents = stack.enter_context(Prefetcher(documents,
+                                                           flags.PIPELINE_BATCH_SIZE,
+                                                           flags.PIPELINE_QUEUE_SIZE))
+                writer = stack.enter_context(BackgroundWriter(bulk_collection,
+                                                              flags.PIPELINE_QUEUE_SIZE))
+            buf = stack.enter_context(BulkWriteBuffer(bulk_collection,
+                                                      writer=writer,
+                                                      on_flush=on_flush,
+                                                      on_write=on_write,
+                                                      metrics_path=metrics_path))
+            stack.callback(lambda: record_metrics(scan.collection.name, metrics_path,
+                                                  documents_scanned=scanned))
+
+            for doc in documents:
+                check_interrupted()
+                scanned += 1
+                if progress is not None:
+                    progress.advance()
+                doc_id = doc['_id']
+                original = deepcopy(doc) if conditional else None
+                projection = scan.projection
+                doc = track_changes(doc)
+                self._apply_callback(doc, scan)
+
+                # Write a document only if it was changed by callback
+                update = get_update_operators(doc)
+                if update is None and scan.projection is not None:
+                    # Changes could be written only by replacing the
+                    # document, but it was fetched partially. So read
+                    # the whole document and call callback for it again
+                    doc = scan.collection.find_one({'_id': doc_id})
+                    if doc is None:
+                        update = {}  # Document has been deleted
+                    else:
+                        original = deepcopy(doc) if conditional else None
+                        projection = None
+                        doc = track_changes(doc)
+                        self._apply_callback(doc, scan)
+                        update = get_update_operators(doc)
+                if update != {}:
+                    fltr = {'_id': doc_id}
+                    if conditional:
+                        fltr.update(get_write_conditions(original, update, projection))
+                    if update is None:
+                        request, payload = ReplaceOne(fltr, doc, upsert=False), doc
+                    else:
+                        request, payload = UpdateOne(fltr, update, upsert=False), update
+                    if conditional:
+                        written[id(request)] = (doc_id, update, payload)
+                    buf.append(request, payload)
+
+                # Changes of documents up to this one are buffered
+                buf.advance(doc_id)
+
+        if checkpoint is not None:
+            checkpoint.finish(scan.range_index)
+
+    def _resolve_conflicts(self,
+                           scan: DocumentScan,
+                           collection: Collection,
+                           written: dict,
+                           requests: list,
+                           result: Any) -> None:
+        """
+        Bulk write callback used when documents are read from
+        secondaries. If some conditional requests have not matched,
+        i.e. documents were changed after they had been read, then
+        every document of the bulk which does not contain written
+        changes is read from the primary and processed again
+        :param scan: scan parameters
+        :param collection: collection to write to
+        :param written: document `_id`, update operators (None means
+         replacement) and payload by request object id. Entries of
+         given requests are removed
+        :param requests: written requests
+        :param result: `BulkWriteResult` object
+        :return:
+        """
+        entries = [written.pop(id(request)) for request in requests]
+        if result.matched_count >= len(requests):
+            return
 
-        buf = []
-        for doc in collection.find(find_fltr):
-            prev_doc = deepcopy(doc)
+        for doc_id, update, payload in entries:
+            applied = self._rewrite_document(scan, collection, doc_id, update, payload)
+            if not applied:
+                raise MigrationError(f'Unable to write changes of document {doc_id!r} in '
+                                     f'{collection.name}: it is being changed concurrently')
+
+    def _rewrite_document(self,
+                          scan: DocumentScan,
+                          collection: Collection,
+                          doc_id: Any,
+                          update: Optional[dict],
+                          payload: dict) -> bool:
+        """
+        Read a document from the primary and write its changes again
+        with the same conditions as in `_scan_documents`. Return False
+        if document was changed concurrently on every attempt
+        """
+        # Replaced document was read entirely
+        projection = scan.projection if update is not None else None
+        for _ in range(flags.SECONDARY_READ_WRITE_RETRIES):
+            doc = collection.find_one({'_id': doc_id}, projection)
+            if doc is None:
+                return True  # Document has been deleted
+            if update is None and doc == payload or update and is_update_applied(doc, update):
+                return True
+
+            original = deepcopy(doc)
+            doc = track_changes(doc)
+            self._apply_callback(doc, scan)
+            update = get_update_operators(doc)
+            if update == {}:
+                return True
+            if update is None and projection is not None:
+                # Partially read document could not be replaced
+                projection = None
+                continue
 
-            # Recursively apply the callback to every embedded doc
-            for embedded_doc in parser.find(doc):
-                embedded_doc = embedded_doc.value
-                if self.document_cls:
-                    if embedded_doc is None:
+            fltr = {'_id': doc_id, **get_write_conditions(original, update, projection)}
+            if update is None:
+                payload = doc
+                res = collection.replace_one(fltr, doc)
+            else:
+                res = collection.update_one(fltr, update)
+            if res.matched_count:
+                return True
+
+        return False
+
+    def _apply_callback(self, doc: dict, scan: DocumentScan) -> None:
+        """Call scan callback for every embedded document found in
+        a given document by scan update path
+        """
+        # Recursively apply the callback to every embedded doc
+        for embedded_doc in scan.walker(doc):
+            if self.document_cls:
+                if embedded_doc is None:
+                    continue
+                if not isinstance(embedded_doc, dict):
+                    # Field contains smth another than embedded doc
+                    if self.migration_policy.name == 'strict':
+                        raise InconsistencyError(
+                            f"Field {scan.filter_dotpath} has wrong value {embedded_doc!r} "
+                            f"(should be embedded document) in record {doc}"
+                        )
+                    else:
                         continue
-                    if not isinstance(embedded_doc, dict):
-                        # Field contains smth another than embedded doc
-                        if self.migration_policy.name == 'strict':
-                            raise InconsistencyError(
-                                f"Field {filter_dotpath} has wrong value {embedded_doc!r} "
-                                f"(should be embedded document) in record {doc}"
-                            )
-                        else:
-                            continue
-                    if embedded_doc.get('_cls', self.document_cls) != self.document_cls:
-                        # Skip since document doesn't belong to
-                        # document class (document inheritance,
-                        # DynamicField)
-                        # See `DocumentMetaclass` implementation
+                if embedded_doc.get('_cls', self.document_cls) != self.document_cls:
+                    # Skip since document doesn't belong to
+                    # document class (document inheritance,
+                    # DynamicField)
+                    # See `DocumentMetaclass` implementation
+                    continue
+            ctx = ByDocContext(collection=scan.collection,
+                               document=embedded_doc,
+                               filter_dotpath=scan.filter_dotpath)
+            # Callback should change a dict in-place
+            callback = scan.callback
+            callback(ctx)
+
+    def _run_fused_scan(self, jobs: List[Tuple['DocumentUpdater', DocumentScan]]) -> None:
+        """
+        Perform several scans of the same collection by one pass.
+        Callbacks of every scan are called in order for every document
+        which matches the scan filter at the moment. Since a scan
+        changes only documents which it fetched, filters union fetches
+        every document which the next scans would fetch
+        :param jobs: updater objects and scans which they would perform
+        :return:
+        """
+        if len(jobs) == 1:
+            updater, scan = jobs[0]
+            updater._run_scan(scan)
+            return
+
+        filters = []
+        for _, scan in jobs:
+            if scan.find_fltr not in filters:
+                filters.append(scan.find_fltr)
+        find_fltr = filters[0] if len(filters) == 1 else {'$or': filters}
+        if {} in filters:
+            find_fltr = {}
+
+        projection = None
+        if all(scan.projection is not None for _, scan in jobs):
+            fields = {f for _, scan in jobs for f in scan.projection}
+            # Projection could not contain both a field and its subfield
+            projection = {
+                f: True for f in sorted(fields)
+                if not any(f.startswith(p + '.') for p in fields)
+            }
+
+        def callback(ctx: ByDocContext):
+            for updater, job_scan in jobs:
+                if match_scan_filter(ctx.document, job_scan.find_fltr):
+                    updater._apply_callback(ctx.document, job_scan)
+
+        log.debug('> Scan %s once for %d by_doc updates',
+                  jobs[0][1].collection.name, len(jobs))
+        scan = DocumentScan(callback=callback,
+                            collection=jobs[0][1].collection,
+                            find_fltr=find_fltr,
+                            projection=projection,
+                            update_path=(),
+                            walker=compile_path(()),
+                            filter_dotpath='')
+        # The whole document is passed to callback
+        updater = copy(self).with_missed_fields()
+        updater.field_name = ''
+        updater.document_cls = None
+        updater._run_scan(scan)
+
+    def _find_raw_documents(self, scan: DocumentScan) -> Generator[dict, None, None]:
+        """
+        Find documents by scan parameters, but read them as raw BSON
+        batches. Only `_id`, `_cls` and root fields of projection are
+        decoded. Documents which root field has a type which update
+        path could not go through are skipped without decoding
+        :param scan: scan parameters
+        :return: partially decoded documents
+        """
+        update_path = scan.update_path
+        root_field = update_path[0] if update_path else self.field_name
+        # Walker goes into field of the root value, so it could be
+        # only embedded document
+        root_types = None
+        if len(update_path) > 1 and update_path[1] != '$[]':
+            root_types = (BSON_OBJECT, )
+        names = {'_id', '_cls'} | {f.split('.', 1)[0] for f in scan.projection}
+        codec_options = scan.collection.codec_options
+
+        sort = [('_id', 1)] if scan.checkpoint is not None else None
+        batches = get_read_collection(scan.collection).find_raw_batches(scan.find_fltr,
+                                                                        scan.projection,
+                                                                        sort=sort)
+        for batch in batches:
+            for raw in iter_raw_documents(batch):
+                elements = index_elements(raw, names)
+                root = elements.get(root_field)
+                if root is None and (update_path or not self._include_missed_fields):
+                    continue
+                if root is not None and root_types and root[0] not in root_types:
+                    continue
+
+                yield decode_elements(raw, elements.values(), codec_options)
+
+    def _scan_in_processes(self, scans: List[DocumentScan]) -> None:
+        """
+        Run `_scan_documents` for every given scan in a pool of
+        forked processes. Callbacks are usually closures which could
+        not be pickled, so they are passed to children through process
+        memory copy made by fork. Every child opens its own connections
+        since MongoClient is not fork-safe.
+
+        If SIGTERM is received, then all workers stop gracefully, and
+        MigrationInterrupted is raised after all of them have finished
+        """
+        if not flags.mongo_uri:
+            raise MigrationError('Process workers require MongoDB URI to be set')
+
+        _process_scan_state.update(updater=self, scans=scans)
+        ctx = multiprocessing.get_context('fork')
+        errors = []
+        try:
+            with share_interrupt_flag(ctx), ctx.Pool(flags.parallel_workers) as pool:
+                results = [pool.apply_async(_scan_in_process, (index, ))
+                           for index in range(len(scans))]
+                # Wait for all workers, so they could write buffered
+                # changes before the pool is terminated
+                metrics = get_current_metrics()
+                for result in results:
+                    try:
+                        worker_metrics = result.get()
+                    except Exception as e:
+                        errors.append(e)
                         continue
-                ctx = ByDocContext(collection=collection,
-                                   document=embedded_doc,
-                                   filter_dotpath=filter_dotpath)
-                # Callback should change a dict in-place
-                callback(ctx)
-
-            # Write a document only if it was changed by callback
-            if prev_doc != doc:
-                buf.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=False))
-
-            # Flush buffer
-            if len(buf) >= flags.BULK_BUFFER_LENGTH:
-                bulk_collection.bulk_write(buf, ordered=False)
-                buf.clear()
-        if buf:
-            bulk_collection.bulk_write(buf, ordered=False)
-            buf.clear()
+                    if metrics is not None and worker_metrics is not None:
+                        metrics.merge(worker_metrics)
+        finally:
+            _process_scan_state.clear()
+
+        # Reraise workers exception if any, the real error first
+        errors.sort(key=lambda e: isinstance(e, MigrationInterrupted))
+        if errors:
+            raise errors[0]
+        check_interrupted()
 
     def _get_embedded_paths(self) -> Generator[Tuple[Collection, list, list], None, None]:
         """
@@ -387,14 +1280,34 @@ class DocumentUpdater:
         if not self.is_embedded:
             return
 
-        # Document types of non-embedded documents
-        document_types = ((name, schema) for name, schema in self.db_schema.items()
-                          if not name.startswith(flags.EMBEDDED_DOCUMENT_NAME_PREFIX))
+        # Paths are searched in data, so all changes have to be written
+        session = get_current_session()
+        catalog = get_current_catalog()
+        if catalog is not None:
+            def discover(collection_name: str, document_types: List[str]):
+                if session is not None:
+                    session.flush()
+                return self._find_all_embedded_fields(self.db[collection_name],
+                                                      document_types,
+                                                      self.db_schema)
+
+            locations = catalog.get_locations(self.document_type, self.db_schema, discover)
+            for collection_name, update_path in locations:
+                filter_path = [p for p in update_path if p != '$[]']
+                yield self.db[collection_name], update_path, filter_path
+            return
+
+        if session is not None:
+            session.flush()
 
-        for document_type, document_schema in document_types:
-            collection = self.db[document_schema.parameters['collection']]
+        # Derived documents are stored in the same collection as their
+        # parent, so every collection is searched and updated once.
+        # Embedded documents of certain class are filtered by `_cls`
+        # during update, see `document_cls`
+        for collection_name, document_types in group_by_collection(self.db_schema).items():
+            collection = self.db[collection_name]
             for path in self._find_embedded_fields(collection,
-                                                   document_type,
+                                                   document_types,
                                                    self.document_type,
                                                    self.db_schema):
                 update_path = path  # type: list
@@ -404,13 +1317,178 @@ class DocumentUpdater:
 
     def _find_embedded_fields(self,
                               collection: Collection,
-                              root_doctype: str,
+                              root_doctypes: List[str],
                               search_doctype: str,
+                              db_schema: Schema) -> Generator[list, None, None]:
+        """
+        Search for embedded document fields of given type in given
+        collection and return key paths to them. Paths for fields
+        which contain objects and arrays in database are returned
+        separately: ['a', 'b', 'c'] and ['a', 'b', '$[]', 'c', '$[]']
+        (b and c are arrays) appropriately. If a field contains objects
+        in some documents and arrays in others, then both paths are
+        returned. Every path is returned once, even if several document
+        types stored in collection contain it.
+
+        Shape of embedded fields of all documents in collection is
+        obtained by one aggregation (see `_get_embedded_shapes`), then
+        it's matched against schema. Each key path is returned only if
+        it actually exists in db.
+        :param collection: collection object where to search given
+         embedded document
+        :param root_doctypes: document types stored in collection
+         where to perform recursive search
+        :param search_doctype: embedded document name to search
+        :param db_schema: db schema
+        :return:
+        """
+        collection = get_read_collection(collection)
+        if flags.mongo_version and parse_version(flags.mongo_version) < (3, 6):
+            paths = (path
+                     for root_doctype in root_doctypes
+                     for path in self._probe_embedded_fields(collection,
+                                                             root_doctype,
+                                                             search_doctype,
+                                                             db_schema))
+        else:
+            shapes = self._get_embedded_shapes(collection, root_doctypes, db_schema)
+            paths = (path
+                     for root_doctype in root_doctypes
+                     for _, _, ref, path in iter_embedded_fields(root_doctype, db_schema, shapes)
+                     if ref == search_doctype)
+
+        seen = set()
+        for path in paths:
+            if tuple(path) not in seen:
+                seen.add(tuple(path))
+                yield path
+
+    def _find_all_embedded_fields(self,
+                                  collection: Collection,
+                                  root_doctypes: List[str],
+                                  db_schema: Schema) -> Set[Tuple[str, ...]]:
+        """
+        Return update paths of embedded documents of all types found
+        in given collection
+        :param collection: collection object
+        :param root_doctypes: document types stored in collection
+        :param db_schema: db schema
+        :return: set of update paths
+        """
+        collection = get_read_collection(collection)
+        if flags.mongo_version and parse_version(flags.mongo_version) < (3, 6):
+            return {tuple(path)
+                    for root_doctype in root_doctypes
+                    for path in self._probe_embedded_fields(collection,
+                                                            root_doctype,
+                                                            None,
+                                                            db_schema)}
+
+        return self._get_embedded_shapes(collection, root_doctypes, db_schema)
+
+    def _get_embedded_shapes(self,
+                             collection: Collection,
+                             root_doctypes: List[str],
+                             db_schema: Schema) -> Set[Tuple[str, ...]]:
+        """
+        Return update paths of all embedded documents found in
+        collection. Only fields which could contain embedded documents
+        according to schema are traversed. Documents are scanned by
+        one aggregation, which expands embedded objects and arrays
+        level by level using `$objectToArray`. If
+        `flags.embedded_paths_sample` is set, then only a random sample
+        of documents is scanned
+        :param collection: collection object
+        :param root_doctypes: document types stored in collection
+        :param db_schema: db schema
+        :return: set of update paths, such as ('a', '$[]', 'b')
+        """
+        field_names, depth = _get_embedded_fields_info(root_doctypes, db_schema)
+        if depth == 0:
+            return set()  # Documents have no embedded fields
+
+        prefix = flags.EMBEDDED_DOCUMENT_NAME_PREFIX
+        root_fields = sorted({
+            f
+            for root_doctype in root_doctypes
+            for f, field_schema in db_schema.get(root_doctype, {}).items()
+            if field_schema.get('target_doctype', '').startswith(prefix)
+        })
+
+        pipeline = [{'$match': {'$or': [{f: {'$exists': True}} for f in root_fields]}}]
+        if flags.embedded_paths_sample:
+            pipeline.append({'$sample': {'size': flags.embedded_paths_sample}})
+        pipeline.append({'$project': {
+            '_id': 0,
+            'nodes': [{'p': '', 'v': '$$ROOT'}],
+            'shapes': {'$literal': []}
+        }})
+
+        # Node is an embedded object and its path. Every level replaces
+        # nodes with their children and appends their paths to shapes
+        children = {'$reduce': {
+            'input': {'$filter': {
+                'input': {'$objectToArray': '$$node.v'},
+                'as': 'kv',
+                'cond': {'$in': ['$$kv.k', sorted(field_names)]}
+            }},
+            'initialValue': [],
+            'in': {'$concatArrays': ['$$value', {'$switch': {
+                'branches': [
+                    {
+                        'case': {'$eq': [{'$type': '$$this.v'}, 'object']},
+                        'then': [{'p': {'$concat': ['$$node.p', '.', '$$this.k']},
+                                  'v': '$$this.v'}]
+                    },
+                    {
+                        'case': {'$eq': [{'$type': '$$this.v'}, 'array']},
+                        'then': {'$map': {
+                            'input': {'$filter': {
+                                'input': '$$this.v',
+                                'as': 'item',
+                                'cond': {'$eq': [{'$type': '$$item'}, 'object']}
+                            }},
+                            'as': 'item',
+                            'in': {'p': {'$concat': ['$$node.p', '.', '$$this.k', '.$[]']},
+                                   'v': '$$item'}
+                        }}
+                    }
+                ],
+                'default': []
+            }}]}
+        }}
+        next_nodes = {'$reduce': {
+            'input': '$nodes',
+            'initialValue': [],
+            'in': {'$concatArrays': [
+                '$$value',
+                {'$let': {'vars': {'node': '$$this'}, 'in': children}}
+            ]}
+        }}
+        for _ in range(depth):
+            pipeline.extend([
+                {'$addFields': {'nodes': next_nodes}},
+                {'$addFields': {'shapes': {'$concatArrays': ['$shapes', '$nodes.p']}}}
+            ])
+
+        pipeline.extend([
+            {'$unwind': '$shapes'},
+            {'$group': {'_id': '$shapes'}}
+        ])
+
+        return {tuple(doc['_id'].split('.')[1:])
+                for doc in collection.aggregate(pipeline, allowDiskUse=True)}
+
+    def _probe_embedded_fields(self,
+                              collection: Collection,
+                              root_doctype: str,
+                              search_doctype: Optional[str],
                               db_schema: Schema,
                               _base_path: Optional[list] = None) -> Generator[list, None, None]:
         """
         Perform recursive search for embedded document fields of given
-        type in given collection and return key paths to them. Paths
+        type in given collection by probing every field by queries.
+        Used on MongoDB < 3.6 instead of `_find_embedded_fields`. Paths
         for fields which are contained objects and arrays in database
         are returned separately: ['a', 'b', 'c'] and
         ['a', 'b', '$[]', 'c', '$[]'] (b and c are arrays) appropriately
@@ -422,7 +1500,8 @@ class DocumentUpdater:
          embedded document
         :param root_doctype: document type name where to perform
          recursive search
-        :param search_doctype: embedded document name to search
+        :param search_doctype: embedded document name to search. None
+         means embedded documents of any type
         :param db_schema: db schema
         :return:
         """
@@ -470,9 +1549,9 @@ class DocumentUpdater:
                 limit=1
             )
             if object_results > 0:
-                if ref == search_doctype:
+                if search_doctype in (None, ref):
                     yield path
-                yield from self._find_embedded_fields(collection,
+                yield from self._probe_embedded_fields(collection,
                                                       ref,
                                                       search_doctype,
                                                       db_schema,
@@ -502,9 +1581,9 @@ class DocumentUpdater:
                 limit=1
             )
             if array_results > 0:
-                if ref == search_doctype:
+                if search_doctype in (None, ref):
                     yield path + ['$[]']
-                yield from self._find_embedded_fields(collection,
+                yield from self._probe_embedded_fields(collection,
                                                       ref,
                                                       search_doctype,
                                                       db_schema,
@@ -542,7 +1621,8 @@ class FallbackDocumentUpdater(DocumentUpdater):
                         by_path_cb: Callable,
                         by_doc_cb: Callable,
                         embedded_nonarray_by_doc: bool = True,
-                        embedded_array_by_doc: bool = True) -> None:
+                        embedded_array_by_doc: bool = True,
+                        by_pipeline_cb: Optional[Callable] = None) -> None:
         """
         Update document using by_doc callback only. Fallback variant
         of the same function in DocumentUpdater
@@ -550,10 +1630,25 @@ class FallbackDocumentUpdater(DocumentUpdater):
         :param by_doc_cb: by_doc callback
         :param embedded_nonarray_by_doc: not used
         :param embedded_array_by_doc: not used
+        :param by_pipeline_cb: not used
         :return:
         """
         self.update_by_document(by_doc_cb)
 
+    def update_by_pipeline(self,
+                           callback: Callable,
+                           by_doc_callback: Callable,
+                           value_fltr: Optional[dict] = None) -> None:
+        """
+        Update document using by_doc callback only. Fallback variant
+        of the same function in DocumentUpdater
+        :param callback: not used
+        :param by_doc_callback: by_doc callback
+        :param value_fltr: optional query expression for field value
+        :return:
+        """
+        self.update_by_document(by_doc_callback, value_fltr)
+
     def _update_by_path(self,
                         callback: Callable,
                         collection: Collection,
@@ -5,12 +5,15 @@ __all__ = [
     'get_closest_parent',
     'get_document_type',
     'document_type_to_class_name',
+    'group_by_collection',
     'get_index_name',
-    'normalize_index_fields_spec'
+    'normalize_index_fields_spec',
+    'parse_version'
 ]
 
 import inspect
-from typing import Type, Iterable, Optional, NamedTuple, Any, Union, Iterator, Tuple, Dict
+import re
+from typing import Type, Iterable, Optional, NamedTuple, Any, Union, Iterator, Tuple, Dict, List
 
 from mongoengine import EmbeddedDocument
 from mongoengine.base import BaseDocument
@@ -153,6 +156,21 @@ def document_type_to_class_name(document_type: str) -> str:
     return cls_name
 
 
+def group_by_collection(db_schema: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Return non-embedded document types grouped by collection. Derived
+    documents share the same collection with their parents
+    :param db_schema: db schema
+    :return: dict with collection name and its document types
+    """
+    groups = {}
+    for name, document_schema in db_schema.items():
+        if not name.startswith(EMBEDDED_DOCUMENT_NAME_PREFIX):
+            groups.setdefault(document_schema.parameters['collection'], []).append(name)
+
+    return groups
+
+
 def get_index_name(fields_spec: Iterable[Iterable[Any]]) -> str:
     """
     Build index name from its fields spec
@@ -197,3 +215,20 @@ def normalize_index_fields_spec(
         else:
             raise TypeError(f'Index spec item must contain either str or iterable: {spec!r}')
         yield spec
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """
+    Parse version string such as '4.2.1' or '10.0.0-rc1' to tuple of
+    ints, so that versions could be compared as numbers
+    :param version: version string
+    :return: tuple of version numbers
+    """
+    res = []
+    for part in version.split('.'):
+        match = re.match(r'\d+', part)
+        if match is None:
+            break
+        res.append(int(match.group()))
+
+    return tuple(res)
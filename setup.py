@@ -35,7 +35,6 @@ setuptools.setup(
         'jinja2',
         'click',
         'wrapt',
-        'python-dateutil',
-        'jsonpath_rw'
+        'python-dateutil'
     ],
 )
@@ -197,6 +197,10 @@ class TestBaseAction:
         assert obj.parameters == {'param1': 'value1', 'param2': 123}
         assert obj._run_ctx is None
 
+    def test_init__if_unknown_bulk_option_passed__should_raise_error(self, baseaction_stub):
+        with pytest.raises(ActionError):
+            baseaction_stub('Document1', bulk_options={'max_bytes': 1024, 'unknown': 1})
+
     def test_prepare__if_collection_in_left_schema__should_prepare_run_context(
             self, test_db, left_schema, baseaction_stub
     ):
@@ -388,6 +392,12 @@ class TestBaseFieldAction:
             {'param1': 'val1', 'param2': 4, 'dummy_action': True},
             "StubFieldAction('Document1', 'field1', dummy_action=True, param1='val1', param2=4)"
         ),
+        (
+            ('Document1', 'field1'),
+            {'param1': 'val1', 'bulk_options': {'max_bytes': 1024}},
+            "StubFieldAction('Document1', 'field1', bulk_options={'max_bytes': 1024}, "
+            "param1='val1')"
+        ),
     ))
     def test_to_python_expr__should_return_python_expression_which_creates_action_object(
             self, basefieldaction_stub, args, kwargs, expect
@@ -0,0 +1,106 @@
+from unittest import mock
+
+import pytest
+from pymongo import InsertOne
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.bulk import BulkWriteBuffer, bulk_limits
+
+
+def test_append__if_length_limit_reached__should_flush(test_db):
+    buf = BulkWriteBuffer(test_db['collection1'], max_length=3, max_bytes=0, max_delay=0)
+
+    for n in range(4):
+        buf.append(InsertOne({'_id': n}), {'_id': n})
+
+    assert len(buf) == 1
+    assert test_db['collection1'].count_documents({}) == 3
+
+
+def test_append__if_bytes_limit_reached__should_flush(test_db):
+    buf = BulkWriteBuffer(test_db['collection1'], max_length=1000, max_bytes=1024, max_delay=0)
+    doc = {'data': 'x' * 400}
+
+    buf.append(InsertOne({**doc, '_id': 1}), doc)
+    buf.append(InsertOne({**doc, '_id': 2}), doc)
+    assert len(buf) == 2 and buf.nbytes > 800
+    buf.append(InsertOne({**doc, '_id': 3}), doc)
+
+    assert len(buf) == 0 and buf.nbytes == 0
+    assert test_db['collection1'].count_documents({}) == 3
+
+
+def test_append__if_no_bytes_limit_and_metrics__should_not_encode_payload(test_db):
+    # Byte limit is off by default
+    buf = BulkWriteBuffer(test_db['collection1'])
+
+    with mock.patch('mongoengine_migrate.bulk.bson.encode') as encode:
+        buf.append(InsertOne({'_id': 1}), {'_id': 1})
+
+    encode.assert_not_called()
+    assert len(buf) == 1 and buf.nbytes == 0
+
+
+def test_append__if_delay_limit_reached__should_flush(test_db):
+    buf = BulkWriteBuffer(test_db['collection1'], max_length=1000, max_bytes=0, max_delay=5)
+
+    with mock.patch('mongoengine_migrate.bulk.time.monotonic', side_effect=[100, 101, 105]):
+        buf.append(InsertOne({'_id': 1}), {'_id': 1})  # Start time and check
+        buf.append(InsertOne({'_id': 2}), {'_id': 2})
+
+    assert len(buf) == 0
+    assert test_db['collection1'].count_documents({}) == 2
+
+
+def test_context_manager__should_flush_on_exit(test_db):
+    with BulkWriteBuffer(test_db['collection1']) as buf:
+        buf.append(InsertOne({'_id': 1}), {'_id': 1})
+        assert test_db['collection1'].count_documents({}) == 0
+
+    assert test_db['collection1'].count_documents({}) == 1
+
+
+def test_bulk_limits__should_override_flags_temporarily():
+    old_length = flags.bulk_buffer_length
+
+    with bulk_limits(max_bytes=1024, max_delay=1.5):
+        assert flags.bulk_buffer_bytes == 1024
+        assert flags.bulk_buffer_delay == 1.5
+        assert flags.bulk_buffer_length == old_length
+
+    assert flags.bulk_buffer_bytes == 0
+    assert flags.bulk_buffer_delay == 10.0
+
+
+def test_bulk_limits__if_unknown_limit_passed__should_raise_error():
+    with pytest.raises(TypeError):
+        with bulk_limits(unknown=1):
+            pass
+
+
+def test_advance__if_delay_limit_reached__should_report_position_without_requests(test_db):
+    positions = []
+    buf = BulkWriteBuffer(test_db['collection1'], max_length=1000, max_bytes=0, max_delay=5,
+                          on_flush=positions.append)
+
+    with mock.patch('mongoengine_migrate.bulk.time.monotonic', side_effect=[100, 101, 105]):
+        buf.advance(1)  # Start time and check
+        buf.advance(2)
+
+    assert positions == [2]
+
+
+def test_flush__should_report_position_after_write(test_db):
+    collection = test_db['collection1']
+    positions = []
+
+    def on_flush(position):
+        positions.append((position, collection.count_documents({})))
+
+    with BulkWriteBuffer(collection, max_length=2, max_bytes=0, max_delay=0,
+                         on_flush=on_flush) as buf:
+        for n in range(3):
+            buf.append(InsertOne({'_id': n}), {'_id': n})
+            buf.advance(n)
+
+    assert positions == [(0, 2), (2, 3)]
@@ -0,0 +1,161 @@
+import os
+import signal
+import time
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.checkpoints import (
+    action_scope,
+    get_scan_checkpoint,
+    handle_sigterm,
+    ScanCheckpoint
+)
+from mongoengine_migrate.exceptions import MigrationInterrupted
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+@pytest.fixture
+def checkpoints_enabled(monkeypatch):
+    monkeypatch.setattr(flags, 'checkpoints', True)
+    monkeypatch.setattr(flags, 'bulk_buffer_length', 2)
+
+
+@pytest.mark.parametrize('pipeline', (False, True))
+def test_update_by_document__if_sigterm_received__should_resume_from_checkpoint(
+        test_db, load_fixture, checkpoints_enabled, monkeypatch, pipeline
+):
+    monkeypatch.setattr(flags, 'pipeline', pipeline)
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+    migration_collection = test_db['mongoengine_migrate']
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+    ids = sorted(doc['_id'] for doc in collection.find({'doc1_str': {'$exists': True}}))
+    assert len(ids) > 3
+    processed = []
+
+    def callback(ctx):
+        processed.append(ctx.document['_id'])
+        ctx.document['doc1_str'] = 'new value'
+        if len(processed) == 3:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def resumed_callback(ctx):
+        processed.append(ctx.document['_id'])
+        ctx.document['doc1_str'] = 'new value'
+
+    with pytest.raises(MigrationInterrupted):
+        with handle_sigterm(), action_scope(migration_collection, 'migration1', 1, True):
+            updater.update_by_document(callback)
+
+    record = migration_collection.find_one({'type': 'checkpoint'})
+    assert processed == ids[:3]
+    assert record['ranges'] == [{'lower': None, 'upper': None, 'last_id': ids[2], 'done': False}]
+    assert collection.count_documents({'doc1_str': 'new value'}) == 3
+
+    processed.clear()
+    with handle_sigterm(), action_scope(migration_collection, 'migration1', 1, True):
+        updater.update_by_document(resumed_callback)
+
+    assert processed == ids[3:]
+    assert collection.count_documents({'doc1_str': 'new value'}) == len(ids)
+    assert migration_collection.count_documents({'type': 'checkpoint'}) == 0
+
+
+
+def test_update_by_document__if_sigterm_received_by_process_executor__should_flush_workers(
+        test_db, load_fixture, checkpoints_enabled, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(flags, 'parallel_workers', 2)
+    monkeypatch.setattr(flags, 'parallel_executor', 'process')
+    monkeypatch.setattr(flags, 'mongo_uri', os.environ['DATABASE_URL'])
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+    collection.insert_many([{'doc1_str': str(n)} for n in range(40)])
+    migration_collection = test_db['mongoengine_migrate']
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+    # Workers are separate processes, so they report to a file
+    log_file = tmp_path / 'log.txt'
+    save_position = ScanCheckpoint.save_position
+
+    def write_log(*values):
+        with open(log_file, 'a') as f:
+            f.write(' '.join(str(v) for v in (os.getpid(), ) + values) + '\n')
+
+    def logged_save_position(self, range_index, last_id):
+        write_log('saved', last_id)
+        save_position(self, range_index, last_id)
+
+    def callback(ctx):
+        write_log('processed', ctx.document['_id'])
+        ctx.document['doc1_str'] = 'new value'
+        try:
+            with open(tmp_path / 'killed', 'x'):
+                os.kill(os.getppid(), signal.SIGTERM)
+        except FileExistsError:
+            time.sleep(0.05)
+
+    monkeypatch.setattr(ScanCheckpoint, 'save_position', logged_save_position)
+
+    with pytest.raises(MigrationInterrupted):
+        with handle_sigterm(), action_scope(migration_collection, 'migration1', 1, True):
+            updater.update_by_document(callback)
+
+    log = [line.split() for line in log_file.read_text().splitlines()]
+    assert len([event for _, event, _ in log if event == 'processed']) < 40
+    # Every worker has written changes of all documents it processed
+    last_processed = {pid: doc_id for pid, event, doc_id in log if event == 'processed'}
+    last_saved = {pid: doc_id for pid, event, doc_id in log if event == 'saved'}
+    assert last_saved == last_processed
+
+def test_update_by_document__if_scan_finished__should_skip_it_on_resume(
+        test_db, load_fixture, checkpoints_enabled
+):
+    schema = load_fixture('schema1').get_schema()
+    migration_collection = test_db['mongoengine_migrate']
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+    calls = []
+
+    def failing_callback(ctx):
+        raise ValueError('test')
+
+    with pytest.raises(ValueError):
+        with action_scope(migration_collection, 'migration1', 1, True):
+            updater.update_by_document(lambda ctx: calls.append(ctx))
+            updater.update_by_document(failing_callback)
+
+    calls.clear()
+    with action_scope(migration_collection, 'migration1', 1, True):
+        updater.update_by_document(lambda ctx: calls.append(ctx))
+        updater.update_by_document(lambda ctx: None)
+
+    assert calls == []
+
+
+def test_update_by_document__if_checkpoints_disabled__should_not_store_them(
+        test_db, load_fixture
+):
+    schema = load_fixture('schema1').get_schema()
+    migration_collection = test_db['mongoengine_migrate']
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    with pytest.raises(ValueError):
+        with action_scope(migration_collection, 'migration1', 1, True):
+            updater.update_by_document(lambda ctx: ctx.document.update(doc1_str='new value'))
+            raise ValueError('test')
+
+    assert migration_collection.count_documents({}) == 0
+
+
+def test_action_scope__if_nested__should_restore_outer_action(test_db, checkpoints_enabled):
+    migration_collection = test_db['mongoengine_migrate']
+
+    with action_scope(migration_collection, 'migration1', 1, True):
+        with action_scope(migration_collection, 'migration2', 1, True):
+            pass
+
+        checkpoint = get_scan_checkpoint('collection1', '', ())
+
+    assert checkpoint.key['migration'] == 'migration1'
+    assert get_scan_checkpoint('collection1', '', ()) is None
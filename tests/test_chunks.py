@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+from bson import ObjectId
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.actions import DropField
+from mongoengine_migrate.chunks import iter_id_chunks, restrict_filter
+from mongoengine_migrate.graph import MigrationPolicy
+
+
+@pytest.mark.parametrize('chunk_size', (1, 7, 100, 1000))
+def test_iter_id_chunks__should_cover_all_documents_without_intersections(test_db, chunk_size):
+    test_db['collection1'].insert_many([{'_id': n} for n in range(100)])
+
+    chunks = list(iter_id_chunks(test_db['collection1'], chunk_size))
+
+    found = [
+        [d['_id'] for d in test_db['collection1'].find({'_id': c} if c else {})]
+        for c in chunks
+    ]
+    assert all(len(ids) <= chunk_size for ids in found)
+    assert sorted(itertools.chain.from_iterable(found)) == list(range(100))
+
+
+def test_iter_id_chunks__if_id_types_differ__should_return_one_chunk(test_db):
+    test_db['collection1'].insert_many([{'_id': 1}, {'_id': ObjectId()}])
+
+    assert list(iter_id_chunks(test_db['collection1'], 1)) == [None]
+
+
+def test_restrict_filter__if_filter_contains_id__should_combine_them():
+    assert restrict_filter({'_id': 1}, {'$gte': 0}) == {'$and': [{'_id': 1}, {'_id': {'$gte': 0}}]}
+    assert restrict_filter({'a': 1}, {'$gte': 0}) == {'a': 1, '_id': {'$gte': 0}}
+    assert restrict_filter({'a': 1}, None) == {'a': 1}
+
+
+@pytest.mark.parametrize('workers', (0, 3))
+def test_update_by_path__if_chunk_size_set__should_update_all_documents(
+        test_db, load_fixture, dump_db, monkeypatch, workers
+):
+    monkeypatch.setattr(flags, 'by_path_chunk_size', 2)
+    monkeypatch.setattr(flags, 'parallel_workers', workers)
+    schema = load_fixture('schema1').get_schema()
+    expect = dump_db()
+    for doc in expect['schema1_doc1']:
+        doc.pop('doc1_str', None)
+
+    action = DropField('Schema1Doc1', 'doc1_str')
+    action.prepare(test_db, schema, MigrationPolicy.strict)
+    action.run_forward()
+
+    assert dump_db() == expect
@@ -0,0 +1,15 @@
+import click
+import pytest
+
+from mongoengine_migrate.cli import validate_max_staleness
+
+
+@pytest.mark.parametrize('value', (0, 90, 120))
+def test_validate_max_staleness__if_value_is_allowed__should_return_it(value):
+    assert validate_max_staleness(None, None, value) == value
+
+
+@pytest.mark.parametrize('value', (1, 89))
+def test_validate_max_staleness__if_value_is_less_than_90__should_raise_error(value):
+    with pytest.raises(click.BadParameter):
+        validate_max_staleness(None, None, value)
@@ -1,5 +1,7 @@
 import itertools
+from datetime import datetime
 
+import bson
 import pytest
 
 from mongoengine_migrate.exceptions import MigrationError
@@ -137,6 +139,28 @@ def test_to_string__should_convert_to_string(
     assert dump_db() == expect
 
 
+@pytest.mark.parametrize('converter,value,expect', (
+        (converters.to_double, datetime(2020, 1, 1), datetime(2020, 1, 1)),
+        (converters.to_double, 5, 5.0),
+        (converters.to_bool, [1], True),
+        (converters.to_bool, {}, False),
+        (converters.to_bool, '', False),
+        (converters.to_bool, 0, False),
+))
+def test_convert__if_policy_is_relaxed__should_convert_values_as_python_does(
+        test_db, load_fixture, converter, value, expect
+):
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+    doc_id = collection.insert_one({'doc1_str': value}).inserted_id
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str',
+                              MigrationPolicy.relaxed)
+
+    converter(updater)
+
+    assert collection.find_one({'_id': doc_id})['doc1_str'] == expect
+
+
 @pytest.mark.parametrize('document_type,field_name', (
         ('Schema1Doc1', 'doc1_str_ten'),
         ('~Schema1EmbDoc1', 'embdoc1_str_ten'),
@@ -296,3 +320,20 @@ def test_to_decimal__if_value_does_not_contain_number__should_raise_error(
 
     with pytest.raises(MigrationError):
         converters.to_decimal(updater)
+
+
+@pytest.mark.parametrize('converter,value', (
+        (converters.to_uuid_bin, bson.Binary(b'not uuid', 0)),
+        (converters.to_decimal, bson.Decimal128('1.5')),
+))
+def test_convert__if_value_could_not_be_converted__should_raise_error(
+        test_db, load_fixture, converter, value
+):
+    schema = load_fixture('schema1').get_schema()
+    # Only this value could fail
+    test_db['schema1_doc1'].delete_many({})
+    test_db['schema1_doc1'].insert_one({'doc1_str': value})
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    with pytest.raises(MigrationError):
+        converter(updater)
@@ -0,0 +1,53 @@
+import jsonpath_rw
+import pytest
+
+from mongoengine_migrate.docpath import compile_path
+
+
+@pytest.fixture
+def document():
+    return {
+        '_id': 1,
+        'a': {'b': {'c': 1}},
+        'd': [
+            {'e': [{'f': 1}, {'f': 2}], 'g': 1},
+            {'e': {'f': 3}},
+            {'e': 'str'},
+            {'h': 1},
+            [{'e': 1}],
+            'str',
+        ],
+        'i': [1, 'str', {'j': 2}],
+    }
+
+
+@pytest.mark.parametrize('update_path,json_path', (
+        ((), '$'),
+        (('a', ), 'a'),
+        (('a', 'b'), 'a.b'),
+        (('a', 'b', 'c'), 'a.b.c'),
+        (('a', 'unknown'), 'a.unknown'),
+        (('d', ), 'd'),
+        (('d', '$[]'), 'd[*]'),
+        (('d', '$[]', 'e'), 'd[*].e'),
+        (('d', '$[]', 'e', '$[]'), 'd[*].e[*]'),
+        (('d', '$[]', 'e', '$[]', 'f'), 'd[*].e[*].f'),
+        (('i', '$[]', 'j'), 'i[*].j'),
+        (('a', '$[]', 'b'), 'a[*].b'),
+))
+def test_compile_path__should_find_the_same_values_as_jsonpath(document, update_path, json_path):
+    expect = [x.value for x in jsonpath_rw.parse(json_path).find(document)]
+
+    res = list(compile_path(update_path)(document))
+
+    assert res == expect
+
+
+def test_compile_path__should_return_found_objects_themselves(document):
+    res = list(compile_path(('d', '$[]'))(document))
+
+    assert res[0] is document['d'][0]
+
+
+def test_compile_path__should_cache_compiled_paths():
+    assert compile_path(('a', '$[]', 'b')) is compile_path(('a', '$[]', 'b'))
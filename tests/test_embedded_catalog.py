@@ -0,0 +1,106 @@
+from copy import deepcopy
+
+import pytest
+
+from mongoengine_migrate.embedded_catalog import (
+    EmbeddedCatalog,
+    catalog_scope,
+    get_current_catalog
+)
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+@pytest.fixture
+def catalog(test_db):
+    return EmbeddedCatalog(test_db['mongoengine_migrate'])
+
+
+def get_paths(updater):
+    return sorted((c.name, u, f) for c, u, f in updater._get_embedded_paths())
+
+
+def test_catalog_scope__if_nested__should_restore_outer_catalog(test_db, catalog):
+    with catalog_scope(catalog):
+        with catalog_scope(EmbeddedCatalog(test_db['mongoengine_migrate'])):
+            pass
+
+        assert get_current_catalog() is catalog
+
+    assert get_current_catalog() is None
+
+
+@pytest.mark.parametrize('document_type', ('~Schema1EmbDoc1', '~Schema1EmbDoc2'))
+def test_get_embedded_paths__if_catalog_is_used__should_return_the_same_paths(
+        test_db, load_fixture, catalog, document_type
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, '', MigrationPolicy.strict)
+    expect = get_paths(updater)
+
+    with catalog_scope(catalog):
+        paths = get_paths(updater)
+
+    assert expect
+    assert paths == expect
+
+
+def test_get_embedded_paths__if_catalog_is_used__should_search_paths_only_once(
+        test_db, load_fixture, catalog, monkeypatch
+):
+    schema = load_fixture('schema1').get_schema()
+    with catalog_scope(catalog):
+        expect = get_paths(DocumentUpdater(test_db, '~Schema1EmbDoc2', schema, '',
+                                           MigrationPolicy.strict))
+
+    def discover(*args, **kwargs):
+        raise AssertionError('Paths must be taken from catalog')
+
+    monkeypatch.setattr(DocumentUpdater, '_find_all_embedded_fields', discover)
+    # Catalog is stored in db, so it's reused by next runs
+    with catalog_scope(EmbeddedCatalog(test_db['mongoengine_migrate'])):
+        paths = get_paths(DocumentUpdater(test_db, '~Schema1EmbDoc2', schema, '',
+                                          MigrationPolicy.strict))
+
+    assert paths == expect
+
+
+def test_update__if_embedded_field_was_removed__should_remove_its_paths_only(
+        test_db, load_fixture, catalog
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc2', schema, '', MigrationPolicy.strict)
+    with catalog_scope(catalog):
+        expect = [p for p in get_paths(updater) if p[1][0] != 'doc1_emb_embdoc1']
+    new_schema = deepcopy(schema)
+    del new_schema['Schema1Doc1']['doc1_emb_embdoc1']
+
+    catalog.update(schema, new_schema)
+
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc2', new_schema, '', MigrationPolicy.strict)
+    with catalog_scope(EmbeddedCatalog(test_db['mongoengine_migrate'])):
+        paths = get_paths(updater)
+
+    assert paths == expect
+
+
+def test_update__if_embedded_field_was_changed__should_search_paths_again(
+        test_db, load_fixture, catalog
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc1', schema, '', MigrationPolicy.strict)
+    with catalog_scope(catalog):
+        get_paths(updater)
+    test_db['schema1_doc1'].update_many({}, [{'$set': {'doc1_emb_embdoc1': ['$doc1_emb_embdoc1']}}])
+    new_schema = deepcopy(schema)
+    new_schema['Schema1Doc1']['doc1_emb_embdoc1']['type_key'] = 'EmbeddedDocumentListField'
+
+    catalog.update(schema, new_schema)
+
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc1', new_schema, '', MigrationPolicy.strict)
+    expect = get_paths(updater)
+    with catalog_scope(catalog):
+        paths = get_paths(updater)
+
+    assert ('schema1_doc1', ['doc1_emb_embdoc1', '$[]'], ['doc1_emb_embdoc1']) in paths
+    assert paths == expect
@@ -0,0 +1,184 @@
+from unittest.mock import Mock
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.actions import DropField
+from mongoengine_migrate.fusion import (
+    FusionSession,
+    fusion_scope,
+    get_current_session,
+    match_scan_filter
+)
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.planner import ActionPlanner
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+class UpdateRecorder:
+    """Collection wrapper which records write calls"""
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.calls = []
+
+    def update_many(self, fltr, update, array_filters=None):
+        self.calls.append(('update_many', fltr, update, array_filters))
+        return self.collection.update_many(fltr, update, array_filters=array_filters)
+
+    def bulk_write(self, requests, ordered=True):
+        self.calls.append(('bulk_write', len(requests)))
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+
+@pytest.fixture
+def collection(test_db):
+    test_db['collection1'].insert_many([
+        {'_id': 1, 'a': 1, 'b': 2, 'c': 3},
+        {'_id': 2, 'a': 1},
+        {'_id': 3, 'c': 3},
+    ])
+    return UpdateRecorder(test_db['collection1'])
+
+
+def test_flush__if_fields_unset_by_existence_filter__should_merge_updates_into_one(
+        collection
+):
+    session = FusionSession()
+    fused = session.wrap(collection)
+
+    for field in ('a', 'b', 'c'):
+        fused.update_many({field: {'$exists': True}}, {'$unset': {field: ''}})
+    assert collection.calls == []
+
+    session.flush()
+
+    assert [c[0] for c in collection.calls] == ['update_many']
+    assert list(collection.collection.find()) == [{'_id': 1}, {'_id': 2}, {'_id': 3}]
+
+
+def test_flush__if_array_filters_identifiers_clash__should_rename_them(collection, monkeypatch):
+    monkeypatch.setattr(collection, 'collection', Mock())
+    session = FusionSession()
+    fused = session.wrap(collection)
+
+    fltr = {'a.c': {'$exists': True}}
+    fused.update_many(fltr, {'$set': {'a.$[elem1].b': 0}}, array_filters=[{'elem1.b': 1}])
+    fused.update_many(fltr, {'$set': {'a.$[elem1].d': 4}}, array_filters=[{'elem1.c': 3}])
+    session.flush()
+
+    (_, _, update, array_filters), = collection.calls
+    assert update == {'$set': {'a.$[elem1].b': 0, 'a.$[elem1u1].d': 4}}
+    assert array_filters == [{'elem1.b': 1}, {'elem1u1.c': 3}]
+
+
+def test_flush__if_update_touches_fields_of_previous_one__should_write_them_by_one_bulk(
+        collection
+):
+    session = FusionSession()
+    fused = session.wrap(collection)
+
+    fused.update_many({}, {'$set': {'b': 5}})
+    fused.update_many({'b': {'$exists': True}}, {'$rename': {'b': 'd'}})
+    fused.update_many({}, {'$set': {'d': 6}})
+    session.flush()
+
+    assert collection.calls == [('bulk_write', 3)]
+    assert list(collection.collection.find({}, {'d': 1})) == [
+        {'_id': 1, 'd': 6}, {'_id': 2, 'd': 6}, {'_id': 3, 'd': 6}
+    ]
+
+
+def test_find__if_updates_are_queued__should_flush_them_first(collection):
+    session = FusionSession()
+    fused = session.wrap(collection.collection)
+
+    fused.update_many({}, {'$set': {'b': 5}})
+    res = fused.find_one({'_id': 2})
+
+    assert res == {'_id': 2, 'a': 1, 'b': 5}
+
+
+def test_update_by_document__if_scans_are_chained__should_apply_them_in_order(
+        test_db, load_fixture, dump_db, monkeypatch
+):
+    schema = load_fixture('schema1').get_schema()
+
+    def increment(ctx):
+        ctx.document['doc1_int'] += 1
+
+    def double(ctx):
+        ctx.document['doc1_int'] *= 2
+
+    def run():
+        for callback in (increment, double):
+            updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_int',
+                                      MigrationPolicy.strict)
+            updater.update_by_document(callback)
+
+    scans = []
+    original = DocumentUpdater._scan_documents
+    monkeypatch.setattr(DocumentUpdater, '_scan_documents',
+                        lambda self, scan: scans.append(scan) or original(self, scan))
+    before = dump_db()
+    run()
+    expect = dump_db()
+    for collection_name, documents in before.items():
+        test_db[collection_name].drop()
+        test_db[collection_name].insert_many(documents)
+    scans.clear()
+
+    session = FusionSession()
+    with fusion_scope(session):
+        run()
+        session.flush()
+
+    assert len(scans) == 1
+    assert dump_db() == expect
+
+
+def test_fusion_scope__if_nested__should_restore_outer_session():
+    session = FusionSession()
+
+    with fusion_scope(session):
+        with fusion_scope(None):
+            assert get_current_session() is None
+
+        assert get_current_session() is session
+
+    assert get_current_session() is None
+
+
+def test_action_scope__if_actions_change_the_same_collection__should_defer_them_till_flush(
+        test_db, load_fixture, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'fuse_actions', True)
+    schema = load_fixture('schema1').get_schema()
+    before = dump_db()
+    expect = dump_db()
+    for doc in expect['schema1_doc1']:
+        doc.pop('doc1_str', None)
+        doc.pop('doc1_int', None)
+    planner = ActionPlanner()
+
+    for field_name in ('doc1_str', 'doc1_int'):
+        action = DropField('Schema1Doc1', field_name)
+        action.prepare(test_db, schema, MigrationPolicy.strict)
+        with planner.action_scope(action, schema):
+            action.run_forward()
+    assert dump_db() == before
+
+    planner.flush()
+
+    assert dump_db() == expect
+
+
+@pytest.mark.parametrize('document,fltr,expect', (
+        ({'a': {'b': 1}}, {'a.b': {'$exists': True}}, True),
+        ({'a': [{'c': 1}, {'b': 1}]}, {'a.b': {'$exists': True}}, True),
+        ({'a': [{'c': 1}]}, {'a.b': {'$exists': True}}, False),
+        ({'a': [{'b': 1}]}, {'a.0.b': {'$exists': True}}, True),
+        ({'a': 1, '_cls': 'Doc1'}, {'a': {'$exists': True}, '_cls': 'Doc2'}, False),
+))
+def test_match_scan_filter__should_match_like_mongodb(document, fltr, expect):
+    assert match_scan_filter(document, fltr) is expect
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.actions import DropField
+from mongoengine_migrate.fusion import FusionSession
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.metrics import (
+    ActionMetrics,
+    MetricsReport,
+    MeasuredCollection,
+    metrics_scope
+)
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+def test_action_metrics__should_sum_counters_by_collection_and_path():
+    metrics = ActionMetrics('migration1', 1, 'DropField(...)')
+
+    metrics.add('collection1', '', passes=1, documents_scanned=3)
+    metrics.add('collection1', 'a.b', documents_scanned=2)
+    other = ActionMetrics()
+    other.add('collection1', '', documents_scanned=4)
+    metrics.merge(other)
+
+    assert metrics.counters[('collection1', '')]['documents_scanned'] == 7
+    assert metrics.counters[('collection1', 'a.b')]['documents_scanned'] == 2
+    assert metrics.totals['documents_scanned'] == 9
+    assert metrics.totals['passes'] == 1
+
+
+def test_metrics_report__should_write_json_and_format_table(tmp_path):
+    report = MetricsReport('upgrade')
+    with report.measure('migration1', 1, 'DropField(...)', True) as metrics:
+        metrics.add('collection1', 'a', passes=2, update_many_matched=5)
+    path = tmp_path / 'report.json'
+
+    report.write(str(path))
+
+    data = json.loads(path.read_text())
+    assert data['command'] == 'upgrade'
+    action, = data['actions']
+    assert action['direction'] == 'forward'
+    assert action['totals']['passes'] == 2
+    assert action['collections'] == [
+        {'collection': 'collection1', 'path': 'a', **metrics.counters[('collection1', 'a')]}
+    ]
+    table = report.format_table().splitlines()
+    assert table[0].split()[:3] == ['Action', 'Wall,', 's']
+    assert table[1].startswith('migration1[1] DropField(...)')
+    assert table[2].split() == ['collection1', 'a', '2', '0', '0', '0', '0', '5', '0']
+    assert table[-1].startswith('Total')
+
+
+def test_update_by_document__should_count_scanned_and_modified_documents(
+        test_db, load_fixture
+):
+    schema = load_fixture('schema1').get_schema()
+    count = test_db['schema1_doc1'].count_documents({})
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    def callback(ctx):
+        ctx.document['doc1_str'] = 'new value'
+
+    with metrics_scope(ActionMetrics()) as metrics:
+        updater.update_by_document(callback)
+
+    counters = metrics.counters[('schema1_doc1', '')]
+    assert counters['passes'] == 1
+    assert counters['documents_scanned'] == count
+    assert counters['documents_modified'] == count
+    assert counters['bulk_batches'] == 1
+    assert counters['bytes_written'] > 0
+
+
+@pytest.mark.parametrize('chunk_size', (0, 1))
+def test_update_by_path__should_count_one_pass_per_update_many(
+        test_db, load_fixture, monkeypatch, chunk_size
+):
+    monkeypatch.setattr(flags, 'by_path_chunk_size', chunk_size)
+    schema = load_fixture('schema1').get_schema()
+    count = test_db['schema1_doc1'].count_documents({'doc1_str': {'$exists': True}})
+    action = DropField('Schema1Doc1', 'doc1_str')
+    action.prepare(test_db, schema, MigrationPolicy.strict)
+
+    with metrics_scope(ActionMetrics()) as metrics:
+        action.run_forward()
+
+    counters = metrics.counters[('schema1_doc1', '')]
+    assert counters['passes'] == 1
+    assert counters['update_many_matched'] == count
+    assert counters['update_many_modified'] == count
+
+
+def test_flush__if_updates_written_by_bulk__should_count_pass_per_update(test_db):
+    test_db['collection1'].insert_many([{'_id': 1, 'a': 1}, {'_id': 2}])
+    session = FusionSession()
+    fused = session.wrap(MeasuredCollection(test_db['collection1'], ''))
+
+    with metrics_scope(ActionMetrics()) as metrics:
+        fused.update_many({}, {'$set': {'b': 5}})
+        fused.update_many({'b': {'$exists': True}}, {'$rename': {'b': 'd'}})
+        session.flush()
+
+    counters = metrics.counters[('collection1', '')]
+    assert counters['passes'] == 2
+    assert counters['update_many_matched'] == 4
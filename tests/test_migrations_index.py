@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from mongoengine_migrate.graph import Migration, MigrationPolicy
+from mongoengine_migrate.migrations_index import MigrationsIndex, parse_migration_header
+
+MIGRATION_SOURCE = b'''from mongoengine_migrate.actions import *
+
+policy = "relaxed"
+
+dependencies = [
+    '0001_initial'
+]
+
+actions = [
+    CreateDocument('Document1', collection='document1'),
+]
+'''
+
+
+def test_parse_migration_header__should_read_literals():
+    assert parse_migration_header(MIGRATION_SOURCE) == {
+        'dependencies': ['0001_initial'],
+        'policy': 'relaxed'
+    }
+
+
+def test_parse_migration_header__if_policy_omitted__should_return_none_policy():
+    assert parse_migration_header(b'dependencies = []\nactions = []\n') == {
+        'dependencies': [],
+        'policy': None
+    }
+
+
+@pytest.mark.parametrize('source', (
+    b'actions = []\n',
+    b'deps = ["0001"]\ndependencies = deps\n',
+    b'dependencies = []\ndependencies += ["0001"]\n',
+    b'dependencies = []\nfrom other import *\n',
+    b'dependencies = []\nif True:\n    dependencies = ["0001"]\n',
+    b'dependencies = []\ndef dependencies(): pass\n',
+    b'import dependencies\ndependencies = []\n',
+    b'dependencies = "0001"\n',
+    b'dependencies = []\npolicy = 1\n',
+))
+def test_parse_migration_header__if_values_could_be_computed__should_return_none(source):
+    assert parse_migration_header(source) is None
+
+
+def test_get__should_cache_entries_in_index_file(tmp_path):
+    module_file = tmp_path / '0002_migration.py'
+    module_file.write_bytes(MIGRATION_SOURCE)
+    index = MigrationsIndex(tmp_path)
+
+    entry = index.get(module_file)
+    index.save()
+
+    assert entry['dependencies'] == ['0001_initial']
+    assert entry['policy'] == 'relaxed'
+    assert MigrationsIndex(tmp_path)._entries == {'0002_migration.py': entry}
+
+
+def test_get__if_only_mtime_changed__should_not_parse_file(tmp_path, monkeypatch):
+    module_file = tmp_path / '0002_migration.py'
+    module_file.write_bytes(MIGRATION_SOURCE)
+    index = MigrationsIndex(tmp_path)
+    index.get(module_file)
+    index.save()
+    stat = module_file.stat()
+    os.utime(module_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    monkeypatch.setattr('mongoengine_migrate.migrations_index.parse_migration_header', None)
+
+    entry = MigrationsIndex(tmp_path).get(module_file)
+
+    assert entry['dependencies'] == ['0001_initial']
+    assert entry['mtime'] == stat.st_mtime_ns + 10**9
+
+
+def test_get__if_file_changed__should_parse_it_again(tmp_path):
+    module_file = tmp_path / '0002_migration.py'
+    module_file.write_bytes(MIGRATION_SOURCE)
+    index = MigrationsIndex(tmp_path)
+    old_entry = dict(index.get(module_file))
+
+    module_file.write_bytes(MIGRATION_SOURCE.replace(b"'0001_initial'", b"'0001_first', '0001'"))
+    entry = index.get(module_file)
+
+    assert entry['dependencies'] == ['0001_first', '0001']
+    assert entry['hash'] != old_entry['hash']
+
+
+def test_migration__should_load_module_on_first_access():
+    calls = []
+
+    def module_loader():
+        calls.append(1)
+        return type('Module', (), {'actions': ['action1'], 'policy': 'relaxed'})
+
+    migration = Migration(name='0002_migration', dependencies=['0001_initial'],
+                          policy_name='strict', module_loader=module_loader)
+
+    assert migration.policy == MigrationPolicy.strict
+    assert calls == []
+    assert migration.get_actions() == ['action1']
+    assert migration.get_actions() == ['action1']
+    assert calls == [1]
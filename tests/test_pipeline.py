@@ -0,0 +1,41 @@
+import pytest
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from mongoengine_migrate.pipeline import Prefetcher, BackgroundWriter
+
+
+def test_prefetcher__should_return_all_items_in_order():
+    with Prefetcher(iter(range(25)), batch_size=4, queue_size=2) as prefetcher:
+        assert list(prefetcher) == list(range(25))
+
+
+def test_prefetcher__if_error_raised_while_reading__should_reraise_it():
+    def items():
+        yield from range(5)
+        raise ValueError('test')
+
+    with Prefetcher(items(), batch_size=2, queue_size=2) as prefetcher:
+        with pytest.raises(ValueError):
+            list(prefetcher)
+
+
+def test_prefetcher__if_consumer_stopped__should_stop_reader():
+    with Prefetcher(iter(range(1000)), batch_size=1, queue_size=1) as prefetcher:
+        assert next(iter(prefetcher)) == 0
+
+    assert not prefetcher._thread.is_alive()
+
+
+def test_background_writer__should_write_all_submitted_requests(test_db):
+    with BackgroundWriter(test_db['collection1'], queue_size=1) as writer:
+        for n in range(5):
+            writer.submit([InsertOne({'_id': n * 2}), InsertOne({'_id': n * 2 + 1})])
+
+    assert sorted(d['_id'] for d in test_db['collection1'].find()) == list(range(10))
+
+
+def test_background_writer__if_write_failed__should_reraise_error(test_db):
+    with pytest.raises(BulkWriteError):
+        with BackgroundWriter(test_db['collection1'], queue_size=1) as writer:
+            writer.submit([InsertOne({'_id': 1}), InsertOne({'_id': 1})])
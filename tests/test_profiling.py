@@ -0,0 +1,102 @@
+import pstats
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.metrics import ActionMetrics, MetricsReport, metrics_scope
+from mongoengine_migrate.profiling import CommandProfiler, profile_action
+
+
+def run_command(profiler, request_id, command_name, command, duration, reply=None):
+    key = {'connection_id': ('localhost', 27017), 'request_id': request_id}
+    profiler.started(SimpleNamespace(command_name=command_name, command=command, **key))
+    profiler.succeeded(SimpleNamespace(duration_micros=int(duration * 1000000),
+                                       reply=reply or {'ok': 1},
+                                       **key))
+
+
+@pytest.mark.parametrize('command_name,command,expect', (
+        ('find', {'find': 'collection1', 'filter': {}}, 'find'),
+        ('getMore', {'getMore': 123, 'collection': 'collection1'}, 'getMore'),
+        ('update', {'update': 'collection1', 'updates': [{'q': {}}]}, 'update'),
+        ('update', {'update': 'collection1', 'updates': [{'q': {}}, {'q': {}}]}, 'bulk'),
+        ('aggregate', {'aggregate': 'collection1', 'pipeline': []}, 'aggregate'),
+        ('count', {'count': 'collection1', 'query': {}}, 'count'),
+))
+def test_succeeded__should_add_command_to_current_metrics_by_type(command_name, command, expect):
+    profiler = CommandProfiler()
+
+    with metrics_scope(ActionMetrics()) as metrics:
+        run_command(profiler, 1, command_name, command, 0.5)
+
+    assert metrics.commands == {expect: {'count': 1, 'time': 0.5, 'bytes': 13}}
+    (duration, _, command_type, collection_name, _), = metrics.slowest_commands
+    assert (duration, command_type, collection_name) == (0.5, expect, 'collection1')
+
+
+def test_succeeded__if_no_current_metrics__should_not_count_command():
+    profiler = CommandProfiler()
+    metrics = ActionMetrics()
+
+    run_command(profiler, 1, 'find', {'find': 'collection1'}, 0.5)
+
+    assert metrics.commands == {}
+    assert profiler._started == {}
+
+
+def test_succeeded__if_command_is_not_tracked__should_not_encode_reply():
+    profiler = CommandProfiler()
+    # Reply which could not be encoded to BSON
+    reply = {'ok': 1, 'value': object()}
+
+    profiler.succeeded(SimpleNamespace(connection_id=('localhost', 27017), request_id=1,
+                                       duration_micros=500000, reply=reply))
+    run_command(profiler, 2, 'find', {'find': 'collection1'}, 0.5, reply)
+
+
+def test_format_commands__should_show_the_slowest_commands_first(monkeypatch):
+    monkeypatch.setattr('mongoengine_migrate.metrics.SLOWEST_COMMANDS_COUNT', 2)
+    profiler = CommandProfiler()
+    report = MetricsReport('upgrade')
+
+    with report.measure('migration1', 1, 'DropField(...)', True):
+        for request_id, duration in enumerate((0.1, 0.3, 0.2)):
+            run_command(profiler, request_id, 'find',
+                        {'find': 'collection1', 'filter': {'n': request_id}}, duration)
+
+    lines = report.format_commands().splitlines()
+    assert lines[0].startswith('migration1[1] DropField(...): wall ')
+    assert lines[1] == '  find: 3 commands, 0.600s, 39 bytes replied'
+    assert lines[2:] == [
+        '  0.300s find collection1 {"filter": {"n": 1}}',
+        '  0.200s find collection1 {"filter": {"n": 2}}',
+    ]
+
+
+def allocate_memory():
+    return [bytearray(1024) for _ in range(1024)]
+
+
+@pytest.mark.parametrize('memory_top', (0, 3))
+def test_profile_action__should_write_stats_and_measure_memory_peak(
+        tmp_path, monkeypatch, memory_top
+):
+    monkeypatch.setattr(flags, 'profile_memory_top', memory_top)
+    metrics = ActionMetrics()
+    directory = tmp_path / 'profile'
+
+    with profile_action(str(directory), 'migration1.001.forward.DropField', metrics):
+        data = allocate_memory()
+
+    stats = pstats.Stats(str(directory / 'migration1.001.forward.DropField.pstats'))
+    assert any(func[2] == 'allocate_memory' for func in stats.stats)
+    assert metrics.memory_peak >= 1024 * 1024
+    memory_file = directory / 'migration1.001.forward.DropField.memory.txt'
+    if memory_top:
+        assert len(memory_file.read_text().splitlines()) == memory_top
+    else:
+        assert not memory_file.exists()
+    assert not tracemalloc.is_tracing()
+    del data
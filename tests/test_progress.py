@@ -0,0 +1,88 @@
+import json
+import logging
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.progress import ProgressReporter, get_progress_total
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+@pytest.fixture
+def progress_file(tmp_path, monkeypatch):
+    path = tmp_path / 'progress.jsonl'
+    monkeypatch.setattr(flags, 'progress_file', str(path))
+    monkeypatch.setattr(flags, 'progress_interval', 0.000001)
+
+    def read():
+        return [json.loads(line) for line in path.read_text().splitlines()]
+    return read
+
+
+def test_advance__if_interval_passed__should_report_progress(progress_file, caplog):
+    reporter = ProgressReporter('collection1', 1000)
+
+    with caplog.at_level(logging.INFO, logger='mongoengine-migrate'):
+        for _ in range(600):
+            reporter.advance()
+        reporter.finish()
+
+    records = progress_file()
+    assert [(r['done'], r['percent'], r['finished']) for r in records] == [
+        (256, 25.6, False), (512, 51.2, False), (600, 60.0, True)
+    ]
+    assert records[-1]['eta'] == 0
+    assert caplog.messages[0].startswith('Progress of collection1: 256 of 1000 documents (25.6%)')
+    assert caplog.messages[-1].startswith('Finished collection1: 600 documents in ')
+
+
+def test_finish__if_progress_was_not_logged__should_not_log(monkeypatch, caplog):
+    monkeypatch.setattr(flags, 'progress_interval', 30)
+    reporter = ProgressReporter('collection1', None)
+
+    with caplog.at_level(logging.INFO, logger='mongoengine-migrate'):
+        reporter.advance(100)
+        reporter.finish()
+
+    assert caplog.messages == []
+
+
+@pytest.mark.parametrize('progress_total,expect', (('estimated', 3), ('exact', 1)))
+def test_get_progress_total__should_count_documents_by_flag(
+        test_db, monkeypatch, progress_total, expect
+):
+    monkeypatch.setattr(flags, 'progress_total', progress_total)
+    test_db['collection1'].insert_many([{'_id': 1, 'a': 1}, {'_id': 2}, {'_id': 3}])
+
+    assert get_progress_total(test_db['collection1'], {'a': {'$exists': True}}) == expect
+
+
+@pytest.mark.parametrize('progress_total,expect', (('estimated', None), ('exact', 2)))
+def test_get_progress_total__if_resumed__should_count_remaining_ranges(
+        test_db, monkeypatch, progress_total, expect
+):
+    monkeypatch.setattr(flags, 'progress_total', progress_total)
+    test_db['collection1'].insert_many([{'_id': 1, 'a': 1}, {'_id': 2, 'a': 1}, {'_id': 3, 'a': 1},
+                                        {'_id': 4}])
+    id_filters = [{'$gt': 1, '$lte': 2}, {'$gt': 2}]
+
+    res = get_progress_total(test_db['collection1'], {'a': {'$exists': True}}, id_filters)
+
+    assert res == expect
+
+
+def test_update_by_document__should_report_scanned_documents(
+        test_db, load_fixture, progress_file
+):
+    schema = load_fixture('schema1').get_schema()
+    count = test_db['schema1_doc1'].estimated_document_count()
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    updater.update_by_document(lambda ctx: None)
+
+    record, = progress_file()
+    assert record['name'] == 'schema1_doc1'
+    assert record['finished'] is True
+    assert record['total'] == count
+    assert 0 < record['done'] <= count
@@ -0,0 +1,68 @@
+import datetime
+
+import bson
+import pytest
+from bson import Regex, Code, Int64, Decimal128, ObjectId, MinKey, MaxKey, Timestamp, Binary, DBRef
+
+from mongoengine_migrate.rawbson import (
+    iter_raw_documents,
+    index_elements,
+    decode_elements,
+    BSON_OBJECT,
+    BSON_ARRAY
+)
+
+
+@pytest.fixture
+def document():
+    return {
+        'double': 1.5,
+        'string': 'str',
+        'object': {'a': 1},
+        'array': [1, 'a', {'b': 2}],
+        'binary': Binary(b'123', 5),
+        'objectid': ObjectId('5f0000000000000000000001'),
+        'bool': True,
+        'date': datetime.datetime(2020, 1, 1),
+        'null': None,
+        'regex': Regex('a.b', 'i'),
+        'dbref': DBRef('collection1', 1),
+        'code': Code('x = 1'),
+        'code_w_scope': Code('x = y', {'y': 1}),
+        'int': 1,
+        'timestamp': Timestamp(1, 2),
+        'long': Int64(2 ** 40),
+        'decimal': Decimal128('1.1'),
+        'minkey': MinKey(),
+        'maxkey': MaxKey(),
+        'last': 'last',
+    }
+
+
+def test_iter_raw_documents__should_split_concatenated_documents():
+    docs = [{'_id': 1, 'a': 'b'}, {'_id': 2}, {'_id': 3, 'c': [1, 2]}]
+    data = b''.join(bson.encode(d) for d in docs)
+
+    res = [bson.decode(raw) for raw in iter_raw_documents(data)]
+
+    assert res == docs
+
+
+def test_index_elements__should_find_elements_of_all_types(document):
+    raw = bson.encode(document)
+
+    res = index_elements(raw, document.keys())
+
+    assert res.keys() == document.keys()
+    assert res['object'][0] == BSON_OBJECT
+    assert res['array'][0] == BSON_ARRAY
+    for name in document.keys():
+        assert decode_elements(raw, [res[name]], bson.CodecOptions()) == {name: document[name]}
+
+
+def test_index_elements__should_return_only_requested_existing_elements(document):
+    raw = bson.encode(document)
+
+    res = index_elements(raw, ['int', 'last', 'unknown'])
+
+    assert decode_elements(raw, res.values(), bson.CodecOptions()) == {'int': 1, 'last': 'last'}
@@ -0,0 +1,107 @@
+from copy import copy, deepcopy
+
+import pytest
+from dictdiffer import diff, patch
+
+from mongoengine_migrate.exceptions import SchemaError
+from mongoengine_migrate.schema import Schema
+from mongoengine_migrate.schema_patch import apply_patch, snapshot_schema
+
+
+@pytest.fixture
+def schema():
+    return Schema({
+        'Document1': Schema.Document(
+            {'field1': {'type_key': 'StringField', 'choices': ['a', 'b']},
+             'field2': {'type_key': 'IntField', 'required': False}},
+            parameters=Schema.Document.Parameters({'collection': 'document1'})
+        ),
+        'Document2': Schema.Document(
+            {'field1': {'type_key': 'IntField'}},
+            parameters=Schema.Document.Parameters({'collection': 'document2'})
+        ),
+    })
+
+
+@pytest.mark.parametrize('diff_result', (
+    [('add', 'Document1', [('field3', {'type_key': 'FloatField'})])],
+    [('remove', 'Document1', [('field2', {})])],
+    [('change', 'Document1.field2.required', (False, True))],
+    [('change', ['Document1', 'field1', 'choices', 1], ('b', 'c'))],
+    [('add', 'Document1.field1.choices', [(0, 'z')])],
+    [('remove', '', [('Document2', None)]), ('add', '', [('Document3', Schema.Document())])],
+    [('change', 'Document2', (None, Schema.Document({'field1': {'type_key': 'StringField'}})))],
+))
+def test_apply_patch__should_give_the_same_result_as_dictdiffer_patch(schema, diff_result):
+    expect = patch(diff_result, schema)
+
+    apply_patch(diff_result, schema)
+
+    assert schema == expect
+
+
+def test_apply_patch__should_not_change_previous_documents(schema):
+    original = deepcopy(schema)
+    document1 = schema['Document1']
+    document2 = schema['Document2']
+    previous = snapshot_schema(schema)
+
+    undo_log = apply_patch([
+        ('change', 'Document1.field1.choices', (['a', 'b'], ['c'])),
+        ('add', 'Document1.field1', [('max_length', 10)])
+    ], schema)
+
+    assert previous == original
+    assert undo_log.previous_schema() == original
+    assert schema['Document1'] is not document1
+    assert schema['Document1']['field2'] is document1['field2']
+    assert schema['Document2'] is document2
+    assert undo_log.changed_documents == ['Document1']
+
+
+def test_apply_patch__should_not_change_values_from_patch(schema):
+    field_schema = {'type_key': 'FloatField'}
+
+    apply_patch([('add', 'Document1', [('field3', field_schema)])], schema)
+    apply_patch([('change', 'Document1.field3.type_key', ('FloatField', 'IntField'))], schema)
+
+    assert field_schema == {'type_key': 'FloatField'}
+    assert schema['Document1']['field3'] == {'type_key': 'IntField'}
+
+
+def test_apply_patch__if_patch_failed__should_rollback_schema(schema):
+    original = deepcopy(schema)
+    diff_result = [
+        ('remove', '', [('Document2', None)]),
+        ('add', '', [('Document3', Schema.Document())]),
+        ('change', 'Document1.field1.type_key', ('StringField', 'IntField')),
+        ('remove', 'Document1', [('unknown_field', {})])
+    ]
+
+    with pytest.raises(SchemaError):
+        apply_patch(diff_result, schema)
+
+    assert schema == original
+
+
+def test_rollback__should_restore_schema(schema):
+    original = deepcopy(schema)
+    undo_log = apply_patch(list(diff(schema, Schema({'Document3': Schema.Document()}))), schema)
+
+    undo_log.rollback()
+
+    assert schema == original
+
+
+def test_document_copy__should_not_share_parameters_and_indexes():
+    document = Schema.Document({'field1': {'type_key': 'IntField'}},
+                               parameters=Schema.Document.Parameters({'collection': 'doc'}),
+                               indexes=Schema.Document.Indexes({'idx': {'fields': [('a', 1)]}}))
+
+    res = copy(document)
+    res.parameters['collection'] = 'doc2'
+    res.indexes.pop('idx')
+
+    assert document.parameters == {'collection': 'doc'}
+    assert document.indexes == {'idx': {'fields': [('a', 1)]}}
+    assert res['field1'] is document['field1']
@@ -0,0 +1,135 @@
+import itertools
+
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.exceptions import MigrationError
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.secondary import (
+    get_read_collection,
+    get_write_conditions,
+    is_update_applied
+)
+from mongoengine_migrate.updater import DocumentUpdater
+
+
+def test_get_read_collection__if_flag_not_set__should_return_collection_as_is(test_db):
+    collection = test_db['collection1']
+
+    assert get_read_collection(collection) is collection
+
+
+@pytest.mark.parametrize('max_staleness,expect', ((0, -1), (120, 120)))
+def test_get_read_collection__if_flag_set__should_read_from_secondaries(
+        test_db, monkeypatch, max_staleness, expect
+):
+    monkeypatch.setattr(flags, 'secondary_reads', True)
+    monkeypatch.setattr(flags, 'max_staleness', max_staleness)
+
+    res = get_read_collection(test_db['collection1'])
+
+    assert res.read_preference == SecondaryPreferred(max_staleness=expect)
+    assert test_db['collection1'].read_preference == Primary()
+
+
+@pytest.mark.parametrize('update,expect', (
+        ({'$set': {'a.b': 2, 'c': 3}}, {'a': {'$eq': {'b': 1}}, 'c': {'$exists': False}}),
+        ({'$unset': {'d': ''}}, {'d': {'$eq': [1]}}),
+        (None, {'a': {'$eq': {'b': 1}}, 'd': {'$eq': [1]}}),
+))
+def test_get_write_conditions__should_return_original_values_of_changed_root_fields(
+        update, expect
+):
+    original = {'_id': 1, 'a': {'b': 1}, 'd': [1]}
+
+    assert get_write_conditions(original, update) == expect
+
+
+@pytest.mark.parametrize('update,expect', (
+        ({'$set': {'a.b': 2}}, {'a.b': {'$eq': 1}, 'a.c': {'$exists': False}}),
+        ({'$set': {'d.0.e': 2}}, {}),
+        (None, {'a.b': {'$eq': 1}, 'a.c': {'$exists': False}}),
+))
+def test_get_write_conditions__if_projection_set__should_check_projected_paths(update, expect):
+    original = {'_id': 1, 'a': {'b': 1}, 'd': [{'e': 1}]}
+    projection = {'_id': True, 'a.b': True, 'a.c': True, 'd.e': True}
+
+    assert get_write_conditions(original, update, projection) == expect
+
+
+@pytest.mark.parametrize('document,expect', (
+        ({'a': {'b': 2}, 'c': [0, 3]}, True),
+        ({'a': {'b': 2}, 'c': [0, 3], 'd': 1}, False),
+        ({'a': {'b': 1}, 'c': [0, 3]}, False),
+        ({'a': {'b': 2}, 'c': [0]}, False),
+))
+def test_is_update_applied__should_compare_set_and_unset_paths(document, expect):
+    update = {'$set': {'a.b': 2, 'c.1': 3}, '$unset': {'d': ''}}
+
+    assert is_update_applied(document, update) is expect
+
+
+def test_update_by_document__if_document_changed_after_read__should_process_it_again(
+        test_db, load_fixture, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'secondary_reads', True)
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+    changed_id = collection.find_one({'doc1_int': {'$type': 'int'}})['_id']
+    expect = dump_db()
+    for doc in expect['schema1_doc1']:
+        if doc['_id'] == changed_id:
+            doc['doc1_int'] = 101
+        elif 'doc1_int' in doc:
+            doc['doc1_int'] += 1
+
+    def callback(ctx):
+        if ctx.document['_id'] == changed_id and not calls:
+            collection.update_one({'_id': changed_id}, {'$set': {'doc1_int': 100}})
+            calls.append(ctx.document['_id'])
+        ctx.document['doc1_int'] += 1
+
+    calls = []
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_int', MigrationPolicy.strict)
+    updater.update_by_document(callback)
+
+    assert dump_db() == expect
+
+
+def test_update_by_document__if_document_is_always_changed__should_raise_error(
+        test_db, load_fixture, monkeypatch
+):
+    monkeypatch.setattr(flags, 'secondary_reads', True)
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+
+    def callback(ctx):
+        collection.update_one({'_id': ctx.document['_id']}, {'$inc': {'doc1_int': 10}})
+        ctx.document['doc1_int'] += 1
+
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_int', MigrationPolicy.strict)
+    with pytest.raises(MigrationError):
+        updater.update_by_document(callback)
+
+
+def test_update_by_document__if_embedded_document_projected__should_write_changes(
+        test_db, load_fixture, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'secondary_reads', True)
+    schema = load_fixture('schema1').get_schema()
+    expect = dump_db()
+    parsers = load_fixture('schema1').get_embedded_jsonpath_parsers('~Schema1EmbDoc1')
+    for doc in itertools.chain.from_iterable(p.find(expect) for p in parsers):
+        if isinstance(doc.value.get('embdoc1_str'), str):
+            doc.value['embdoc1_str'] += '!'
+
+    def callback(ctx):
+        if isinstance(ctx.document.get('embdoc1_str'), str):
+            ctx.document['embdoc1_str'] += '!'
+
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc1', schema, 'embdoc1_str',
+                              MigrationPolicy.strict)
+    updater.update_by_document(callback)
+
+    assert dump_db() == expect
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import pytest
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.actions import CreateDocument, CreateField
+from mongoengine_migrate.graph import Migration
+from mongoengine_migrate.loader import MongoengineMigrate
+from mongoengine_migrate.schema import Schema
+from mongoengine_migrate.snapshots import SchemaSnapshots
+
+
+@pytest.fixture
+def migrations(tmp_path):
+    res = []
+    for i in range(1, 7):
+        path = tmp_path / f'000{i}_migration.py'
+        path.write_text(f'dependencies = []  # {i}\n')
+        res.append(Migration(name=path.stem, dependencies=[], path=str(path)))
+    return res
+
+
+def make_schema(i):
+    return Schema({f'Document{i}': Schema.Document()})
+
+
+def test_save__should_write_snapshots_by_interval(test_db, migrations):
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+
+    written = [snapshots.save(i, make_schema(i), 2) for i in range(1, 7)]
+
+    assert written == [False, True, False, True, False, True]
+    records = test_db['migrations'].find({'type': 'schema_snapshot'}, {'_id': False})
+    assert sorted(r['migration'] for r in records) == [
+        '0002_migration', '0004_migration', '0006_migration'
+    ]
+
+
+def test_save__if_dry_run__should_not_write_snapshot(test_db, migrations, monkeypatch):
+    monkeypatch.setattr(flags, 'dry_run', True)
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+
+    assert snapshots.save(2, make_schema(2), 2) is False
+    assert test_db['migrations'].count_documents({}) == 0
+
+
+@pytest.mark.parametrize('stop,expect', ((None, 6), (5, 4), (3, 2), (1, 0)))
+def test_find__should_return_the_latest_snapshot_before_stop(test_db, migrations, stop, expect):
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+    for i in range(1, 7):
+        snapshots.save(i, make_schema(i), 2)
+
+    position, schema = SchemaSnapshots(test_db['migrations'], migrations).find(stop)
+
+    assert position == expect
+    assert schema == (make_schema(expect) if expect else None)
+
+
+def test_find__if_migration_file_changed__should_skip_snapshots_after_it(test_db, migrations):
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+    for i in range(1, 7):
+        snapshots.save(i, make_schema(i), 2)
+
+    with open(migrations[2].path, 'a') as f:
+        f.write('# changed\n')
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+
+    assert snapshots.find()[0] == 2
+    assert snapshots.save(4, make_schema(4), 2) is True
+    # Snapshot with outdated key is replaced
+    assert test_db['migrations'].count_documents({'migration': '0004_migration'}) == 1
+
+
+def test_clear__should_remove_all_snapshots(test_db, migrations):
+    snapshots = SchemaSnapshots(test_db['migrations'], migrations)
+    snapshots.save(2, make_schema(2), 2)
+
+    snapshots.clear()
+
+    assert snapshots.find() == (0, None)
+    assert test_db['migrations'].count_documents({}) == 0
+
+
+def test_replay_migration__should_patch_schema_and_return_patches():
+    actions = [
+        CreateDocument('Document1', collection='document1'),
+        CreateField('Document1', 'field1', type_key='StringField', db_field='field1')
+    ]
+    migration = Migration(name='0001_migration', dependencies=[],
+                          module=SimpleNamespace(actions=actions))
+    schema = Schema()
+
+    diffs = MongoengineMigrate._replay_migration(migration, schema)
+
+    assert len(diffs) == 2
+    assert diffs[0] == actions[0].to_schema_patch(Schema())
+    assert list(schema.keys()) == ['Document1']
+    assert schema['Document1'].parameters == {'collection': 'document1'}
+    assert schema['Document1']['field1']['db_field'] == 'field1'
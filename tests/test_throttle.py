@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from mongoengine_migrate import throttle as throttle_module
+from mongoengine_migrate.throttle import ReplicationThrottle, throttle_scope, wait_for_replication
+
+
+class FakeClient:
+    """Client which returns replica set statuses with given lags"""
+    def __init__(self, *lags):
+        self.lags = list(lags)
+        self.admin = SimpleNamespace(command=self.command)
+        self.calls = 0
+
+    def command(self, name):
+        assert name == 'replSetGetStatus'
+        self.calls += 1
+        now = datetime(2020, 1, 1)
+        lag = self.lags.pop(0) if len(self.lags) > 1 else self.lags[0]
+        return {'members': [
+            {'state': 1, 'health': 1, 'optimeDate': now},
+            {'state': 2, 'health': 1, 'optimeDate': now - timedelta(seconds=lag)},
+            {'state': 2, 'health': 0, 'optimeDate': now - timedelta(seconds=1000)},
+        ]}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    res = []
+    monkeypatch.setattr(throttle_module.time, 'sleep', res.append)
+    return res
+
+
+def test_get_lag__should_return_lag_of_the_most_lagging_healthy_secondary():
+    throttle = ReplicationThrottle(FakeClient(3), 10, 1)
+
+    assert throttle.get_lag() == 3
+
+
+def test_get_lag__if_server_is_not_replica_set__should_disable_throttling():
+    def command(name):
+        raise OperationFailure('not running with --replSet', code=76)
+
+    client = SimpleNamespace(admin=SimpleNamespace(command=command))
+    throttle = ReplicationThrottle(client, 10, 1)
+
+    assert throttle.get_lag() is None
+    assert throttle.enabled is False
+
+
+def test_wait__if_lag_exceeds_max__should_pause_until_it_drops(sleeps):
+    client = FakeClient(30, 20, 1)
+    throttle = ReplicationThrottle(client, 10, 1)
+
+    throttle.wait(100)
+
+    assert sleeps == [1, 1]
+    assert throttle.lag == 1
+
+
+def test_wait__if_lag_exceeds_half_of_max__should_slow_down(sleeps):
+    throttle = ReplicationThrottle(FakeClient(7.5), 10, 2)
+
+    throttle.wait(100)
+
+    assert sleeps == [pytest.approx(2 * 2.5 / 5)]
+
+
+def test_wait__if_poll_interval_has_not_passed__should_not_poll_status(sleeps):
+    client = FakeClient(0)
+    throttle = ReplicationThrottle(client, 10, 60)
+
+    throttle.wait(1)
+    throttle.wait(1)
+
+    assert client.calls == 1
+
+
+def test_wait_for_replication__should_report_to_current_throttle():
+    client = FakeClient(0)
+
+    wait_for_replication(10)
+    with throttle_scope(ReplicationThrottle(client, 10, 1)):
+        wait_for_replication(10)
+
+    assert client.calls == 1
+
+
+def test_wait__if_connected_to_real_server__should_not_block(test_db):
+    # Passes against standalone server (throttling gets disabled) and
+    # against single-node or several nodes replica set
+    throttle = ReplicationThrottle(test_db.client, 10, 0)
+
+    throttle.wait(1)
+
+    assert throttle.lag <= 10
@@ -0,0 +1,123 @@
+import pytest
+
+from mongoengine_migrate.tracking import (
+    track_changes,
+    get_changed_paths,
+    get_update_operators,
+    ObservedDict,
+    ObservedList
+)
+
+
+@pytest.fixture
+def document():
+    return {
+        '_id': 1,
+        'a': 1,
+        'b': {'c': 'x', 'd': 2},
+        'e': [1, 2],
+        'f': [{'g': 1}, {'g': 2}],
+        'h': 1,
+    }
+
+
+def test_track_changes__if_nothing_changed__should_return_empty_update(document):
+    doc = track_changes(document)
+
+    assert doc['b']['c'] == 'x'
+    assert [x['g'] for x in doc['f']] == [1, 2]
+    doc['a'] = 1
+    doc['b'].setdefault('c', 'y')
+
+    assert get_changed_paths(doc) == set()
+    assert get_update_operators(doc) == {}
+
+
+def test_track_changes__should_set_and_unset_changed_paths_only(document):
+    doc = track_changes(document)
+
+    doc['a'] = 1.0
+    doc['b']['c'] = 'y'
+    del doc['b']['d']
+    doc['e'][1] = 3
+    doc['f'][0]['g'] = 3
+    doc['f'][1].pop('g')
+    del doc['h']
+    doc['i'] = None
+
+    assert get_update_operators(doc) == {
+        '$set': {'a': 1.0, 'b.c': 'y', 'e.1': 3, 'f.0.g': 3, 'i': None},
+        '$unset': {'b.d': '', 'f.1.g': '', 'h': ''}
+    }
+
+
+def test_track_changes__if_list_length_changed__should_set_whole_list(document):
+    doc = track_changes(document)
+
+    doc['f'][0]['g'] = 3
+    doc['f'].append({'g': 4})
+
+    assert get_update_operators(doc) == {'$set': {'f': [{'g': 3}, {'g': 2}, {'g': 4}]}}
+
+
+def test_track_changes__if_changed_value_replaced__should_set_new_value_only(document):
+    doc = track_changes(document)
+
+    b = doc['b']
+    doc['b'] = 1
+    b['c'] = 'y'
+
+    assert get_changed_paths(doc) == {('b', )}
+    assert get_update_operators(doc) == {'$set': {'b': 1}}
+
+
+def test_track_changes__if_document_cleared_and_filled__should_write_all_keys(document):
+    doc = track_changes(document)
+    embedded = doc['b']
+
+    newdoc = {k: v for k, v in embedded.items() if k != 'd'}
+    embedded.clear()
+    embedded.update(newdoc)
+
+    assert get_update_operators(doc) == {'$set': {'b.c': 'x'}, '$unset': {'b.d': ''}}
+
+
+def test_track_changes__if_embedded_key_is_not_addressable__should_set_parent():
+    doc = track_changes({'_id': 1, 'a': {'b.c': 1}})
+
+    doc['a']['b.c'] = 2
+
+    assert get_update_operators(doc) == {'$set': {'a': {'b.c': 2}}}
+
+
+def test_track_changes__if_root_key_is_not_addressable__should_return_none():
+    doc = track_changes({'_id': 1, '$a': 1})
+
+    doc['$a'] = 2
+
+    assert get_update_operators(doc) is None
+
+
+def test_track_changes__should_keep_containers_types(document):
+    doc = track_changes(document)
+
+    assert isinstance(doc['b'], dict) and isinstance(doc['b'], ObservedDict)
+    assert isinstance(doc['e'], list) and isinstance(doc['e'], ObservedList)
+    assert doc == document
+
+
+def test_track_changes__should_not_copy_untouched_values():
+    document = {
+        '_id': 1,
+        **{f'field{i}': {'a': i, 'b': [i, str(i), {'c': i}]} for i in range(50)},
+        'target': {'value': 1}
+    }
+
+    doc = track_changes(document)
+    doc['target']['value'] = 2
+
+    assert get_update_operators(doc) == {'$set': {'target.value': 2}}
+    # Only containers which were accessed are wrapped
+    untouched = [key for key in document if key != 'target']
+    assert all(dict.__getitem__(doc, key) is document[key] for key in untouched)
+    assert document['target'] == {'value': 1}
@@ -0,0 +1,298 @@
+import itertools
+import os
+from copy import deepcopy
+from unittest import mock
+
+import pytest
+from pymongo import MongoClient
+
+from mongoengine_migrate import flags
+from mongoengine_migrate.docpath import compile_path
+from mongoengine_migrate.fields import converters
+from mongoengine_migrate.graph import MigrationPolicy
+from mongoengine_migrate.metrics import ActionMetrics, metrics_scope
+from mongoengine_migrate.mongo import type_filter_except
+from mongoengine_migrate.updater import (
+    DocumentUpdater,
+    split_id_ranges,
+    DocumentScan,
+    _process_scan_state,
+    _scan_in_process
+)
+
+
+@pytest.mark.parametrize('count', (1, 2, 3, 7))
+def test_split_id_ranges__should_cover_all_documents_without_intersections(test_db, count):
+    test_db['collection1'].insert_many([{'_id': n} for n in range(100)])
+
+    ranges = split_id_ranges(test_db['collection1'], count)
+
+    assert 1 <= len(ranges) <= count
+    found = [
+        [d['_id'] for d in test_db['collection1'].find({'_id': r} if r else {})]
+        for r in ranges
+    ]
+    assert sorted(itertools.chain.from_iterable(found)) == list(range(100))
+
+
+def test_split_id_ranges__if_collection_is_empty__should_return_one_range(test_db):
+    assert split_id_ranges(test_db['collection1'], 4) == [None]
+
+
+@pytest.mark.parametrize('document_type,field_name', (
+        ('Schema1Doc1', 'doc1_str'),
+        ('~Schema1EmbDoc1', 'embdoc1_str'),
+        ('~Schema1EmbDoc2', 'embdoc2_str'),
+))
+def test_update_by_document__if_parallel_workers_set__should_process_all_documents(
+        test_db, load_fixture, document_type, field_name, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'parallel_workers', 3)
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, field_name, MigrationPolicy.strict)
+
+    expect = dump_db()
+    parsers = load_fixture('schema1').get_embedded_jsonpath_parsers(document_type)
+    for doc in itertools.chain.from_iterable(p.find(expect) for p in parsers):
+        doc.value[field_name] = [doc.value[field_name]]
+
+    converters.item_to_list(updater)
+
+    assert dump_db() == expect
+
+
+
+def test_update_by_document__if_process_executor_set__should_scan_all_documents(
+        test_db, load_fixture, monkeypatch
+):
+    monkeypatch.setattr(flags, 'parallel_workers', 3)
+    monkeypatch.setattr(flags, 'parallel_executor', 'process')
+    monkeypatch.setattr(flags, 'mongo_uri', os.environ['DATABASE_URL'])
+    schema = load_fixture('schema1').get_schema()
+    collection = test_db['schema1_doc1']
+    collection.insert_many([{'doc1_str': str(n)} for n in range(20)])
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    # Workers memory is not shared, metrics are the only thing passed back
+    with metrics_scope(ActionMetrics()) as metrics:
+        updater.update_by_document(lambda ctx: ctx.document.update(doc1_str='new value'))
+
+    assert metrics.totals['documents_scanned'] == collection.count_documents({})
+
+
+def test_scan_in_process__should_close_its_clients(test_db, load_fixture, monkeypatch):
+    monkeypatch.setattr(flags, 'mongo_uri', os.environ['DATABASE_URL'])
+    database2 = flags.database2
+    clients = []
+
+    def client_factory(*args, **kwargs):
+        clients.append(mock.Mock(wraps=MongoClient(*args, **kwargs)))
+        return clients[-1]
+
+    monkeypatch.setattr('mongoengine_migrate.updater.MongoClient', client_factory)
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+    scan = DocumentScan(callback=lambda ctx: None,
+                        collection=test_db['schema1_doc1'],
+                        find_fltr={},
+                        projection=None,
+                        update_path=(),
+                        walker=compile_path(()),
+                        filter_dotpath='')
+    _process_scan_state.update(updater=updater, scans=[scan])
+    try:
+        _scan_in_process(0)
+    finally:
+        _process_scan_state.clear()
+
+    assert len(clients) == 2
+    assert all(client.close.called for client in clients)
+    assert flags.database2 is database2
+
+
+@pytest.mark.parametrize('document_type,field_name', (
+        ('Schema1Doc1', 'doc1_str'),
+        ('~Schema1EmbDoc1', 'embdoc1_str'),
+        ('~Schema1EmbDoc2', 'embdoc2_str'),
+))
+def test_update_by_document__if_value_filter_set__should_skip_documents_not_matched(
+        test_db, load_fixture, document_type, field_name
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, field_name, MigrationPolicy.strict)
+    calls = []
+
+    updater.update_by_document(lambda ctx: calls.append(ctx), type_filter_except('string', 'null'))
+
+    assert calls == []
+
+
+def test_update_by_document__if_root_key_is_not_addressable__should_replace_whole_document(
+        test_db, load_fixture, dump_db
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, 'Schema1Doc1', schema, 'doc1_str', MigrationPolicy.strict)
+
+    expect = dump_db()
+    for doc in expect['schema1_doc1']:
+        if 'doc1_str' in doc:
+            doc['doc1.str'] = doc.pop('doc1_str')
+
+    def callback(ctx):
+        ctx.document['doc1.str'] = ctx.document.pop('doc1_str')
+
+    updater.update_by_document(callback)
+
+    assert dump_db() == expect
+
+
+@pytest.mark.parametrize('document_type,field_name', (
+        ('Schema1Doc1', 'doc1_str'),
+        ('~Schema1EmbDoc1', 'embdoc1_str'),
+        ('~Schema1EmbDoc2', 'embdoc2_str'),
+))
+def test_update_by_document__if_pipeline_set__should_process_all_documents(
+        test_db, load_fixture, document_type, field_name, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'pipeline', True)
+    monkeypatch.setattr(flags, 'PIPELINE_BATCH_SIZE', 2)
+    monkeypatch.setattr(flags, 'bulk_buffer_length', 2)
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, field_name, MigrationPolicy.strict)
+
+    expect = dump_db()
+    parsers = load_fixture('schema1').get_embedded_jsonpath_parsers(document_type)
+    for doc in itertools.chain.from_iterable(p.find(expect) for p in parsers):
+        doc.value[field_name] = [doc.value[field_name]]
+
+    converters.item_to_list(updater)
+
+    assert dump_db() == expect
+
+
+@pytest.mark.parametrize('document_type,field_name', (
+        ('Schema1Doc1', 'doc1_str'),
+        ('~Schema1EmbDoc1', 'embdoc1_str'),
+        ('~Schema1EmbDoc2', 'embdoc2_str'),
+))
+def test_update_by_document__if_raw_scan_set__should_process_all_documents(
+        test_db, load_fixture, document_type, field_name, dump_db, monkeypatch
+):
+    monkeypatch.setattr(flags, 'raw_scan', True)
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, field_name, MigrationPolicy.strict)
+
+    expect = dump_db()
+    parsers = load_fixture('schema1').get_embedded_jsonpath_parsers(document_type)
+    for doc in itertools.chain.from_iterable(p.find(expect) for p in parsers):
+        doc.value[field_name] = [doc.value[field_name]]
+
+    converters.item_to_list(updater)
+
+    assert dump_db() == expect
+
+
+@pytest.mark.parametrize('document_type,field_name', (
+        ('Schema1Doc1', 'doc1_str'),
+        ('~Schema1EmbDoc1', 'embdoc1_str'),
+        ('~Schema1EmbDoc2', 'embdoc2_str'),
+))
+def test_update_by_pipeline__should_update_every_document(
+        test_db, load_fixture, document_type, field_name, dump_db
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, field_name, MigrationPolicy.strict)
+
+    expect = dump_db()
+    parsers = load_fixture('schema1').get_embedded_jsonpath_parsers(document_type)
+    for doc in itertools.chain.from_iterable(p.find(expect) for p in parsers):
+        if field_name in doc.value:
+            doc.value['new_name'] = doc.value.pop(field_name)
+
+    def by_pipeline(ctx):
+        return {'new_name': ctx.value, field_name: '$$REMOVE'}
+
+    def by_doc(ctx):
+        raise AssertionError('Should not be called')
+
+    updater.update_by_pipeline(by_pipeline, by_doc)
+
+    assert dump_db() == expect
+
+
+def test_update_by_pipeline__if_mongo_version_is_less_than_4_2__should_call_by_doc_callback(
+        test_db, load_fixture, monkeypatch
+):
+    monkeypatch.setattr(flags, 'mongo_version', '4.0')
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc1', schema, 'embdoc1_str',
+                              MigrationPolicy.strict)
+    calls = []
+
+    def by_pipeline(ctx):
+        raise AssertionError('Should not be called')
+
+    updater.update_by_pipeline(by_pipeline, lambda ctx: calls.append(ctx))
+
+    assert calls
+
+
+@pytest.mark.parametrize('document_type', ('~Schema1EmbDoc1', '~Schema1EmbDoc2'))
+def test_get_embedded_paths__should_return_the_same_paths_as_probing_by_queries(
+        test_db, load_fixture, document_type, monkeypatch
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, document_type, schema, '', MigrationPolicy.strict)
+
+    paths = [(c.name, u, f) for c, u, f in updater._get_embedded_paths()]
+    monkeypatch.setattr(flags, 'mongo_version', '3.4')
+    expect = [(c.name, u, f) for c, u, f in updater._get_embedded_paths()]
+
+    assert expect
+    assert sorted(paths) == sorted(expect)
+
+
+def test_get_embedded_paths__if_derived_documents_share_collection__should_search_it_once(
+        test_db, load_fixture, monkeypatch
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc2', schema, '', MigrationPolicy.strict)
+    expect = [(c.name, u, f) for c, u, f in updater._get_embedded_paths()]
+    derived_schema = deepcopy(schema)
+    for name in ('Schema1Doc1->Derived1', 'Schema1Doc1->Derived2'):
+        derived_schema[name] = deepcopy(schema['Schema1Doc1'])
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc2', derived_schema, '',
+                              MigrationPolicy.strict)
+    calls = []
+    get_embedded_shapes = DocumentUpdater._get_embedded_shapes
+
+    def spy(self, collection, *args, **kwargs):
+        calls.append(collection.name)
+        return get_embedded_shapes(self, collection, *args, **kwargs)
+
+    monkeypatch.setattr(DocumentUpdater, '_get_embedded_shapes', spy)
+
+    paths = [(c.name, u, f) for c, u, f in updater._get_embedded_paths()]
+
+    assert expect
+    assert paths == expect
+    assert calls.count('schema1_doc1') == 1
+
+
+def test_get_embedded_paths__if_field_contains_objects_and_arrays__should_return_both_paths(
+        test_db, load_fixture
+):
+    schema = load_fixture('schema1').get_schema()
+    updater = DocumentUpdater(test_db, '~Schema1EmbDoc2', schema, '', MigrationPolicy.strict)
+    test_db['schema1_doc1'].delete_many({})
+    test_db['schema1_doc1'].insert_many([
+        {'doc1_emb_embdoc1': {'embdoc1_emb_embdoc2': [{'embdoc2_int': 1}]}},
+        {'doc1_emb_embdoc1': [{'embdoc1_emb_embdoc2': {'embdoc2_int': 2}}]},
+    ])
+
+    paths = [u for c, u, f in updater._get_embedded_paths()]
+
+    assert sorted(paths) == [
+        ['doc1_emb_embdoc1', '$[]', 'embdoc1_emb_embdoc2'],
+        ['doc1_emb_embdoc1', 'embdoc1_emb_embdoc2', '$[]'],
+    ]
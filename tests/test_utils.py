@@ -1,5 +1,5 @@
 import pytest
-from mongoengine_migrate.utils import Slotinit
+from mongoengine_migrate.utils import Slotinit, parse_version
 
 
 class SlotinitStub(Slotinit):
@@ -115,3 +115,17 @@ class TestSlotinit:
         assert not obj2 == obj1
         assert obj1 != obj2
         assert obj2 != obj1
+
+
+@pytest.mark.parametrize('version,expect', (
+    ('4.2', (4, 2)),
+    ('4.2.1', (4, 2, 1)),
+    ('10.0.0-rc1', (10, 0, 0)),
+    ('3.6.23', (3, 6, 23)),
+))
+def test_parse_version__should_return_tuple_of_numbers(version, expect):
+    assert parse_version(version) == expect
+
+
+def test_parse_version__should_compare_versions_as_numbers():
+    assert parse_version('10.0') > parse_version('4.2')